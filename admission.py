@@ -0,0 +1,258 @@
+import os
+import json
+import time
+import threading
+import contextlib
+from collections import Counter, deque
+
+import pandas as pd
+
+import metrics
+import short_ids
+import utils
+
+
+# Render cost model: predicted seconds and output bytes of a job, per
+# (output format, style, symbology), as
+#   seconds = labels * (per_label + per_char * symbol chars) + extra copies * per_copy
+# and the same for bytes. Symbol length matters because long IDs need larger
+# QR versions. `python benchmark.py --calibrate` measures the coefficients on
+# the machine it runs on and writes them to LABELS_COST_MODEL; without that
+# file the defaults below (measured on a single-core reference machine) apply.
+MODEL_PATH = os.environ.get('LABELS_COST_MODEL', 'cost_model.json')
+
+# "format/style/symbology" -> (seconds per label, seconds per label per symbol
+# char, bytes per label, bytes per label per symbol char); "copy" -> (seconds,
+# bytes) of each extra copy of a label (one more page, nothing drawn)
+DEFAULT_MODEL = {
+    "pdf/qr/qr": (0.0149278, 0.0, 3134.3, 0.0),
+    "pdf/qr/datamatrix": (0.0034409, 0.0, 2110.8, 2.56),
+    "pdf/biomass/code128": (0.0008533, 0.0, 728.4, 0.0),
+    "pdf/biomass/qr": (0.0033738, 0.00022196, 1180.2, 23.46),
+    "pdf/biomass/datamatrix": (0.0009197, 8.032e-05, 663.6, 32.74),
+    "pdf/line/qr": (0.0053166, 0.0, 1340.1, 0.0),
+    "pdf/line/datamatrix": (0.0014742, 0.0, 792.8, 0.0),
+    "zpl/qr/qr": (0.0002038, 0.0, 286.5, 1.5),
+    "zpl/biomass/code128": (0.000276, 0.0, 276.0, 0.0),
+    "zpl/line/qr": (0.0002913, 0.0, 230.0, 0.0),
+    "tiff/biomass/code128": (0.0044292, 0.0, 2215.2, 0.0),
+    "png/line/qr": (0.0063183, 0.0, 2316.9, 0.0),
+    "copy": (0.0001905, 229.3),
+}
+# Per label for a combination that was never calibrated
+FALLBACK_COST = (0.02, 0.0, 3000.0, 0.0)
+# Symbol length of registry short codes
+SHORT_CODE_CHARS = 8
+
+# Admission control. Jobs predicted to take longer than MAX_JOB_SECONDS (or
+# produce more than MAX_JOB_MB) are refused; each client may have at most
+# MAX_JOBS_PER_CLIENT jobs running or queued; at most MAX_RENDERS jobs render
+# at once, later ones wait in order for up to QUEUE_TIMEOUT seconds (no more
+# than MAX_QUEUED of them). Jobs under SMALL_JOB_SECONDS skip the queue, so a
+# short sheet never waits behind a huge one. 0 disables a limit.
+MAX_JOB_SECONDS = float(os.environ.get('LABELS_MAX_JOB_SECONDS', '600'))
+MAX_JOB_BYTES = float(os.environ.get('LABELS_MAX_JOB_MB', '1024')) * 1024 * 1024
+MAX_JOBS_PER_CLIENT = int(os.environ.get('LABELS_MAX_JOBS_PER_CLIENT', '2'))
+MAX_RENDERS = int(os.environ.get('LABELS_MAX_RENDERS', '0')) or max(int(os.environ.get('LABELS_RENDER_WORKERS', '0')), 1)
+MAX_QUEUED = int(os.environ.get('LABELS_MAX_QUEUED', '16'))
+QUEUE_TIMEOUT = float(os.environ.get('LABELS_QUEUE_TIMEOUT', '120'))
+SMALL_JOB_SECONDS = float(os.environ.get('LABELS_SMALL_JOB_SECONDS', '2'))
+# Proxies in front of the app that append the client address to
+# X-Forwarded-For (Render's load balancer is one). Only those entries are
+# trusted: the ones before them are whatever the client sent.
+TRUSTED_PROXIES = int(os.environ.get('LABELS_TRUSTED_PROXIES', '1' if os.environ.get('RENDER') else '0'))
+
+_model = None
+_model_lock = threading.Lock()
+
+_condition = threading.Condition()
+_queue = deque()
+_running = 0
+_per_client = Counter()
+
+
+class Rejected(Exception):
+    """A job refused by admission control; the message is meant for the user"""
+
+
+def model_key(label_options):
+    """Cost model key of a job's label options, e.g. "pdf/biomass/code128" """
+    return "/".join((label_options.get("output_format") or "pdf", label_options["style"],
+                     utils.label_symbology(label_options)))
+
+
+def load_model(path=None):
+    """Calibrated coefficients from `path` (default LABELS_COST_MODEL) over the defaults"""
+    model = dict(DEFAULT_MODEL)
+    try:
+        with open(path or MODEL_PATH) as f:
+            model.update({key: tuple(value) for key, value in json.load(f)["model"].items()})
+    except FileNotFoundError:
+        pass
+    except (OSError, ValueError, KeyError, TypeError) as e:
+        print(f"Ignoring cost model {path or MODEL_PATH}: {str(e)}")
+    return model
+
+
+def _get_model():
+    global _model
+    with _model_lock:
+        if _model is None:
+            _model = load_model()
+        return _model
+
+
+def _coefficients(key):
+    model = _get_model()
+    if key in model:
+        return model[key]
+    # Another symbology of the same format and style, else the PDF cost
+    output_format, style, symbology = key.split("/")
+    similar = [value for other, value in model.items() if other.startswith(f"{output_format}/{style}/")]
+    if similar:
+        return max(similar)
+    return model.get(f"pdf/{style}/{symbology}", FALLBACK_COST)
+
+
+def symbol_chars(df, label_options):
+    """Mean length of the text encoded in each label's symbol"""
+    if label_options.get("short_ids"):
+        return SHORT_CODE_CHARS
+    column = short_ids.encoded_column(df, label_options["style"])
+    if column not in df.columns or df.empty:
+        return 0.0
+    return float(short_ids.encoded_values(df, label_options["style"]).str.len().mean())
+
+
+def page_counts(df):
+    """(labels printed by rows with their own copies value, rows that use the Copies option)"""
+    if utils.COPIES_COLUMN not in df.columns:
+        return 0, len(df)
+    values = pd.to_numeric(df[utils.COPIES_COLUMN], errors="coerce")
+    valid = values.notna() & (values.abs() != float("inf"))
+    return int(values[valid].astype(int).clip(1, utils.MAX_COPIES).sum()), int((~valid).sum())
+
+
+def page_count(df, copies=1):
+    """Labels printed including copies, as utils.label_rows counts them"""
+    fixed, default_rows = page_counts(df)
+    return fixed + default_rows * utils.parse_copies(copies)
+
+
+def estimate(df, label_options):
+    """Predicted {"labels", "pages", "symbol_chars", "seconds", "bytes"} of rendering `df`"""
+    return estimate_counts(len(df), page_count(df, label_options.get("copies", 1)),
+                           symbol_chars(df, label_options), label_options)
+
+
+def estimate_counts(labels, pages, chars, label_options):
+    """estimate() from label and page counts and the mean symbol length"""
+    per_label, per_char, bytes_per_label, bytes_per_char = _coefficients(model_key(label_options))
+    copy_seconds, copy_bytes = _get_model()["copy"]
+    extra = max(pages - labels, 0)
+    return {
+        "labels": labels,
+        "pages": pages,
+        "symbol_chars": round(chars, 1),
+        "seconds": labels * (per_label + per_char * chars) + extra * copy_seconds,
+        "bytes": labels * (bytes_per_label + bytes_per_char * chars) + extra * copy_bytes,
+    }
+
+
+def over_budget(cost):
+    """Why a job exceeds the per-job budget, or None"""
+    if MAX_JOB_SECONDS and cost["seconds"] > MAX_JOB_SECONDS:
+        return (f"This job would take about {describe_seconds(cost['seconds'])} to render, over the "
+                f"{describe_seconds(MAX_JOB_SECONDS)} limit. Split the sheet into smaller files.")
+    if MAX_JOB_BYTES and cost["bytes"] > MAX_JOB_BYTES:
+        return (f"This job would produce about {describe_bytes(cost['bytes'])}, over the "
+                f"{describe_bytes(MAX_JOB_BYTES)} limit. Split the sheet into smaller files.")
+    return None
+
+
+def describe_seconds(seconds):
+    if seconds < 1:
+        return "under a second"
+    if seconds < 90:
+        return f"{seconds:.0f} s"
+    return f"{seconds / 60:.0f} min"
+
+
+def describe_bytes(num_bytes):
+    if num_bytes < 1024 * 1024:
+        return f"{num_bytes / 1024:.0f} KB"
+    return f"{num_bytes / 1024 / 1024:,.1f} MB"
+
+
+def client_id():
+    """Who a job counts against: the address the outermost trusted proxy saw, else the peer
+    address (the same entry werkzeug's ProxyFix(x_for=TRUSTED_PROXIES) would pick)"""
+    import flask
+    if not flask.has_request_context():
+        return "local"
+    if TRUSTED_PROXIES:
+        hops = [hop.strip() for hop in flask.request.headers.get("X-Forwarded-For", "").split(",")]
+        hops = [hop for hop in hops if hop]
+        if len(hops) >= TRUSTED_PROXIES:
+            return hops[-TRUSTED_PROXIES]
+    return flask.request.remote_addr or "unknown"
+
+
+def _reject(reason, message):
+    metrics.record_admission("rejected", reason=reason)
+    raise Rejected(message)
+
+
+@contextlib.contextmanager
+def admit(cost, client=None):
+    """Hold a render slot for a job with the given estimate while the block runs.
+
+    Raises Rejected when the job is over budget, the client already has
+    MAX_JOBS_PER_CLIENT jobs, or no slot frees up within QUEUE_TIMEOUT.
+    """
+    global _running
+    client = client or client_id()
+    reason = over_budget(cost)
+    if reason:
+        _reject("budget", reason)
+    queued = not SMALL_JOB_SECONDS or cost["seconds"] >= SMALL_JOB_SECONDS
+    with _condition:
+        if MAX_JOBS_PER_CLIENT and _per_client[client] >= MAX_JOBS_PER_CLIENT:
+            _reject("client", "You already have a job rendering; wait for it to finish and try again.")
+        if queued and _running >= MAX_RENDERS and MAX_QUEUED and len(_queue) >= MAX_QUEUED:
+            _reject("busy", "The server is busy rendering other jobs; try again in a few minutes.")
+        _per_client[client] += 1
+        if queued:
+            ticket = object()
+            _queue.append(ticket)
+            start = time.monotonic()
+            # First come, first served: wait for our turn and a free slot
+            while _queue[0] is not ticket or _running >= MAX_RENDERS:
+                remaining = start + QUEUE_TIMEOUT - time.monotonic() if QUEUE_TIMEOUT else None
+                if remaining is not None and remaining <= 0:
+                    _queue.remove(ticket)
+                    _release_client(client)
+                    _condition.notify_all()
+                    _reject("timeout", "The server is busy rendering other jobs; try again in a few minutes.")
+                _condition.wait(remaining)
+            _queue.popleft()
+            _running += 1
+            metrics.record_admission("queued" if time.monotonic() - start > 0.01 else "admitted",
+                                     wait_seconds=time.monotonic() - start)
+        else:
+            metrics.record_admission("small")
+    try:
+        yield
+    finally:
+        with _condition:
+            if queued:
+                _running -= 1
+            _release_client(client)
+            _condition.notify_all()
+
+
+def _release_client(client):
+    _per_client[client] -= 1
+    if _per_client[client] <= 0:
+        del _per_client[client]
+
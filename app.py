@@ -2,9 +2,11 @@ import os
 import dash
 import dash_bootstrap_components as dbc
 
+import retention
 from layout import create_layout
 from callbacks import register_callbacks
-from server import setup_download_route
+from server import (setup_download_route, setup_jobs_routes, setup_upload_routes, setup_codes_route,
+                    setup_metrics_route)
 
 
 # Initialize the Dash app
@@ -15,8 +17,11 @@ app.config.suppress_callback_exceptions = True
 # Create necessary directories (only for local development)
 if not os.environ.get('RENDER'):  # Only create dirs locally, not on Render
     os.makedirs("labels_pdf", exist_ok=True)
+    # Keep labels_pdf/ bounded (age, size, count) and deduplicated in the background
+    retention.start("labels_pdf")
 
-# Global storage for in-memory PDFs (for deployment)
+# Global storage for in-memory outputs (for deployment): filename -> bytes, shared by
+# every download of the file
 pdf_storage = {}
 
 # Set up the layout
@@ -28,6 +33,18 @@ register_callbacks(app, pdf_storage)
 # Setup download route
 setup_download_route(app, pdf_storage)
 
+# Setup job API routes (reprints)
+setup_jobs_routes(app, pdf_storage)
+
+# Setup chunked upload API routes
+setup_upload_routes(app)
+
+# Setup short code lookup route
+setup_codes_route(app)
+
+# Setup Prometheus metrics route
+setup_metrics_route(app)
+
 # Expose the server for gunicorn
 server = app.server
 
@@ -0,0 +1,22 @@
+// Manual biomass entry: rows are appended to the table with partial (Patch)
+// updates from the server, and the table is the source of truth. This keeps
+// the data store, the row count that enables "Generate CSV Data" and the
+// empty-table message in step with it in the browser, so adding, editing or
+// deleting a row never sends the whole table to the server.
+(function () {
+    window.dash_clientside = Object.assign({}, window.dash_clientside, {
+        labels: Object.assign({}, (window.dash_clientside || {}).labels, {
+            // Table rows -> [store, row count, empty message style, table style]
+            biomassRows: function (rows) {
+                rows = rows || [];
+                var hasRows = rows.length > 0;
+                return [
+                    rows,
+                    rows.length,
+                    {"display": hasRows ? "none" : "block"},
+                    {"display": hasRows ? "block" : "none"}
+                ];
+            }
+        })
+    });
+})();
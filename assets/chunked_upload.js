@@ -0,0 +1,166 @@
+// Chunked, resumable CSV upload for large files.
+//
+// The file picked via #chunked-upload-btn is sent in CHUNK_SIZE slices to
+// /api/uploads/<id>?offset=N. The upload id is remembered in localStorage per
+// file (name, size, mtime), so picking the same file again after a failure or
+// page reload resumes from the offset the server already has. Once all bytes
+// are in, the server parses the spool file in the background and this script
+// polls its progress. Dash reads the state through the clientside callbacks
+// registered in the "labels" namespace.
+(function () {
+    var CHUNK_SIZE = 4 * 1024 * 1024;
+    var MAX_RETRIES = 5;
+
+    var state = {status: "idle"};
+    var version = 0;
+    var lastSeen = -1;
+
+    function setState(update) {
+        Object.assign(state, update);
+        version += 1;
+    }
+
+    function sleep(ms) {
+        return new Promise(function (resolve) { setTimeout(resolve, ms); });
+    }
+
+    function resumeKey(file) {
+        return "labels-upload:" + file.name + ":" + file.size + ":" + file.lastModified;
+    }
+
+    async function request(url, options) {
+        var response = await fetch(url, options);
+        var body = await response.json();
+        return {status: response.status, ok: response.ok, body: body};
+    }
+
+    async function serverOffset(uploadId) {
+        var r = await request("/api/uploads/" + uploadId);
+        if (!r.ok || (r.body.status !== "uploading" && r.body.status !== "uploaded")) {
+            return null;
+        }
+        return r.body.offset;
+    }
+
+    async function startUpload(file) {
+        var key = resumeKey(file);
+        var uploadId = window.localStorage.getItem(key);
+        var offset = uploadId ? await serverOffset(uploadId) : null;
+
+        if (offset === null) {
+            var created = await request("/api/uploads", {
+                method: "POST",
+                headers: {"Content-Type": "application/json"},
+                body: JSON.stringify({filename: file.name, size: file.size})
+            });
+            if (!created.ok) {
+                throw new Error(created.body.error);
+            }
+            uploadId = created.body.upload_id;
+            offset = 0;
+            window.localStorage.setItem(key, uploadId);
+        }
+        setState({status: "uploading", upload_id: uploadId, filename: file.name,
+                  size: file.size, offset: offset, progress: offset / file.size, error: null});
+
+        var retries = 0;
+        while (offset < file.size) {
+            try {
+                var r = await request("/api/uploads/" + uploadId + "?offset=" + offset, {
+                    method: "PUT",
+                    body: file.slice(offset, offset + CHUNK_SIZE)
+                });
+                if (r.status === 409) {
+                    offset = r.body.offset;  // server is ahead or behind; continue from its offset
+                } else if (!r.ok) {
+                    throw new Error(r.body.error);
+                } else {
+                    offset = r.body.offset;
+                    retries = 0;
+                }
+            } catch (err) {
+                if (++retries > MAX_RETRIES) {
+                    throw err;
+                }
+                await sleep(1000 * retries);
+                var current = await serverOffset(uploadId).catch(function () { return null; });
+                if (current !== null) {
+                    offset = current;
+                }
+            }
+            setState({offset: offset, progress: offset / file.size});
+        }
+
+        var completed = await request("/api/uploads/" + uploadId + "/complete", {method: "POST"});
+        if (!completed.ok) {
+            throw new Error(completed.body.error);
+        }
+        window.localStorage.removeItem(key);
+
+        var status = completed.body;
+        while (status.status === "parsing") {
+            setState({status: "parsing", progress: status.progress || 0, rows: status.rows || 0});
+            await sleep(500);
+            status = (await request("/api/uploads/" + uploadId)).body;
+        }
+        if (status.status !== "done") {
+            throw new Error(status.error || "Parsing failed");
+        }
+        setState({status: "done", progress: 1, rows: status.rows});
+    }
+
+    function onFileChosen(file) {
+        setState({status: "uploading", upload_id: null, filename: file.name, size: file.size,
+                  offset: 0, progress: 0, rows: 0, error: null});
+        startUpload(file).catch(function (err) {
+            setState({status: "error", error: err.message});
+        });
+    }
+
+    // The picker is created on demand since Dash has no file <input> component
+    document.addEventListener("click", function (event) {
+        if (!event.target.closest || !event.target.closest("#chunked-upload-btn")) {
+            return;
+        }
+        var input = document.createElement("input");
+        input.type = "file";
+        input.accept = ".csv,.parquet,.pq,.arrow,.feather,.ipc,.xlsx";
+        input.addEventListener("change", function () {
+            if (input.files && input.files.length) {
+                onFileChosen(input.files[0]);
+            }
+        });
+        input.click();
+    });
+
+    window.dash_clientside = Object.assign({}, window.dash_clientside, {
+        labels: Object.assign({}, (window.dash_clientside || {}).labels, {
+            // Interval -> state store, only when the upload state changed
+            chunkedUploadState: function () {
+                if (version === lastSeen) {
+                    return window.dash_clientside.no_update;
+                }
+                lastSeen = version;
+                return Object.assign({}, state);
+            },
+            // State store -> progress bar value, label and visibility
+            chunkedUploadProgress: function (upload) {
+                if (!upload || upload.status === "idle") {
+                    return [0, "", {"display": "none"}];
+                }
+                var percent = Math.round((upload.progress || 0) * 100);
+                var label;
+                if (upload.status === "uploading") {
+                    label = "Uploading " + percent + "%";
+                } else if (upload.status === "parsing") {
+                    label = "Parsing " + percent + "% (" + (upload.rows || 0).toLocaleString() + " rows)";
+                } else if (upload.status === "done") {
+                    label = "Loaded " + (upload.rows || 0).toLocaleString() + " rows";
+                } else {
+                    label = "Upload failed";
+                }
+                return [percent, label, {"display": "flex", "height": "1.25rem"}];
+            }
+        })
+    });
+})();
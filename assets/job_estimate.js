@@ -0,0 +1,67 @@
+// Job size for the render estimate next to "Generate PDF". The table can be
+// large, so it is summarised here in the browser (rows, printed pages with
+// copies, mean length of the encoded symbol text) and only those numbers go
+// to the server, which turns them into seconds and bytes with the cost model
+// (admission.estimate_counts). Uploads held on the server arrive already
+// summarised.
+(function () {
+    var MAX_COPIES = 100;
+    var SHORT_CODE_CHARS = 8;
+
+    // Same rules as utils.parse_copies
+    function parseCopies(value, fallback) {
+        var n = Math.trunc(parseFloat(value));
+        if (!isFinite(n)) {
+            return fallback;
+        }
+        return Math.min(Math.max(n, 1), MAX_COPIES);
+    }
+
+    // Same rules as short_ids.encoded_column
+    function encodedColumn(rows, style) {
+        if (style === "line") {
+            return rows.length && "ucode" in rows[0] ? "ucode" : "info1";
+        }
+        return style === "biomass" ? "info1" : "ID";
+    }
+
+    window.dash_clientside = Object.assign({}, window.dash_clientside, {
+        labels: Object.assign({}, (window.dash_clientside || {}).labels, {
+            // Table rows, label options, copies -> {rows, pages, symbol_chars}
+            jobSummary: function (rows, options, copies) {
+                if (!rows || !options) {
+                    return null;
+                }
+                var fallback = parseCopies(copies, 1);
+                // Uploads held on the server come with their counts (callbacks._server_table)
+                if (rows.upload_id) {
+                    return {
+                        rows: rows.rows,
+                        pages: rows.fixed_pages + rows.default_rows * fallback,
+                        symbol_chars: options.short_ids ? SHORT_CODE_CHARS : (rows.symbol_chars || 0)
+                    };
+                }
+                if (!rows.length) {
+                    return null;
+                }
+                var column = encodedColumn(rows, options.style);
+                var pages = 0;
+                var chars = 0;
+                rows.forEach(function (row) {
+                    pages += "copies" in row ? parseCopies(row.copies, fallback) : fallback;
+                    var value = row[column];
+                    // Same rules as short_ids.encoded_values: a blank ucode encodes info1
+                    if (column === "ucode" && (value === null || value === undefined || !String(value).trim())) {
+                        value = row.info1;
+                    }
+                    chars += value === null || value === undefined ? 0 : String(value).length;
+                });
+                return {
+                    rows: rows.length,
+                    pages: pages,
+                    symbol_chars: options.short_ids ? SHORT_CODE_CHARS : chars / rows.length
+                };
+            }
+        })
+    });
+})();
@@ -0,0 +1,502 @@
+"""Label rendering benchmark suite.
+
+Renders synthetic datasets for every label style and records wall time,
+labels/sec, peak RSS and output size as JSON so runs can be compared.
+
+    python benchmark.py                              # full suite -> benchmark_results.json
+    python benchmark.py --sizes 100,1000 -o ci.json  # quick run
+    python benchmark.py --sizes 100,1000 --baseline main.json --max-regression 0.2
+    python benchmark.py --calibrate                  # fit the admission cost model -> cost_model.json
+
+Each case runs in a fresh interpreter so peak RSS is per case, inside a
+temporary working directory so the generators' temp files and labels_pdf/
+output never touch the repository. With --baseline the exit status is 1
+when any case is slower or bigger than allowed, which makes it usable as a
+CI regression gate. Everything runs offline.
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import platform
+import resource
+import tempfile
+import subprocess
+from datetime import datetime
+
+import pandas as pd
+
+
+DEFAULT_SIZES = [100, 1000, 10000, 100000]
+CALIBRATION_SIZES = [200, 1000]
+QR_TREATMENTS = 10
+
+
+def qr_dataset(n):
+    """QR-style rows shaped like create_qr_dataframe output"""
+    from utils import create_qr_dataframe
+
+    treatments = ",".join(f"T{i:02d}" for i in range(1, QR_TREATMENTS + 1))
+    blocks = -(-n // QR_TREATMENTS)
+    df = create_qr_dataframe("Benchmark", "Manhattan", 2025, blocks, treatments, "V4")
+    return df.head(n).astype(str)
+
+
+def biomass_dataset(n):
+    """Biomass/line rows with info1-info3 and ucode"""
+    return pd.DataFrame({
+        "info1": [f"P{i:06d}" for i in range(n)],
+        "info2": [f"Site-{i % 7}" for i in range(n)],
+        "info3": [f"2025-06-{1 + i % 28:02d}" for i in range(n)],
+        "ucode": [f"U{i:06d}" for i in range(n)],
+    })
+
+
+def long_id_dataset(n):
+    """Biomass rows whose info1 is a full create_qr_dataframe ID (dense QR at 0.6 in)"""
+    df = biomass_dataset(n)
+    df["info1"] = qr_dataset(n)["ID"].to_numpy()
+    return df
+
+
+def long_text_dataset(n):
+    """Biomass/line rows whose info2/info3 are too long for the label and get fitted"""
+    df = biomass_dataset(n)
+    df["info2"] = [f"Research Station {i % 97} North Field" for i in range(n)]
+    df["info3"] = [f"Collected 2025-06-{1 + i % 28:02d} by field crew {i % 13}" for i in range(n)]
+    return df
+
+
+def tripled_dataset(n, copies=3):
+    """`copies` times as many distinct biomass rows: the same page count as the copies
+    option with every page drawn. Repeated rows would hit the page fragment cache and
+    share content streams, so they would measure the copies machinery, not its absence."""
+    return biomass_dataset(n * copies)
+
+
+def render_qr(df, name):
+    from utils import create_qr_pdf
+    return create_qr_pdf(df, name)
+
+
+def render_biomass_barcode(df, name):
+    from utils import create_biomass_pdf
+    return create_biomass_pdf(df, name, use_qr=False)
+
+
+def render_biomass_qr(df, name):
+    from utils import create_biomass_pdf
+    return create_biomass_pdf(df, name, use_qr=True)
+
+
+def render_biomass_datamatrix(df, name):
+    from utils import create_biomass_pdf
+    return create_biomass_pdf(df, name, symbology="datamatrix")
+
+
+def render_line(df, name):
+    from utils import create_line_pdf
+    return create_line_pdf(df, name)
+
+
+def render_line_datamatrix(df, name):
+    from utils import create_line_pdf
+    return create_line_pdf(df, name, symbology="datamatrix")
+
+
+def render_qr_datamatrix(df, name):
+    from utils import create_qr_pdf
+    return create_qr_pdf(df, name, symbology="datamatrix")
+
+
+def render_biomass_copies(copies):
+    def render(df, name):
+        from utils import create_biomass_pdf
+        return create_biomass_pdf(df, name, use_qr=False, copies=copies)
+    return render
+
+
+def render_zpl(style, symbology):
+    def render(df, name):
+        from zpl import create_zpl
+        return create_zpl(df, name.replace(".pdf", ".zpl"), style=style, symbology=symbology)
+    return render
+
+
+def render_raster(style, symbology, image_format):
+    def render(df, name):
+        from raster import create_raster
+        return create_raster(df, name.replace(".pdf", ".tiff" if image_format == "tiff" else ".zip"),
+                             style=style, symbology=symbology, image_format=image_format)
+    return render
+
+
+# case name -> (dataset builder, renderer)
+CASES = {
+    "qr": (qr_dataset, render_qr),
+    "qr_datamatrix": (qr_dataset, render_qr_datamatrix),
+    "biomass_barcode": (biomass_dataset, render_biomass_barcode),
+    "biomass_qr": (biomass_dataset, render_biomass_qr),
+    "biomass_qr_long_ids": (long_id_dataset, render_biomass_qr),
+    "biomass_datamatrix": (biomass_dataset, render_biomass_datamatrix),
+    "biomass_datamatrix_long_ids": (long_id_dataset, render_biomass_datamatrix),
+    "line": (biomass_dataset, render_line),
+    "line_long_text": (long_text_dataset, render_line),
+    "line_datamatrix": (biomass_dataset, render_line_datamatrix),
+    "qr_zpl": (qr_dataset, render_zpl("qr", "qr")),
+    "biomass_barcode_zpl": (biomass_dataset, render_zpl("biomass", "code128")),
+    "line_zpl": (biomass_dataset, render_zpl("line", "qr")),
+    "biomass_barcode_tiff": (biomass_dataset, render_raster("biomass", "code128", "tiff")),
+    "line_png": (biomass_dataset, render_raster("line", "qr", "png")),
+    # Three copies of each label: the copies option vs repeated rows (rows = distinct labels)
+    "biomass_barcode_x3_copies": (biomass_dataset, render_biomass_copies(3)),
+    "biomass_barcode_x3_rows": (tripled_dataset, render_biomass_barcode),
+}
+
+
+# Cases fitted by --calibrate -> admission cost model key ("format/style/symbology")
+COST_KEYS = {
+    "qr": "pdf/qr/qr",
+    "qr_datamatrix": "pdf/qr/datamatrix",
+    "biomass_barcode": "pdf/biomass/code128",
+    "biomass_qr": "pdf/biomass/qr",
+    "biomass_qr_long_ids": "pdf/biomass/qr",
+    "biomass_datamatrix": "pdf/biomass/datamatrix",
+    "biomass_datamatrix_long_ids": "pdf/biomass/datamatrix",
+    "line": "pdf/line/qr",
+    "line_datamatrix": "pdf/line/datamatrix",
+    "qr_zpl": "zpl/qr/qr",
+    "biomass_barcode_zpl": "zpl/biomass/code128",
+    "line_zpl": "zpl/line/qr",
+    "biomass_barcode_tiff": "tiff/biomass/code128",
+    "line_png": "png/line/qr",
+}
+# Cases whose difference gives the cost of each extra copy of a label
+COPY_CASES = ("biomass_barcode", "biomass_barcode_x3_copies", 2)
+
+
+# Tables measured by --dataset-memory, read back from CSV like uploads
+MEMORY_TABLES = {"qr": qr_dataset, "biomass": biomass_dataset, "line_long_text": long_text_dataset}
+
+
+def dataset_memory(size, jobs_kept=int(os.environ.get('LABELS_MAX_JOBS', '32'))):
+    """Memory of a label table as read from CSV (object columns) against dataset.compact"""
+    import io
+    import dataset
+
+    results = []
+    for name, build in MEMORY_TABLES.items():
+        csv = build(size).to_csv(index=False).encode()
+        df = pd.read_csv(io.BytesIO(csv), dtype=str)
+        start = time.perf_counter()
+        compact = dataset.compact(df)
+        compact_seconds = time.perf_counter() - start
+        start = time.perf_counter()
+        dataset.expand(compact)
+        expand_seconds = time.perf_counter() - start
+        object_bytes, compact_bytes = dataset.memory_bytes(df), dataset.memory_bytes(compact)
+        results.append({
+            "table": name,
+            "rows": size,
+            "jobs_kept": jobs_kept,
+            "object_mb": round(object_bytes / 1e6, 2),
+            "compact_mb": round(compact_bytes / 1e6, 2),
+            "ratio": round(object_bytes / compact_bytes, 1),
+            # A full job registry (LABELS_MAX_JOBS) of tables this size
+            "registry_object_mb": round(object_bytes * jobs_kept / 1e6, 1),
+            "registry_compact_mb": round(compact_bytes * jobs_kept / 1e6, 1),
+            "compact_seconds": round(compact_seconds, 4),
+            "expand_seconds": round(expand_seconds, 4),
+        })
+    return results
+
+
+def _peak_rss_mb():
+    # ru_maxrss is reported in kilobytes on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def run_case(case, size):
+    """Run one case in the current process and return its measurements"""
+    import encode_pool
+    from metrics import STAGE_SECONDS, output_size
+
+    build, render = CASES[case]
+    df = build(size)
+    # Pool start-up is paid once per server process, not per job
+    encode_pool.warm_up()
+    rss_before = _peak_rss_mb()
+
+    start = time.perf_counter()
+    result = render(df, f"bench_{case}_{size}.pdf")
+    elapsed = time.perf_counter() - start
+    encode_seconds, _ = STAGE_SECONDS.total(stage="symbol_encode")
+    wait_seconds, _ = STAGE_SECONDS.total(stage="symbol_wait")
+    key = COST_KEYS.get(case)
+    if key:
+        import admission
+        chars = admission.symbol_chars(df, {"style": key.split("/")[1]})
+
+    return {
+        "case": case,
+        "rows": size,
+        "wall_seconds": round(elapsed, 4),
+        "labels_per_second": round(size / elapsed, 2) if elapsed else None,
+        "encode_seconds": round(encode_seconds, 4),
+        "encode_workers": encode_pool.WORKERS,
+        "encode_wait_seconds": round(wait_seconds, 4),
+        "peak_rss_mb": round(_peak_rss_mb(), 1),
+        "dataset_rss_mb": round(rss_before, 1),
+        "output_bytes": output_size(result),
+        "bytes_per_label": round(output_size(result) / size, 1) if size else None,
+        "cost_key": key,
+        "symbol_chars": round(chars, 2) if key else None,
+    }
+
+
+def run_isolated(case, size, repeat=1, in_memory=False, encode_workers=None):
+    """Run a case `repeat` times in fresh subprocesses and keep the fastest run"""
+    env = dict(os.environ)
+    if encode_workers is not None:
+        env["LABELS_ENCODE_WORKERS"] = str(encode_workers)
+    env["PYTHONPATH"] = os.pathsep.join(filter(None, [os.path.dirname(os.path.abspath(__file__)),
+                                                      env.get("PYTHONPATH")]))
+    if in_memory:
+        env["RENDER"] = "1"
+    else:
+        env.pop("RENDER", None)
+
+    best = None
+    for _ in range(repeat):
+        with tempfile.TemporaryDirectory(prefix="labels_bench_") as workdir:
+            os.makedirs(os.path.join(workdir, "labels_pdf"))
+            proc = subprocess.run(
+                [sys.executable, os.path.abspath(__file__), "--run-case", case, str(size)],
+                cwd=workdir, env=env, capture_output=True, text=True
+            )
+        if proc.returncode != 0:
+            return {"case": case, "rows": size, "encode_workers": encode_workers,
+                    "error": proc.stderr.strip().splitlines()[-1:]}
+        result = json.loads(proc.stdout.strip().splitlines()[-1])
+        if best is None or result["wall_seconds"] < best["wall_seconds"]:
+            best = result
+    return best
+
+
+def environment_info():
+    """Describe the machine and library versions the results were taken on"""
+    import qrcode
+    import reportlab
+    import metrics
+    import utils
+
+    info = {
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "reportlab": reportlab.Version,
+        "qrcode": getattr(qrcode, "__version__", "unknown"),
+        "pandas": pd.__version__,
+        "metrics_enabled": metrics.ENABLED,
+        "qr_policy": utils.QR_POLICY,
+        "qr_module_mm": utils.QR_MODULE_MM,
+        "qr_alphanumeric": utils.QR_ALPHANUMERIC,
+        "text_autofit": utils.TEXT_AUTOFIT,
+        "pdf_profile": utils.PDF_PROFILE,
+    }
+    try:
+        info["git_commit"] = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+            cwd=os.path.dirname(os.path.abspath(__file__))
+        ).stdout.strip() or None
+    except OSError:
+        info["git_commit"] = None
+    return info
+
+
+def _fit(points):
+    """Least-squares (per label, per label per char) through the origin; per char only when lengths vary"""
+    import numpy as np
+
+    labels = np.array([p[0] for p in points], dtype=float)
+    chars = np.array([p[1] for p in points], dtype=float)
+    values = np.array([p[2] for p in points], dtype=float)
+    if len(set(chars)) > 1:
+        (per_label, per_char), *_ = np.linalg.lstsq(np.column_stack([labels, labels * chars]), values, rcond=None)
+        if per_label >= 0 and per_char >= 0:
+            return float(per_label), float(per_char)
+    return float(values.sum() / labels.sum()), 0.0
+
+
+def calibrate(results):
+    """Admission cost model coefficients fitted to benchmark results"""
+    points = {}
+    for r in results:
+        if "error" not in r and r.get("cost_key"):
+            points.setdefault(r["cost_key"], []).append(r)
+    model = {}
+    for key, runs in sorted(points.items()):
+        seconds = _fit([(r["rows"], r["symbol_chars"], r["wall_seconds"]) for r in runs])
+        size = _fit([(r["rows"], r["symbol_chars"], r["output_bytes"]) for r in runs])
+        model[key] = [round(seconds[0], 7), round(seconds[1], 8), round(size[0], 1), round(size[1], 2)]
+
+    single, copies, extra = COPY_CASES
+    by_case = {(r["case"], r["rows"]): r for r in results if "error" not in r}
+    per_copy = [((by_case[copies, rows]["wall_seconds"] - by_case[single, rows]["wall_seconds"]) / (extra * rows),
+                 (by_case[copies, rows]["output_bytes"] - by_case[single, rows]["output_bytes"]) / (extra * rows))
+                for case, rows in by_case if case == single and (copies, rows) in by_case]
+    if per_copy:
+        model["copy"] = [round(max(sum(p[0] for p in per_copy) / len(per_copy), 0), 7),
+                         round(max(sum(p[1] for p in per_copy) / len(per_copy), 0), 1)]
+    return model
+
+
+def compare(results, baseline, max_regression, max_rss_regression):
+    """Return a list of human-readable regressions against a baseline result file"""
+    def key(r):
+        return r["case"], r["rows"], r.get("encode_workers") or 0
+
+    previous = {key(r): r for r in baseline.get("results", []) if "error" not in r}
+    regressions = []
+    for r in results:
+        old = previous.get(key(r))
+        if old is None or "error" in r:
+            continue
+        if old["labels_per_second"] and r["labels_per_second"] < old["labels_per_second"] * (1 - max_regression):
+            regressions.append(
+                f"{r['case']}@{r['rows']}: {r['labels_per_second']} labels/s "
+                f"(baseline {old['labels_per_second']})")
+        if r["peak_rss_mb"] > old["peak_rss_mb"] * (1 + max_rss_regression):
+            regressions.append(
+                f"{r['case']}@{r['rows']}: peak RSS {r['peak_rss_mb']} MB (baseline {old['peak_rss_mb']} MB)")
+        if old["output_bytes"] and r["output_bytes"] > old["output_bytes"] * (1 + max_regression):
+            regressions.append(
+                f"{r['case']}@{r['rows']}: {r['output_bytes']} bytes (baseline {old['output_bytes']})")
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark label rendering throughput and memory")
+    parser.add_argument("--cases", default=",".join(CASES), help="comma-separated cases to run")
+    parser.add_argument("--sizes", default=",".join(map(str, DEFAULT_SIZES)),
+                        help="comma-separated row counts")
+    parser.add_argument("--repeat", type=int, default=1, help="runs per case, fastest is kept")
+    parser.add_argument("--in-memory", action="store_true",
+                        help="render to in-memory buffers like the RENDER deployment")
+    parser.add_argument("--qr-policy", choices=["fixed", "adaptive"],
+                        help="QR encoding policy to benchmark (sets LABELS_QR_POLICY)")
+    parser.add_argument("--qr-alphanumeric", action="store_true",
+                        help="upper-case QR payloads for alphanumeric mode (sets LABELS_QR_ALPHANUMERIC)")
+    parser.add_argument("--no-autofit", action="store_true",
+                        help="draw text at its nominal size (sets LABELS_TEXT_AUTOFIT=0)")
+    parser.add_argument("--pdf-profile", choices=["default", "fast", "small", "web"],
+                        help="PDF output profile to benchmark (sets LABELS_PDF_PROFILE)")
+    parser.add_argument("--encode-workers",
+                        help="comma-separated symbol encode pool sizes to compare, e.g. 0,4 "
+                             "(sets LABELS_ENCODE_WORKERS; 0 encodes inline)")
+    parser.add_argument("--calibrate", action="store_true",
+                        help="fit the admission cost model to the cost cases (at 200 and 1000 rows "
+                             "unless --sizes is given) and write it to --cost-model")
+    parser.add_argument("--cost-model", default=os.environ.get("LABELS_COST_MODEL", "cost_model.json"),
+                        help="cost model file written by --calibrate")
+    parser.add_argument("--dataset-memory", action="store_true",
+                        help="measure in-memory table size (object vs compact columns) instead of rendering")
+    parser.add_argument("-o", "--output", default="benchmark_results.json")
+    parser.add_argument("--baseline", help="previous results JSON to compare against")
+    parser.add_argument("--max-regression", type=float, default=0.15,
+                        help="allowed fractional drop in labels/sec or growth in output size")
+    parser.add_argument("--max-rss-regression", type=float, default=0.25,
+                        help="allowed fractional growth in peak RSS")
+    parser.add_argument("--run-case", nargs=2, metavar=("CASE", "ROWS"), help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.run_case:
+        print(json.dumps(run_case(args.run_case[0], int(args.run_case[1]))))
+        return 0
+
+    cases = [c.strip() for c in args.cases.split(",") if c.strip()]
+    unknown = [c for c in cases if c not in CASES]
+    if unknown:
+        parser.error(f"unknown case(s): {', '.join(unknown)}; choose from {', '.join(CASES)}")
+    sizes = [int(s) for s in args.sizes.split(",") if s.strip()]
+    if args.calibrate:
+        # Every cost case plus the copies pair, unless cases were picked
+        if args.cases == parser.get_default("cases"):
+            cases = list(COST_KEYS) + [c for c in COPY_CASES[:2] if c not in COST_KEYS]
+        if args.sizes == parser.get_default("sizes"):
+            sizes = CALIBRATION_SIZES
+    # Encoding settings reach the case subprocesses (and environment_info) via the environment
+    if args.qr_policy:
+        os.environ["LABELS_QR_POLICY"] = args.qr_policy
+    if args.qr_alphanumeric:
+        os.environ["LABELS_QR_ALPHANUMERIC"] = "1"
+    if args.no_autofit:
+        os.environ["LABELS_TEXT_AUTOFIT"] = "0"
+    if args.pdf_profile:
+        os.environ["LABELS_PDF_PROFILE"] = args.pdf_profile
+
+    if args.dataset_memory:
+        results = [r for size in sizes for r in dataset_memory(size)]
+        for r in results:
+            print(f"{r['table']:>28} {r['rows']:>7} rows  {r['object_mb']:>8.2f} MB object  "
+                  f"{r['compact_mb']:>7.2f} MB compact  {r['ratio']:>5.1f}x  "
+                  f"{r['jobs_kept']} jobs {r['registry_object_mb']:>7.1f} -> {r['registry_compact_mb']:>6.1f} MB  "
+                  f"{r['compact_seconds']:.3f} s compact  {r['expand_seconds']:.3f} s expand")
+        with open(args.output, "w") as f:
+            json.dump({"environment": environment_info(), "dataset_memory": results}, f, indent=2)
+        print(f"Results written to {args.output}")
+        return 0
+
+    results = []
+    encode_workers = [int(w) for w in args.encode_workers.split(",") if w.strip()] if args.encode_workers else [None]
+    for case in cases:
+        for size in sizes:
+            inline = None
+            for workers in encode_workers:
+                result = run_isolated(case, size, repeat=args.repeat, in_memory=args.in_memory,
+                                      encode_workers=workers)
+                results.append(result)
+                if "error" in result:
+                    print(f"{case:>28} {size:>7} rows  ERROR {result['error']}")
+                    continue
+                # Gain of pipelined encoding over the first pool size listed
+                inline = inline or result
+                gain = ""
+                if len(encode_workers) > 1:
+                    gain = (f"  {result['encode_workers']} encode workers "
+                            f"{inline['wall_seconds'] / result['wall_seconds']:>5.2f}x "
+                            f"({result['encode_wait_seconds']:.3f} s waiting)")
+                print(f"{case:>28} {size:>7} rows  {result['wall_seconds']:>9.3f} s  "
+                      f"{result['labels_per_second']:>9.1f} labels/s  "
+                      f"{result['encode_seconds']:>8.3f} s encode  "
+                      f"{result['peak_rss_mb']:>7.1f} MB RSS  {result['output_bytes']:>11} bytes{gain}")
+
+    report = {"environment": environment_info(), "in_memory": args.in_memory, "results": results}
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"Results written to {args.output}")
+
+    if args.calibrate:
+        model = calibrate(results)
+        with open(args.cost_model, "w") as f:
+            json.dump({"environment": report["environment"], "model": model}, f, indent=2)
+        for key, coefficients in model.items():
+            print(f"{key:>28}  {coefficients}")
+        print(f"Cost model written to {args.cost_model}")
+
+    status = 1 if any("error" in r for r in results) else 0
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.max_regression, args.max_rss_regression)
+        for line in regressions:
+            print(f"REGRESSION {line}")
+        if regressions:
+            status = 1
+    return status
+
+
+if __name__ == "__main__":
+    sys.exit(main())
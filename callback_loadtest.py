@@ -0,0 +1,216 @@
+"""Headless end-to-end load test of the Dash callback sequence.
+
+Simulated users replay what the browser does for an uploaded CSV, posting
+to /_dash-update-component: upload the file (process_upload), click "Load
+CSV Data" (generate_csv_data), render the whole job (generate_pdf_from_csv,
+the preview's confirm button) and fetch /download/<filename>. Latency
+percentiles, throughput and error rate are reported per stage for every
+combination of user count and dataset size, to size deployments from
+numbers instead of guesswork.
+
+    python callback_loadtest.py                                  # 1,4,8 users x 100,1000 rows
+    python callback_loadtest.py --users 16 --sizes 5000 --sessions 3
+    python callback_loadtest.py --port 8080 --style line         # against a running server
+
+By default app.server is started in this process on a local port (threaded
+werkzeug server) inside a temporary working directory, so no browser,
+network or external server is needed and labels_pdf/ output never touches
+the repository.
+"""
+import os
+import sys
+import json
+import time
+import base64
+import logging
+import argparse
+import tempfile
+import threading
+import http.client
+
+from benchmark import biomass_dataset, qr_dataset
+from loadtest import DashClient, percentile
+
+
+STAGES = ("upload", "load", "generate", "download")
+
+# Upload dialog settings per label style: (style, symbol type, dataset)
+STYLES = {
+    "biomass": ("biomass", "barcode", biomass_dataset),
+    "line": ("line", "qr", biomass_dataset),
+    "qr": ("qr", "qr", qr_dataset),
+}
+
+
+def start_local_server():
+    """Serve app.server from a temporary working directory; returns the port"""
+    from werkzeug.serving import make_server
+
+    workdir = tempfile.mkdtemp(prefix="labels_callbacks_")
+    os.chdir(workdir)
+    os.environ.setdefault("LABELS_SHORT_ID_DB", os.path.join(workdir, "short_ids.db"))
+    # Every simulated user comes from 127.0.0.1, so no per-client job limit
+    os.environ.setdefault("LABELS_MAX_JOBS_PER_CLIENT", "0")
+    os.environ.pop("RENDER", None)
+    logging.getLogger("werkzeug").setLevel(logging.ERROR)
+    import app
+
+    server = make_server("127.0.0.1", 0, app.server, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server.server_port
+
+
+class Session:
+    """One simulated user going through upload -> load -> generate -> download"""
+
+    def __init__(self, client, csv_contents, style):
+        self.client = client
+        self.contents = "data:text/csv;base64," + base64.b64encode(csv_contents).decode()
+        self.style, self.symbol_type, _ = STYLES[style]
+
+    def upload(self):
+        dependency = self.client.find("upload-data", "stored-data")
+        response = self.client.call(dependency, {"upload-data": self.contents}, {"upload-data": "loadtest.csv"})
+        if not response.get("stored-data", {}).get("data"):
+            raise RuntimeError("upload was not parsed")
+        return response["stored-data"]["data"]
+
+    def load(self, stored):
+        dependency = self.client.find("load-csv-btn", "current-csv-data")
+        response = self.client.call(dependency, {"load-csv-btn": 1}, {
+            "stored-data": stored, "upload-label-style": self.style,
+            "upload-biomass-output-type": self.symbol_type, "upload-symbol-content": "full"})
+        if not response.get("current-label-options", {}).get("data"):
+            raise RuntimeError("CSV data was not loaded")
+        return response["current-csv-data"]["data"], response["current-label-options"]["data"]
+
+    def generate(self, csv_data, label_options):
+        dependency, button = self.client.find_render()
+        response = self.client.call(dependency, {button: 1}, {
+            "current-csv-data": csv_data, "current-label-options": label_options,
+            "url": "", "output-format": "pdf", "pdf-profile": "default"})
+        text = json.dumps(response)
+        start = text.find("/download/")
+        if start < 0:
+            raise RuntimeError("no PDF in the callback response")
+        return text[start + len("/download/"):].split('"')[0]
+
+    def download(self, filename):
+        conn = http.client.HTTPConnection("127.0.0.1", self.client.port, timeout=self.client.timeout)
+        conn.request("GET", f"/download/{filename}")
+        response = conn.getresponse()
+        body = response.read()
+        if response.status != 200:
+            raise RuntimeError(f"download: HTTP {response.status}")
+        return len(body)
+
+    def run(self, record):
+        """Go through every stage, calling record(stage, seconds, ok); stops at the first error"""
+        value = None
+        for stage in STAGES:
+            start = time.perf_counter()
+            try:
+                if stage == "upload":
+                    value = self.upload()
+                elif stage == "load":
+                    value = self.load(value)
+                elif stage == "generate":
+                    value = self.generate(*value)
+                else:
+                    value = self.download(value)
+            except (OSError, RuntimeError, KeyError, ValueError, http.client.HTTPException):
+                record(stage, time.perf_counter() - start, False)
+                return False
+            record(stage, time.perf_counter() - start, True)
+        return True
+
+
+def run_scenario(client, style, users, size, sessions):
+    """`users` concurrent users each running `sessions` sessions; returns per-stage stats"""
+    csv_contents = STYLES[style][2](size).to_csv(index=False).encode()
+    lock = threading.Lock()
+    latencies = {stage: [] for stage in STAGES}
+    errors = {stage: 0 for stage in STAGES}
+
+    def record(stage, seconds, ok):
+        with lock:
+            if ok:
+                latencies[stage].append(seconds)
+            else:
+                errors[stage] += 1
+
+    def user():
+        for _ in range(sessions):
+            Session(client, csv_contents, style).run(record)
+
+    threads = [threading.Thread(target=user) for _ in range(users)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+
+    stages = {}
+    for stage in STAGES:
+        done = latencies[stage]
+        attempts = len(done) + errors[stage]
+        stages[stage] = {
+            "requests": attempts,
+            "p50": percentile(done, 50),
+            "p95": percentile(done, 95),
+            "p99": percentile(done, 99),
+            "requests_per_second": round(len(done) / elapsed, 3),
+            "error_rate": round(errors[stage] / attempts, 4) if attempts else None,
+        }
+    return {
+        "style": style,
+        "users": users,
+        "rows": size,
+        "seconds": round(elapsed, 3),
+        "sessions_per_second": round(len(latencies["download"]) / elapsed, 3),
+        "labels_per_second": round(len(latencies["download"]) * size / elapsed, 1),
+        "stages": stages,
+    }
+
+
+def _ms(value):
+    return f"{value * 1000:9.1f}" if value is not None else f"{'-':>9}"
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Headless load test of the Dash callback sequence")
+    parser.add_argument("--users", default="1,4,8", help="comma-separated concurrent user counts")
+    parser.add_argument("--sizes", default="100,1000", help="comma-separated rows per uploaded CSV")
+    parser.add_argument("--sessions", type=int, default=5, help="sessions per user in each scenario")
+    parser.add_argument("--style", choices=list(STYLES), default="biomass", help="label style to upload")
+    parser.add_argument("--port", type=int, help="test a server already running on this local port")
+    parser.add_argument("--timeout", type=int, default=300, help="per-request timeout in seconds")
+    parser.add_argument("-o", "--output", default="callback_loadtest_results.json")
+    args = parser.parse_args(argv)
+
+    output = os.path.abspath(args.output)
+    port = args.port or start_local_server()
+    client = DashClient(port, timeout=args.timeout)
+
+    results = []
+    for size in [int(s) for s in args.sizes.split(",") if s.strip()]:
+        for users in [int(u) for u in args.users.split(",") if u.strip()]:
+            result = run_scenario(client, args.style, users, size, args.sessions)
+            results.append(result)
+            print(f"{users} users x {size} rows: {result['sessions_per_second']:.2f} sessions/s, "
+                  f"{result['labels_per_second']:.1f} labels/s")
+            print(f"{'stage':>10} {'requests':>9} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'req/s':>8} {'errors':>7}")
+            for stage, stats in result["stages"].items():
+                error_rate = f"{stats['error_rate']:.1%}" if stats["error_rate"] is not None else "-"
+                print(f"{stage:>10} {stats['requests']:>9} {_ms(stats['p50'])} {_ms(stats['p95'])} "
+                      f"{_ms(stats['p99'])} {stats['requests_per_second']:>8.2f} {error_rate:>7}")
+
+    with open(output, "w") as f:
+        json.dump({"args": vars(args), "results": results}, f, indent=2)
+    print(f"Results written to {output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,13 +1,226 @@
 import os
+import uuid
 import base64
-import io
+import dash
 import pandas as pd
 from datetime import datetime
-from dash import Input, Output, State, callback_context, dash_table, html, dcc
+from dash import Input, Output, State, ClientsideFunction, Patch, callback_context, dash_table, html, dcc
 from dash.exceptions import PreventUpdate
 import dash_bootstrap_components as dbc
 
-from utils import create_qr_pdf, create_biomass_pdf, create_line_pdf, create_qr_dataframe
+import admission
+import ingest
+import jobs
+import metrics
+import preview
+import profiling
+import render_pool
+import retention
+import short_ids
+import uploads
+import validation
+import zpl
+from layout import SYMBOL_TYPE_OPTIONS
+from utils import create_qr_dataframe, label_rows, output_extension, select_generator
+
+
+def _generated_text(df, label_options):
+    """Summary line for a finished job, counting copies when there are any"""
+    printed = sum(n for _, n in label_rows(df, label_options.get("copies", 1)))
+    if printed == len(df):
+        return f"Generated {len(df)} labels"
+    return f"Generated {len(df)} labels ({printed} with copies)"
+
+
+def _output_filename(prefix, label_options):
+    """Timestamped output name; the random suffix keeps jobs started in the same second apart"""
+    timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+    return f"{prefix}_{timestamp}_{uuid.uuid4().hex[:6]}{output_extension(label_options)}"
+
+
+def _with_short_codes(df, label_options):
+    """Swap full IDs for registry short codes inside the symbols, when the job asks for them"""
+    if not label_options.get("short_ids"):
+        return df
+    with metrics.stage_timer("short_codes"):
+        return short_ids.assign_codes(df, label_options["style"], label_options["short_ids"])
+
+
+def _stored_output(filename, pdf_storage):
+    """Bytes of a generated file (in memory on Render, else in labels_pdf/), or None when gone"""
+    if os.environ.get('RENDER'):
+        return pdf_storage.get(filename)
+    path = os.path.join("labels_pdf", filename)
+    if not os.path.exists(path):
+        return None
+    with open(path, "rb") as f:
+        return f.read()
+
+
+# Rows per page of the data viewer. Chunked uploads stay on the server
+# (uploads.table) and the viewer asks for one page at a time.
+VIEWER_PAGE_SIZE = 10
+
+
+def _server_table(upload_id, df, label_options=None):
+    """What the browser keeps of an upload held on the server: its id and the counts the
+    render estimate needs (assets/job_estimate.js) instead of the rows"""
+    fixed_pages, default_rows = admission.page_counts(df)
+    stored = {"upload_id": upload_id, "rows": len(df), "fixed_pages": fixed_pages, "default_rows": default_rows}
+    if label_options:
+        stored["symbol_chars"] = admission.symbol_chars(df, dict(label_options, short_ids=None))
+    return stored
+
+
+def _job_frame(csv_data):
+    """Rows of the job: sent by the browser, or resolved from an upload held on the server"""
+    if isinstance(csv_data, dict):
+        try:
+            return uploads.table(csv_data["upload_id"])
+        except uploads.UploadNotFound:
+            raise ValueError("The uploaded table has expired, please upload the file again")
+    return pd.DataFrame(csv_data)
+
+
+def _upload_outputs(df, filename, upload_id=None):
+    """Outputs shown after a file was uploaded and parsed (shared by both upload paths)"""
+    feedback = dbc.Alert([
+        html.I(className="fas fa-check-circle me-2"),
+        f"Successfully uploaded {filename} with {len(df)} rows"
+    ], color="success")
+
+    preview = html.Div([
+        html.H6("Data Preview (first 10 rows):", style={"color": "#2c3e50", "font-size": "0.9rem"}),
+        dash_table.DataTable(
+            data=df.head(10).to_dict('records'),
+            columns=[{"name": i, "id": i} for i in df.columns],
+            style_cell={
+                'textAlign': 'left', 
+                'padding': '8px',
+                'fontSize': '12px',
+                'fontFamily': 'inherit'
+            },
+            style_header={
+                'backgroundColor': '#f8f9fa', 
+                'color': '#495057', 
+                'fontWeight': '600',
+                'border': '1px solid #dee2e6'
+            },
+            style_data={
+                'backgroundColor': 'white',
+                'border': '1px solid #dee2e6'
+            }
+        )
+    ])
+
+    # CSV Viewer content
+    csv_viewer = html.Div([
+        html.H6(f"{filename}", style={"color": "#2c3e50", "margin-bottom": "0.5rem", "font-size": "0.9rem"}),
+        html.P(f"{len(df)} rows × {len(df.columns)} columns"
+               + (f" · first {VIEWER_PAGE_SIZE} shown until the data is loaded" if upload_id else ""),
+              style={"color": "#6c757d", "margin-bottom": "1rem", "font-size": "0.8rem"}),
+        dash_table.DataTable(
+            data=(df.head(VIEWER_PAGE_SIZE) if upload_id else df).to_dict('records'),
+            columns=[{"name": i, "id": i} for i in df.columns],
+            style_cell={
+                'textAlign': 'left', 
+                'padding': '6px', 
+                'fontSize': '11px',
+                'fontFamily': 'inherit'
+            },
+            style_header={
+                'backgroundColor': '#f8f9fa', 
+                'color': '#495057', 
+                'fontWeight': '600',
+                'border': '1px solid #dee2e6'
+            },
+            style_data={
+                'backgroundColor': 'white',
+                'border': '1px solid #dee2e6'
+            },
+            page_size=VIEWER_PAGE_SIZE,
+            sort_action="native",
+            filter_action="native"
+        )
+    ])
+
+    stored = _server_table(upload_id, df) if upload_id else df.to_dict('records')
+    return feedback, preview, False, stored, csv_viewer, {"display": "block"}
+
+
+# Names and icons of the output formats in the PDF pane
+OUTPUT_FORMAT_NAMES = {"pdf": "PDF", "zpl": "ZPL", "tiff": "TIFF", "png": "PNG"}
+OUTPUT_FORMAT_ICONS = {"pdf": "fas fa-file-pdf", "zpl": "fas fa-print", "tiff": "fas fa-file-image",
+                       "png": "fas fa-file-archive"}
+
+
+# With previews on, "Generate" shows the first labels and the full job renders
+# from the preview's confirm button
+RENDER_BUTTON = "confirm-render-btn" if preview.LABELS > 0 else "generate-pdf-btn"
+
+
+def _preview_pane(df, label_options, thumbnails, cost):
+    """Viewer pane with label thumbnails and the button that renders the whole job"""
+    format_name = OUTPUT_FORMAT_NAMES.get(label_options["output_format"], "PDF")
+    reason = admission.over_budget(cost)
+    figures = [
+        html.Figure([
+            html.Img(src=src, alt=f"Label {number}",
+                     style={"max-width": "100%", "max-height": "160px", "border": "1px solid #dee2e6",
+                            "background-color": "#ffffff"}),
+            html.Figcaption(f"#{number}" + (f" ×{copies}" if copies > 1 else ""),
+                            style={"color": "#6c757d", "font-size": "0.75rem"})
+        ], className="m-2 text-center", style={"width": "150px"})
+        for number, copies, src in thumbnails
+    ]
+    return html.Div([
+        html.H6(f"Preview: first {len(thumbnails)} of {len(df)} labels",
+                style={"color": "#2c3e50", "margin-bottom": "1rem", "font-size": "0.9rem"}),
+        html.Div(figures, className="d-flex flex-wrap justify-content-center"),
+        html.Div([
+            dbc.Button(
+                [html.I(className="fas fa-check me-2"), f"Render all {len(df)} labels as {format_name}"],
+                id="confirm-render-btn", color="primary", disabled=bool(reason),
+                style={"border-radius": "8px", "font-weight": "500"}
+            ),
+            html.P(reason or (f"Estimated {admission.describe_seconds(cost['seconds'])}, "
+                              f"{admission.describe_bytes(cost['bytes'])}. "
+                              "Fix the table and click Generate again if the layout is wrong."),
+                   className="mt-2 mb-0",
+                   style={"color": "#dc3545" if reason else "#6c757d", "font-size": "0.8rem"})
+        ], className="text-center mt-2")
+    ], style={
+        "border": "2px dashed #dee2e6",
+        "border-radius": "10px",
+        "background-color": "#f8f9fa",
+        "padding": "1rem"
+    })
+
+
+def _symbol_type(value):
+    """2D symbol for QR and line labels (they have no room for a barcode)"""
+    return "datamatrix" if value == "datamatrix" else "qr"
+
+
+def _preflight_alert(issues):
+    """Pre-flight issues as an alert (red when rendering is blocked), or None"""
+    if not issues:
+        return None
+    items = []
+    for issue in issues:
+        text = issue["message"]
+        if issue["rows"]:
+            more = ", ..." if issue["count"] > len(issue["rows"]) else ""
+            text += f" — {issue['count']} row(s): {', '.join(map(str, issue['rows']))}{more}"
+        items.append(html.Li(text))
+    blocked = validation.has_errors(issues)
+    return dbc.Alert([
+        html.Div([
+            html.I(className="fas fa-times-circle me-2" if blocked else "fas fa-exclamation-triangle me-2"),
+            "Please fix these problems before generating the PDF:" if blocked else "Pre-flight check warnings:"
+        ]),
+        html.Ul(items, className="mb-0 mt-1", style={"font-size": "0.8rem"})
+    ], color="danger" if blocked else "warning", className="py-2")
 
 
 def register_callbacks(app, pdf_storage):
@@ -35,32 +248,42 @@ def register_callbacks(app, pdf_storage):
             return not is_open
         return is_open
 
-    # Upload style options callback
+    # Upload style options callback: biomass labels can also print Code128
+    # barcodes, QR and line labels only have room for 2D symbols
     @app.callback(
-        Output("upload-biomass-options", "style"),
-        [Input("upload-label-style", "value")]
+        [Output("upload-biomass-output-type", "options"),
+         Output("upload-biomass-output-type", "value")],
+        [Input("upload-label-style", "value")],
+        [State("upload-biomass-output-type", "value")]
     )
-    def toggle_upload_biomass_options(style):
+    def toggle_upload_biomass_options(style, current):
         if style == "biomass":
-            return {"display": "block"}
-        return {"display": "none"}
+            return SYMBOL_TYPE_OPTIONS["biomass"], "datamatrix" if current == "datamatrix" else "barcode"
+        return SYMBOL_TYPE_OPTIONS["qr"], "datamatrix" if current == "datamatrix" else "qr"
 
     # Callback to show/hide sections based on label style
     @app.callback(
         [Output("modal-qr-section", "style"),
-         Output("modal-biomass-section", "style")],
-        [Input("label-style", "value")]
+         Output("modal-biomass-section", "style"),
+         Output("modal-biomass-output-type", "options"),
+         Output("modal-biomass-output-type", "value")],
+        [Input("label-style", "value")],
+        [State("modal-biomass-output-type", "value")]
     )
-    def toggle_sections(label_style):
+    def toggle_sections(label_style, current):
         if label_style == "qr":
-            return {"display": "block"}, {"display": "none"}
-        else:  # For both "barcode" (biomass) and "line" styles
-            return {"display": "none"}, {"display": "block"}
+            return {"display": "block"}, {"display": "none"}, dash.no_update, dash.no_update
+        elif label_style == "line":
+            value = "datamatrix" if current == "datamatrix" else "qr"
+            return {"display": "none"}, {"display": "block"}, SYMBOL_TYPE_OPTIONS["qr"], value
+        value = current or "barcode"
+        return {"display": "none"}, {"display": "block"}, SYMBOL_TYPE_OPTIONS["biomass"], value
 
-    # Callback for adding biomass rows
+    # Adding rows sends only the new row(s) to the browser as a Patch, instead
+    # of round-tripping the whole table; the store and row count follow the
+    # table (including edits and deletions) on the client side
     @app.callback(
-        [Output("modal-biomass-table-container", "children"),
-         Output("biomass-data-store", "data"),
+        [Output("modal-biomass-table", "data"),
          Output("modal-biomass-info1", "value"),
          Output("modal-biomass-info2", "value"),
          Output("modal-biomass-info3", "value"),
@@ -69,54 +292,51 @@ def register_callbacks(app, pdf_storage):
         [State("modal-biomass-info1", "value"),
          State("modal-biomass-info2", "value"),
          State("modal-biomass-info3", "value"),
-         State("modal-biomass-ucode", "value"),
-         State("biomass-data-store", "data")]
+         State("modal-biomass-ucode", "value")],
+        prevent_initial_call=True
     )
-    def add_biomass_row(n_clicks, info1, info2, info3, ucode, stored_data):
+    def add_biomass_row(n_clicks, info1, info2, info3, ucode):
         if not n_clicks or not info1:
-            if stored_data:
-                # Show existing table
-                table = dash_table.DataTable(
-                    data=stored_data,
-                    columns=[
-                        {"name": "Info 1", "id": "info1"},
-                        {"name": "Info 2", "id": "info2"},
-                        {"name": "Info 3", "id": "info3"},
-                        {"name": "Unique Code", "id": "ucode"}
-                    ],
-                    editable=True,
-                    row_deletable=True,
-                    style_cell={'textAlign': 'left'},
-                    style_header={'backgroundColor': 'rgb(230, 230, 230)', 'fontWeight': 'bold'}
-                )
-                return table, stored_data, info1 or "", info2 or "", info3 or "", ucode or ""
-            return html.Div("No data added yet."), [], "", "", "", ""
-            
-        stored_data = stored_data or []
-        new_row = {
+            raise PreventUpdate
+        rows = Patch()
+        rows.append({
             "info1": info1 or "",
             "info2": info2 or "",
             "info3": info3 or "",
             "ucode": ucode or ""
-        }
-        stored_data.append(new_row)
-        
-        # Create table
-        table = dash_table.DataTable(
-            data=stored_data,
-            columns=[
-                {"name": "Info 1", "id": "info1"},
-                {"name": "Info 2", "id": "info2"},
-                {"name": "Info 3", "id": "info3"},
-                {"name": "Unique Code", "id": "ucode"}
-            ],
-            editable=True,
-            row_deletable=True,
-            style_cell={'textAlign': 'left'},
-            style_header={'backgroundColor': 'rgb(230, 230, 230)', 'fontWeight': 'bold'}
-        )
-        
-        return table, stored_data, "", "", "", ""
+        })
+        return rows, "", "", "", ""
+
+    # Bulk paste: every pasted row is appended in one update
+    @app.callback(
+        [Output("modal-biomass-table", "data", allow_duplicate=True),
+         Output("modal-biomass-paste", "value"),
+         Output("modal-paste-feedback", "children")],
+        [Input("modal-paste-rows-btn", "n_clicks")],
+        [State("modal-biomass-paste", "value")],
+        prevent_initial_call=True
+    )
+    def paste_biomass_rows(n_clicks, text):
+        if not n_clicks or not text:
+            raise PreventUpdate
+        new_rows, skipped = ingest.parse_pasted_rows(text)
+        feedback = f"Added {len(new_rows)} rows"
+        if skipped:
+            feedback += f", skipped {skipped} without Info 1"
+        if not new_rows:
+            return dash.no_update, dash.no_update, feedback
+        rows = Patch()
+        rows.extend(new_rows)
+        return rows, "", feedback
+
+    app.clientside_callback(
+        ClientsideFunction(namespace="labels", function_name="biomassRows"),
+        [Output("biomass-data-store", "data"),
+         Output("biomass-row-count", "data"),
+         Output("modal-biomass-empty", "style"),
+         Output("modal-biomass-table-container", "style")],
+        [Input("modal-biomass-table", "data")]
+    )
 
     # Callback to control the generate CSV button state
     @app.callback(
@@ -128,13 +348,13 @@ def register_callbacks(app, pdf_storage):
          Input("num-blocks", "value"),
          Input("treatments", "value"),
          Input("sampling-stage", "value"),
-         Input("biomass-data-store", "data")]
+         Input("biomass-row-count", "data")]
     )
     def control_generate_button(label_style, project_name, site_name, study_year, 
-                               num_blocks, treatments, sampling_stage, biomass_data):
+                               num_blocks, treatments, sampling_stage, biomass_rows):
         if label_style in ["barcode", "line"]:  # Biomass or Line mode
             # Enable button if there's biomass data
-            return not bool(biomass_data)
+            return not biomass_rows
         else:  # QR mode
             # Enable button if all required QR fields are filled
             required_fields = [project_name, site_name, study_year, num_blocks, treatments, sampling_stage]
@@ -160,77 +380,21 @@ def register_callbacks(app, pdf_storage):
             return "", "", True, None, default_csv_viewer, {"display": "none"}
         
         try:
-            content_type, content_string = contents.split(',')
-            decoded = base64.b64decode(content_string)
+            with metrics.stage_timer("upload_decode"):
+                content_type, content_string = contents.split(',')
+                decoded = base64.b64decode(content_string)
             
-            if filename.endswith('.csv'):
-                # Read CSV with all columns as strings to preserve leading zeros
-                df = pd.read_csv(io.StringIO(decoded.decode('utf-8')), dtype=str)
-                
-                feedback = dbc.Alert([
-                    html.I(className="fas fa-check-circle me-2"),
-                    f"Successfully uploaded {filename} with {len(df)} rows"
-                ], color="success")
-                
-                preview = html.Div([
-                    html.H6("Data Preview (first 10 rows):", style={"color": "#2c3e50", "font-size": "0.9rem"}),
-                    dash_table.DataTable(
-                        data=df.head(10).to_dict('records'),
-                        columns=[{"name": i, "id": i} for i in df.columns],
-                        style_cell={
-                            'textAlign': 'left', 
-                            'padding': '8px',
-                            'fontSize': '12px',
-                            'fontFamily': 'inherit'
-                        },
-                        style_header={
-                            'backgroundColor': '#f8f9fa', 
-                            'color': '#495057', 
-                            'fontWeight': '600',
-                            'border': '1px solid #dee2e6'
-                        },
-                        style_data={
-                            'backgroundColor': 'white',
-                            'border': '1px solid #dee2e6'
-                        }
-                    )
-                ])
-                
-                # CSV Viewer content
-                csv_viewer = html.Div([
-                    html.H6(f"{filename}", style={"color": "#2c3e50", "margin-bottom": "0.5rem", "font-size": "0.9rem"}),
-                    html.P(f"{len(df)} rows × {len(df.columns)} columns", 
-                          style={"color": "#6c757d", "margin-bottom": "1rem", "font-size": "0.8rem"}),
-                    dash_table.DataTable(
-                        data=df.to_dict('records'),
-                        columns=[{"name": i, "id": i} for i in df.columns],
-                        style_cell={
-                            'textAlign': 'left', 
-                            'padding': '6px', 
-                            'fontSize': '11px',
-                            'fontFamily': 'inherit'
-                        },
-                        style_header={
-                            'backgroundColor': '#f8f9fa', 
-                            'color': '#495057', 
-                            'fontWeight': '600',
-                            'border': '1px solid #dee2e6'
-                        },
-                        style_data={
-                            'backgroundColor': 'white',
-                            'border': '1px solid #dee2e6'
-                        },
-                        page_size=10,
-                        sort_action="native",
-                        filter_action="native"
-                    )
-                ])
+            if ingest.is_supported(filename):
+                # CSV is read as strings to preserve leading zeros; Parquet, Arrow
+                # and Excel keep their types and only load template columns
+                with metrics.stage_timer("upload_parse"):
+                    df = ingest.read_table(decoded, filename)
                 
-                return feedback, preview, False, df.to_dict('records'), csv_viewer, {"display": "block"}
+                return _upload_outputs(df, filename)
             else:
                 return dbc.Alert([
                     html.I(className="fas fa-exclamation-triangle me-2"),
-                    "Please upload a CSV file"
+                    f"Please upload a {ingest.SUPPORTED_DESCRIPTION} file"
                 ], color="danger"), "", True, None, default_csv_viewer, {"display": "none"}
                 
         except Exception as e:
@@ -239,6 +403,51 @@ def register_callbacks(app, pdf_storage):
                 f"Error processing file: {str(e)}"
             ], color="danger"), "", True, None, default_csv_viewer, {"display": "none"}
 
+    # Chunked upload state and progress are tracked in the browser
+    # (assets/chunked_upload.js) and only hit the server once parsing is done
+    app.clientside_callback(
+        ClientsideFunction(namespace="labels", function_name="chunkedUploadState"),
+        Output("chunked-upload-state", "data"),
+        [Input("chunked-upload-poll", "n_intervals")]
+    )
+
+    app.clientside_callback(
+        ClientsideFunction(namespace="labels", function_name="chunkedUploadProgress"),
+        [Output("chunked-upload-progress", "value"),
+         Output("chunked-upload-progress", "label"),
+         Output("chunked-upload-progress", "style")],
+        [Input("chunked-upload-state", "data")]
+    )
+
+    # Load a chunked upload once the server finished parsing it
+    @app.callback(
+        [Output("upload-feedback", "children", allow_duplicate=True),
+         Output("upload-data-preview", "children", allow_duplicate=True),
+         Output("load-csv-btn", "disabled", allow_duplicate=True),
+         Output("stored-data", "data", allow_duplicate=True),
+         Output("csv-viewer-content", "children", allow_duplicate=True),
+         Output("upload-options", "style", allow_duplicate=True)],
+        [Input("chunked-upload-state", "data")],
+        prevent_initial_call=True
+    )
+    def load_chunked_upload(upload_state):
+        if not upload_state or upload_state.get("status") not in ("done", "error"):
+            raise PreventUpdate
+        
+        if upload_state["status"] == "error":
+            return dbc.Alert([
+                html.I(className="fas fa-times-circle me-2"),
+                f"Error uploading file: {upload_state.get('error')}"
+            ], color="danger"), "", True, None, dash.no_update, {"display": "none"}
+        
+        try:
+            df, filename = uploads.load_parsed(upload_state.get("upload_id"))
+        except uploads.UploadNotFound:
+            # Already loaded (e.g. the state was re-sent)
+            raise PreventUpdate
+        # The table stays on the server; the browser keeps its id and a page of rows
+        return _upload_outputs(df, filename, upload_state["upload_id"])
+
     # CSV generation callbacks
     @app.callback(
         [Output("csv-viewer-content", "children", allow_duplicate=True),
@@ -257,19 +466,27 @@ def register_callbacks(app, pdf_storage):
          State("biomass-data-store", "data"),
          State("stored-data", "data"),
          State("upload-label-style", "value"),
-         State("upload-biomass-output-type", "value")],
+         State("upload-biomass-output-type", "value"),
+         State("symbol-content", "value"),
+         State("upload-symbol-content", "value"),
+         State("modal-biomass-output-type", "value"),
+         State("modal-qr-output-type", "value")],
         prevent_initial_call=True
     )
+    @metrics.timed("csv_generate")
     def generate_csv_data(modal_clicks, upload_clicks, 
                          project_name, site_name, study_year, num_blocks, treatments,
                          sampling_stage, label_style, biomass_data, uploaded_data,
-                         upload_label_style, upload_biomass_output_type):
+                         upload_label_style, upload_biomass_output_type,
+                         symbol_content, upload_symbol_content,
+                         biomass_output_type, qr_output_type):
         
         ctx = callback_context
         if not ctx.triggered:
             return None, None, None, True
         
         button_id = ctx.triggered[0]['prop_id'].split('.')[0]
+        upload_id = None
         
         try:
             if button_id == "modal-generate-csv-btn":
@@ -279,9 +496,9 @@ def register_callbacks(app, pdf_storage):
                         # Generate CSV data from manual biomass input
                         df = pd.DataFrame(biomass_data)
                         if label_style == "line":
-                            label_options = {"style": "line", "output_type": "qr"}
+                            label_options = {"style": "line", "output_type": _symbol_type(biomass_output_type)}
                         else:
-                            label_options = {"style": "biomass", "output_type": "barcode"}
+                            label_options = {"style": "biomass", "output_type": biomass_output_type or "barcode"}
                     else:
                         # No biomass data added yet
                         return dbc.Alert([
@@ -298,30 +515,56 @@ def register_callbacks(app, pdf_storage):
                     
                     df = create_qr_dataframe(project_name, site_name, study_year, num_blocks, 
                                            treatments, sampling_stage)
-                    label_options = {"style": "qr", "output_type": "qr"}
+                    label_options = {"style": "qr", "output_type": _symbol_type(qr_output_type)}
+                
+                # Encode registry short codes instead of full IDs
+                if symbol_content in short_ids.SCHEMES:
+                    label_options["short_ids"] = symbol_content
                 
             elif button_id == "load-csv-btn" and uploaded_data:
-                # Load uploaded CSV data
-                df = pd.DataFrame(uploaded_data)
-                if upload_label_style == "line":
-                    label_options = {"style": "line", "output_type": "qr"}
+                # Load uploaded CSV data (chunked uploads are held on the server)
+                df = _job_frame(uploaded_data)
+                if isinstance(uploaded_data, dict):
+                    upload_id = uploaded_data["upload_id"]
+                if upload_label_style in ("line", "qr", None):
+                    label_options = {"style": upload_label_style or "qr",
+                                     "output_type": _symbol_type(upload_biomass_output_type)}
                 else:
                     label_options = {
                         "style": upload_label_style or "qr",
                         "output_type": upload_biomass_output_type or "barcode"
                     }
+                if upload_symbol_content in short_ids.SCHEMES:
+                    label_options["short_ids"] = upload_symbol_content
                 
             else:
                 return None, None, None, True
             
+            # Check the data against the label template before anything is rendered
+            issues = validation.preflight(df, label_options)
+            
+            # Tables held on the server are paged from there; the browser gets one page
+            if upload_id:
+                csv_data = _server_table(upload_id, df, label_options)
+                table_data = df.head(VIEWER_PAGE_SIZE).to_dict('records')
+                paging = {"page_action": "custom", "page_current": 0,
+                          "page_count": max(-(-len(df) // VIEWER_PAGE_SIZE), 1)}
+            else:
+                csv_data = df.to_dict('records')
+                table_data = csv_data
+                paging = {"sort_action": "native", "filter_action": "native"}
+            
             # Create CSV viewer for generated data
             csv_viewer = html.Div([
+                _preflight_alert(issues),
                 html.H6("CSV Data Ready", style={"color": "#28a745", "margin-bottom": "0.5rem", "font-size": "0.9rem"}),
-                html.P(f"{len(df)} rows × {len(df.columns)} columns", 
+                html.P(f"{len(df)} rows × {len(df.columns)} columns · click a cell to fix a value before generating", 
                       style={"color": "#6c757d", "margin-bottom": "1rem", "font-size": "0.8rem"}),
                 dash_table.DataTable(
-                    data=df.to_dict('records'),
+                    id="csv-data-table",
+                    data=table_data,
                     columns=[{"name": i, "id": i} for i in df.columns],
+                    editable=True,
                     style_cell={
                         'textAlign': 'left', 
                         'padding': '6px', 
@@ -338,13 +581,12 @@ def register_callbacks(app, pdf_storage):
                         'backgroundColor': 'white',
                         'border': '1px solid #dee2e6'
                     },
-                    page_size=10,
-                    sort_action="native",
-                    filter_action="native"
+                    page_size=VIEWER_PAGE_SIZE,
+                    **paging
                 )
             ])
             
-            return csv_viewer, df.to_dict('records'), label_options, False
+            return csv_viewer, csv_data, label_options, validation.has_errors(issues)
             
         except Exception as e:
             return dbc.Alert([
@@ -352,10 +594,51 @@ def register_callbacks(app, pdf_storage):
                 f"Error generating CSV: {str(e)}"
             ], color="danger"), None, None, True
             
+    # Edits in the data viewer feed back into the data used for PDF generation;
+    # rows that did not change are then spliced from the page fragment cache
+    @app.callback(
+        Output("current-csv-data", "data", allow_duplicate=True),
+        [Input("csv-data-table", "data_timestamp")],
+        [State("csv-data-table", "data"),
+         State("csv-data-table", "page_current"),
+         State("current-csv-data", "data")],
+        prevent_initial_call=True
+    )
+    def sync_edited_csv_data(data_timestamp, table_data, page_current, csv_data):
+        if not data_timestamp or table_data is None:
+            raise PreventUpdate
+        if not isinstance(csv_data, dict):
+            return table_data
+        # Server-held table: record the edited page there and mark the job data as changed
+        try:
+            changed = uploads.edit_rows(csv_data["upload_id"], (page_current or 0) * VIEWER_PAGE_SIZE,
+                                        table_data)
+        except uploads.UploadNotFound:
+            raise PreventUpdate
+        if not changed:
+            raise PreventUpdate
+        return dict(csv_data, edits=csv_data.get("edits", 0) + changed)
+
+    # Pages of a server-held table, fetched as the viewer moves through it
+    @app.callback(
+        Output("csv-data-table", "data"),
+        [Input("csv-data-table", "page_current")],
+        [State("current-csv-data", "data")],
+        prevent_initial_call=True
+    )
+    def page_server_table(page_current, csv_data):
+        if not isinstance(csv_data, dict):
+            raise PreventUpdate
+        start = (page_current or 0) * VIEWER_PAGE_SIZE
+        try:
+            return uploads.table_rows(csv_data["upload_id"], start, start + VIEWER_PAGE_SIZE)
+        except uploads.UploadNotFound:
+            raise PreventUpdate
+
     # Loading overlay control callback
     @app.callback(
         Output("loading-overlay", "style"),
-        [Input("generate-pdf-btn", "n_clicks")],
+        [Input(RENDER_BUTTON, "n_clicks")],
         prevent_initial_call=True
     )
     def show_loading(n_clicks):
@@ -363,54 +646,128 @@ def register_callbacks(app, pdf_storage):
             return {"display": "block"}  # Show loading overlay
         return {"display": "none"}
 
+    # Preview callback: thumbnails of the first labels, the full job waits for confirmation
+    if preview.LABELS > 0:
+        @app.callback(
+            [Output("pdf-viewer-content", "children", allow_duplicate=True),
+             Output("results-area", "children", allow_duplicate=True),
+             Output("current-job-id", "data", allow_duplicate=True)],
+            [Input("generate-pdf-btn", "n_clicks")],
+            [State("current-csv-data", "data"),
+             State("current-label-options", "data"),
+             State("output-format", "value"),
+             State("label-copies", "value")],
+            prevent_initial_call=True
+        )
+        def preview_labels(n_clicks, csv_data, label_options, output_format, copies):
+            if not n_clicks or not csv_data or not label_options:
+                raise PreventUpdate
+            
+            try:
+                df = _job_frame(csv_data)
+                label_options = dict(label_options, output_format=output_format or "pdf", copies=copies or 1)
+                
+                # Same pre-flight check as the full render; warnings are shown with the preview
+                issues = validation.preflight(df, label_options)
+                if validation.has_errors(issues):
+                    return None, _preflight_alert(issues), None
+                
+                # In the render process the full render of this sheet will use, so it
+                # finds the preview's symbols cached; only the previewed rows are sent there
+                thumbnails = render_pool.call(preview.render_preview, df.head(preview.LABELS), label_options,
+                                              affinity=jobs.sheet_key(df, label_options))
+                pane = _preview_pane(df, label_options, thumbnails, admission.estimate(df, label_options))
+                return pane, _preflight_alert(issues), None
+                
+            except Exception as e:
+                error_alert = dbc.Alert([
+                    html.I(className="fas fa-times-circle me-2"),
+                    f"Error generating preview: {str(e)}"
+                ], color="danger")
+                return None, error_alert, None
+
     # PDF generation callback
     @app.callback(
         [Output("pdf-viewer-content", "children"),
          Output("results-area", "children"),
-         Output("loading-overlay", "style", allow_duplicate=True)],
-        [Input("generate-pdf-btn", "n_clicks")],
+         Output("loading-overlay", "style", allow_duplicate=True),
+         Output("current-job-id", "data")],
+        [Input(RENDER_BUTTON, "n_clicks")],
         [State("current-csv-data", "data"),
-         State("current-label-options", "data")],
+         State("current-label-options", "data"),
+         State("url", "search"),
+         State("output-format", "value"),
+         State("pdf-profile", "value"),
+         State("label-copies", "value")],
         prevent_initial_call=True
     )
-    def generate_pdf_from_csv(n_clicks, csv_data, label_options):
+    def generate_pdf_from_csv(n_clicks, csv_data, label_options, search, output_format, pdf_profile, copies):
         if not n_clicks or not csv_data or not label_options:
-            return None, None, {"display": "none"}
+            return None, None, {"display": "none"}, None
         
         try:
-            df = pd.DataFrame(csv_data)
-            timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+            df = _job_frame(csv_data)
+            label_options = dict(label_options, output_format=output_format or "pdf", pdf_profile=pdf_profile,
+                                 copies=copies or 1)
+            is_zpl = label_options["output_format"] == "zpl"
+            format_name = OUTPUT_FORMAT_NAMES.get(label_options["output_format"], "PDF")
+            
+            # Re-check edited data; errors stop the job before rendering starts
+            issues = validation.preflight(df, label_options)
+            if validation.has_errors(issues):
+                return None, _preflight_alert(issues), {"display": "none"}, None
+            
+            # Predicted render cost, checked against the job budget and client limits
+            cost = admission.estimate(df, label_options)
+            
+            # Renders of this sheet go to the same render worker, which has its pages cached
+            affinity = jobs.sheet_key(df, label_options)
             
-            # Generate PDF based on options
-            if label_options["style"] == "biomass":
-                if label_options["output_type"] == "qr":
-                    pdf_filename = f"biomass_qr_labels_{timestamp}.pdf"
-                    pdf_result = create_biomass_pdf(df, pdf_filename, use_qr=True)
+            # Swap full IDs for registry short codes inside the symbols
+            df = _with_short_codes(df, label_options)
+            
+            # Pick the generator based on options
+            prefix, generator, generator_kwargs = select_generator(label_options)
+            pdf_filename = _output_filename(prefix, label_options)
+            
+            # Generate PDF (or ZPL), under cProfile when requested (?profile=1 or LABELS_PROFILE=1)
+            profile_filename = None
+            with admission.admit(cost):
+                if profiling.profiling_requested(search):
+                    pdf_result, profile_filename = profiling.run_profiled(
+                        generator, df, pdf_filename, pdf_storage, **generator_kwargs)
                 else:
-                    pdf_filename = f"biomass_barcode_labels_{timestamp}.pdf"
-                    pdf_result = create_biomass_pdf(df, pdf_filename, use_qr=False)
-            elif label_options["style"] == "line":
-                pdf_filename = f"line_labels_{timestamp}.pdf"
-                pdf_result = create_line_pdf(df, pdf_filename)
-            else:
-                pdf_filename = f"qr_labels_{timestamp}.pdf"
-                pdf_result = create_qr_pdf(df, pdf_filename)
+                    pdf_result = render_pool.run(generator, df, pdf_filename, affinity=affinity,
+                                                 **generator_kwargs)
             
-            # Store PDF in memory for deployment
+            # Store PDF in memory for deployment; locally, let retention check labels_pdf/
             if os.environ.get('RENDER'):
-                pdf_storage[pdf_filename] = pdf_result
+                pdf_storage[pdf_filename] = pdf_result.getvalue()
+            else:
+                retention.notify()
+            
+            # Companion short code -> full row table for this sheet
+            lookup_filename = None
+            if label_options.get("short_ids"):
+                lookup_filename, lookup_result = short_ids.write_lookup(df, pdf_filename)
+                if os.environ.get('RENDER'):
+                    pdf_storage[lookup_filename] = lookup_result.getvalue()
+            
+            # Keep the job around so a subset of labels can be reprinted
+            job_id = jobs.register_job(df, label_options, pdf_filename)
             
             # Create PDF viewer content
             pdf_viewer = html.Div([
                 html.H6(f"{pdf_filename}", style={"color": "#2c3e50", "margin-bottom": "1rem", "font-size": "0.9rem"}),
                 html.Div([
                     html.Div([
-                        html.I(className="fas fa-file-pdf", style={"font-size": "3rem", "color": "#dc3545", "margin-bottom": "1rem"}),
-                        html.H6("PDF Generated Successfully", style={"color": "#2c3e50", "margin-bottom": "0.5rem"}),
-                        html.P(f"Generated {len(df)} labels", 
+                        html.I(className=OUTPUT_FORMAT_ICONS.get(label_options["output_format"], "fas fa-file-pdf"),
+                               style={"font-size": "3rem", "color": "#dc3545", "margin-bottom": "1rem"}),
+                        html.H6(f"{format_name} Generated Successfully", style={"color": "#2c3e50", "margin-bottom": "0.5rem"}),
+                        html.P(_generated_text(df, label_options), 
                               style={"color": "#6c757d", "margin-bottom": "1.5rem", "font-size": "0.9rem"}),
                         dbc.Button(
-                            [html.I(className="fas fa-download me-2"), "Download PDF"], 
+                            [html.I(className="fas fa-download me-2"), f"Download {format_name}"], 
                             id="download-pdf-btn",
                             color="primary", 
                             size="lg",
@@ -422,8 +779,34 @@ def register_callbacks(app, pdf_storage):
                                 href=f"/download/{pdf_filename}", 
                                 target="_blank",
                                 style={"color": "#6c757d", "text-decoration": "none", "font-size": "0.85rem"}
-                            )
-                        ], className="mt-2")
+                            ) if format_name == "PDF" else None,
+                            html.A(
+                                [html.I(className="fas fa-print me-1"), "Send to printer"],
+                                id="print-zpl-btn",
+                                href="#",
+                                style={"color": "#6c757d", "text-decoration": "none", "font-size": "0.85rem"}
+                            ) if is_zpl and zpl.PRINTER else None,
+                            html.A(
+                                [html.I(className="fas fa-stopwatch me-1"), "Download profile"],
+                                href=f"/download/{profile_filename}",
+                                className="ms-3",
+                                style={"color": "#6c757d", "text-decoration": "none", "font-size": "0.85rem"}
+                            ) if profile_filename else None,
+                            html.A(
+                                [html.I(className="fas fa-table me-1"), "Code lookup (CSV)"],
+                                href=f"/download/{lookup_filename}",
+                                className="ms-3",
+                                style={"color": "#6c757d", "text-decoration": "none", "font-size": "0.85rem"}
+                            ) if lookup_filename else None
+                        ], className="mt-2"),
+                        html.Div([
+                            dbc.InputGroup([
+                                dbc.Input(id="reprint-rows", placeholder="Reprint labels, e.g. 12-40, 57 or IDs"),
+                                dbc.Button("Reprint", id="reprint-btn", color="outline-secondary")
+                            ], size="sm"),
+                            html.Div(id="reprint-result", className="mt-2"),
+                            html.Div(id="print-result", className="mt-2")
+                        ], className="mt-3 mx-auto", style={"max-width": "340px"})
                     ], className="text-center", style={"padding": "2rem"})
                 ], style={
                     "border": "2px dashed #dee2e6",
@@ -433,7 +816,14 @@ def register_callbacks(app, pdf_storage):
             ])
             
             # Hide loading overlay when done and return results
-            return pdf_viewer, None, {"display": "none"}
+            return pdf_viewer, None, {"display": "none"}, job_id
+            
+        except admission.Rejected as e:
+            alert = dbc.Alert([
+                html.I(className="fas fa-hourglass-half me-2"),
+                str(e)
+            ], color="warning")
+            return None, alert, {"display": "none"}, None
             
         except Exception as e:
             error_alert = dbc.Alert([
@@ -442,52 +832,150 @@ def register_callbacks(app, pdf_storage):
             ], color="danger")
             
             # Hide loading overlay on error too
-            return None, error_alert, {"display": "none"}
+            return None, error_alert, {"display": "none"}, None
+
+    # Reprint callback: render only selected labels of the last job
+    @app.callback(
+        Output("reprint-result", "children"),
+        [Input("reprint-btn", "n_clicks")],
+        [State("reprint-rows", "value"),
+         State("current-job-id", "data")],
+        prevent_initial_call=True
+    )
+    def reprint_labels(n_clicks, selection, job_id):
+        if not n_clicks or not job_id:
+            raise PreventUpdate
+        
+        try:
+            rows, ids = jobs.split_selection(selection)
+            pdf_filename, pdf_result = jobs.render_reprint(job_id, rows=rows, ids=ids)
+            if os.environ.get('RENDER'):
+                pdf_storage[pdf_filename] = pdf_result.getvalue()
+            return html.A(
+                [html.I(className="fas fa-print me-1"), f"Open reprint ({pdf_filename})"],
+                href=f"/download/{pdf_filename}",
+                target="_blank",
+                style={"font-size": "0.85rem"}
+            )
+        except jobs.JobNotFound:
+            return dbc.Alert("This job has expired, please generate the PDF again.", color="warning",
+                             className="py-1 px-2 mb-0", style={"font-size": "0.85rem"})
+        except (admission.Rejected, ValueError) as e:
+            return dbc.Alert(str(e), color="warning", className="py-1 px-2 mb-0",
+                             style={"font-size": "0.85rem"})
+
+    # Send a ZPL job straight to the configured thermal printer
+    @app.callback(
+        Output("print-result", "children"),
+        [Input("print-zpl-btn", "n_clicks")],
+        [State("current-job-id", "data")],
+        prevent_initial_call=True
+    )
+    def print_labels(n_clicks, job_id):
+        if not n_clicks or not job_id:
+            raise PreventUpdate
+        
+        try:
+            labels, sent = jobs.send_to_printer(job_id)
+            return dbc.Alert(f"Sent {labels} labels ({sent:,} bytes) to {zpl.PRINTER}", color="success",
+                             className="py-1 px-2 mb-0", style={"font-size": "0.85rem"})
+        except jobs.JobNotFound:
+            return dbc.Alert("This job has expired, please generate the labels again.", color="warning",
+                             className="py-1 px-2 mb-0", style={"font-size": "0.85rem"})
+        except (ValueError, OSError) as e:
+            return dbc.Alert(f"Printing failed: {e}", color="danger", className="py-1 px-2 mb-0",
+                             style={"font-size": "0.85rem"})
+
+    @app.callback(
+        Output("generate-pdf-btn", "children"),
+        [Input("output-format", "value")]
+    )
+    def update_generate_label(output_format):
+        return f"Generate {OUTPUT_FORMAT_NAMES.get(output_format, 'PDF')}"
+
+    @app.callback(
+        Output("pdf-profile", "style"),
+        [Input("output-format", "value")]
+    )
+    def toggle_pdf_profile(output_format):
+        display = "inline-block" if (output_format or "pdf") == "pdf" else "none"
+        return {"width": "auto", "display": display}
+
+    # Render estimate next to the Generate button: the browser sends only the
+    # table's size (assets/job_estimate.js), the cost model does the rest
+    app.clientside_callback(
+        ClientsideFunction(namespace="labels", function_name="jobSummary"),
+        Output("job-summary", "data"),
+        [Input("current-csv-data", "data"),
+         Input("current-label-options", "data"),
+         Input("label-copies", "value")]
+    )
+
+    @app.callback(
+        [Output("job-estimate", "children"),
+         Output("job-estimate", "style")],
+        [Input("job-summary", "data"),
+         Input("output-format", "value")],
+        [State("current-label-options", "data")]
+    )
+    def show_job_estimate(summary, output_format, label_options):
+        style = {"color": "#6c757d", "font-size": "0.75rem"}
+        if not summary or not label_options:
+            return None, style
+        label_options = dict(label_options, output_format=output_format or "pdf")
+        cost = admission.estimate_counts(summary["rows"], summary["pages"], summary["symbol_chars"],
+                                         label_options)
+        reason = admission.over_budget(cost)
+        if reason:
+            return reason, dict(style, color="#dc3545")
+        return (f"Estimated {admission.describe_seconds(cost['seconds'])}, "
+                f"{admission.describe_bytes(cost['bytes'])}"), style
 
     # Download callback using Dash's dcc.Download
     @app.callback(
         Output("download-pdf", "data"),
         [Input("download-pdf-btn", "n_clicks")],
-        [State("current-csv-data", "data"),
-         State("current-label-options", "data")],
+        [State("current-job-id", "data"),
+         State("current-csv-data", "data"),
+         State("current-label-options", "data"),
+         State("output-format", "value"),
+         State("pdf-profile", "value"),
+         State("label-copies", "value")],
         prevent_initial_call=True
     )
-    def download_pdf(n_clicks, csv_data, label_options):
+    def download_pdf(n_clicks, job_id, csv_data, label_options, output_format, pdf_profile, copies):
         if not n_clicks or not csv_data or not label_options:
             return None
         
         try:
-            df = pd.DataFrame(csv_data)
-            timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-            
-            # Generate PDF based on options
-            if label_options["style"] == "biomass":
-                if label_options["output_type"] == "qr":
-                    pdf_filename = f"biomass_qr_labels_{timestamp}.pdf"
-                    pdf_result = create_biomass_pdf(df, pdf_filename, use_qr=True)
-                else:
-                    pdf_filename = f"biomass_barcode_labels_{timestamp}.pdf"
-                    pdf_result = create_biomass_pdf(df, pdf_filename, use_qr=False)
-            elif label_options["style"] == "line":
-                pdf_filename = f"line_labels_{timestamp}.pdf"
-                pdf_result = create_line_pdf(df, pdf_filename)
-            else:
-                pdf_filename = f"qr_labels_{timestamp}.pdf"
-                pdf_result = create_qr_pdf(df, pdf_filename)
+            # Send the file the job already generated (short codes and all)
+            pdf_filename, pdf_content = None, None
+            if job_id:
+                try:
+                    pdf_filename = jobs.get_job(job_id)["pdf_filename"]
+                    pdf_content = _stored_output(pdf_filename, pdf_storage)
+                except jobs.JobNotFound:
+                    pass
             
-            # For local development, read the file
-            if not os.environ.get('RENDER'):
-                # Read the PDF file that was saved locally
-                pdf_path = os.path.join("labels_pdf", pdf_filename)
-                if os.path.exists(pdf_path):
-                    with open(pdf_path, "rb") as f:
-                        pdf_content = f.read()
+            # Gone (expired job or retention sweep): render again like generate_pdf_from_csv
+            if pdf_content is None:
+                df = _job_frame(csv_data)
+                label_options = dict(label_options, output_format=output_format or "pdf",
+                                     pdf_profile=pdf_profile, copies=copies or 1)
+                cost = admission.estimate(df, label_options)
+                affinity = jobs.sheet_key(df, label_options)
+                df = _with_short_codes(df, label_options)
+                prefix, generator, generator_kwargs = select_generator(label_options)
+                pdf_filename = _output_filename(prefix, label_options)
+                with admission.admit(cost):
+                    pdf_result = render_pool.run(generator, df, pdf_filename, affinity=affinity,
+                                                 **generator_kwargs)
+                if os.environ.get('RENDER'):
+                    pdf_storage[pdf_filename] = pdf_result.getvalue()
                 else:
-                    return None
-            else:
-                # For deployment, use the in-memory PDF
-                pdf_content = pdf_storage.get(pdf_filename)
-                if not pdf_content:
+                    retention.notify()
+                pdf_content = _stored_output(pdf_filename, pdf_storage)
+                if pdf_content is None:
                     return None
             
             # Return the download data
@@ -0,0 +1,281 @@
+"""Behaviour checks for guarantees the rendering pipeline relies on.
+
+Each check exercises one claim end to end (for example that a compacted
+job table renders exactly like the table it came from) and fails with a
+message saying what differed.
+
+    python checks.py                      # every check
+    python checks.py compact_roundtrip    # selected checks
+    python checks.py --list
+
+Checks run offline inside a temporary working directory, so labels_pdf/
+output never touches the repository. The exit status is 1 when any check
+fails, which makes the script usable as a CI gate.
+"""
+import io
+import os
+import sys
+import argparse
+import tempfile
+import traceback
+
+import pandas as pd
+
+
+CHECKS = {}
+
+
+def check(func):
+    """Register a check; its docstring is the claim it verifies"""
+    CHECKS[func.__name__] = func
+    return func
+
+
+def _cells(df):
+    """Columns and cell values of a frame, telling None, NaN and text apart"""
+    def cell(value):
+        if value is None:
+            return ("None",)
+        if isinstance(value, float) and value != value:
+            return ("NaN",)
+        return (type(value).__name__, value)
+    return list(df.columns), [[cell(value) for value in df[column]] for column in df.columns]
+
+
+def _json_store_frame(n=40):
+    """A line/biomass table as generate_pdf_from_csv builds it from the Dash store (None for blanks)"""
+    records = [{"info1": f"P{i:04d}", "info2": f"Site-{i % 3}", "info3": f"2025-06-{1 + i % 28:02d}",
+                "ucode": None if i % 4 == 1 else f"U{i:04d}"} for i in range(n)]
+    return pd.DataFrame(records)
+
+
+@check
+def compact_roundtrip():
+    """dataset.expand(dataset.compact(df)) gives back the same cells, and the same page fragments"""
+    import dataset
+    import render_cache
+
+    frames = {
+        "json store": _json_store_frame(),
+        "csv": pd.read_csv(io.StringIO(_json_store_frame().to_csv(index=False)), dtype=str),
+    }
+    for name, df in frames.items():
+        restored = dataset.expand(dataset.compact(df))
+        if name == "json store":
+            assert _cells(restored) == _cells(df), f"{name} frame changed in the compact round trip"
+        else:
+            # read_csv's NaN blanks come back as None, like the JSON stores hold them
+            assert _cells(restored) == _cells(df.astype(object).where(df.notna(), None)), \
+                f"{name} frame changed in the compact round trip"
+
+    df = frames["json store"]
+    restored = dataset.expand(dataset.compact(df))
+    for before, after in zip(df.to_dict("records"), restored.to_dict("records")):
+        assert render_cache.fragment_key("line", before) == render_cache.fragment_key("line", after), \
+            f"fragment key of {before} changed in the compact round trip"
+
+
+@check
+def admission_limits():
+    """admission.admit refuses over-budget jobs and a client's extra jobs, queues in arrival
+    order, lets small jobs through, and keys clients on addresses they cannot forge"""
+    import threading
+    import time
+    import flask
+    import admission
+
+    admission.MAX_RENDERS, admission.MAX_JOBS_PER_CLIENT, admission.QUEUE_TIMEOUT = 1, 2, 30
+    big = {"seconds": admission.SMALL_JOB_SECONDS + 1, "bytes": 1}
+
+    try:
+        with admission.admit({"seconds": admission.MAX_JOB_SECONDS + 1, "bytes": 1}, client="a"):
+            raise AssertionError("an over-budget job was admitted")
+    except admission.Rejected:
+        pass
+
+    events = []
+    lock = threading.Lock()
+
+    def job(name, client):
+        try:
+            with admission.admit(big, client=client):
+                with lock:
+                    events.append(("start", name))
+                time.sleep(0.3)
+        except admission.Rejected:
+            with lock:
+                events.append(("rejected", name))
+
+    # j0 runs; j1-j3 queue behind it; j4 is a's third job
+    threads = []
+    for name, client in [("j0", "a"), ("j1", "b"), ("j2", "c"), ("j3", "a"), ("j4", "a")]:
+        threads.append(threading.Thread(target=job, args=(name, client)))
+        threads[-1].start()
+        time.sleep(0.03)
+    with admission.admit({"seconds": 0.1, "bytes": 1}, client="d"):
+        assert admission._running == 1, "a small job waited in the queue"
+    for thread in threads:
+        thread.join()
+    starts = [name for event, name in events if event == "start"]
+    assert starts == ["j0", "j1", "j2", "j3"], f"queued jobs started out of order: {starts}"
+    assert ("rejected", "j4") in events, "a client's third job was admitted"
+
+    app = flask.Flask(__name__)
+    for proxies, header, expected in [(0, "1.2.3.4", "10.0.0.1"), (1, "1.2.3.4, 5.6.7.8", "5.6.7.8"),
+                                      (1, "", "10.0.0.1")]:
+        admission.TRUSTED_PROXIES = proxies
+        with app.test_request_context(headers={"X-Forwarded-For": header},
+                                      environ_base={"REMOTE_ADDR": "10.0.0.1"}):
+            assert admission.client_id() == expected, \
+                f"client {admission.client_id()} for X-Forwarded-For {header!r} behind {proxies} proxies"
+
+
+@check
+def fragment_identity():
+    """A sheet spliced from cached page fragments is byte-identical to drawing every page again"""
+    import render_cache
+    import retention
+    import utils
+
+    df = _json_store_frame(30)
+    edited = df.copy()
+    edited.loc[7, "info2"] = "Site-edited"
+    for profile in ("default", "fast"):
+        render_cache.clear()
+        utils.create_line_pdf(df, "first.pdf", profile=profile, copies=2)
+        cached = render_cache._fragments.currsize
+        spliced = utils.create_line_pdf(edited, "spliced.pdf", profile=profile, copies=2)
+        assert render_cache._fragments.currsize > cached, "the edited row was not drawn again"
+
+        render_cache.clear()
+        utils._cached_symbol_matrix.cache_clear()
+        drawn = utils.create_line_pdf(edited, "drawn.pdf", profile=profile, copies=2)
+        assert retention.content_hash(spliced) == retention.content_hash(drawn), \
+            f"{profile} profile: spliced and freshly drawn sheets differ"
+
+
+def _assign_short_codes(worker):
+    """Register short codes for a few sheets of new IDs (run in a separate process)"""
+    import short_ids
+    for sheet in range(10):
+        df = pd.DataFrame({"ID": [f"{worker}-{sheet}-{i}" for i in range(20)], "Project": ["P"] * 20})
+        short_ids.assign_codes(df, "qr", "sequential")
+
+
+@check
+def short_codes_concurrent():
+    """Processes registering short codes at the same time get distinct codes without errors"""
+    import multiprocessing
+    import sqlite3
+    import short_ids
+
+    with multiprocessing.get_context("spawn").Pool(3) as pool:
+        pool.map(_assign_short_codes, range(3))
+    conn = sqlite3.connect(short_ids.DB_PATH)
+    codes, distinct = conn.execute("SELECT COUNT(*), COUNT(DISTINCT code) FROM short_codes").fetchone()
+    assert codes == distinct == 3 * 10 * 20, f"{codes} codes registered ({distinct} distinct), expected 600"
+
+
+@check
+def datamatrix_reportlab():
+    """datamatrix.py's error correction and module placement match ReportLab's ECC200 encoder"""
+    from reportlab.graphics.barcode.ecc200datamatrix import ECC200DataMatrix
+    import datamatrix
+
+    # ReportLab only draws 44x44 symbols with C40 encodation, so the same
+    # padded ASCII codewords go through both encoders at that size
+    size, region, capacity, ecc, blocks = next(entry for entry in datamatrix.SYMBOL_SIZES if entry[0] == 44)
+    for text in ("P0001", "2025-06-01/Site-2/U0042", "1234567890" * 8, "Plot ñ 12 µg", "x" * 140):
+        data = datamatrix._pad(datamatrix.encode_ascii(datamatrix.to_bytes(text)), capacity)
+        codewords = datamatrix._with_error_correction(data, ecc, blocks)
+        reference = ECC200DataMatrix()
+        assert codewords == data + reference._get_reed_solomon_code(data, ecc), \
+            f"error codewords for {text!r} differ from ReportLab's"
+
+        placed = reference._create_matrix(list(codewords))
+        expected = reference._merge_data_regions(
+            reference._wrap_data_regions_with_finders(reference._create_data_regions(placed)))
+        matrix = [[int(module) for module in row] for row in datamatrix._matrix(codewords, size, region, 0)]
+        assert matrix == expected, f"module placement for {text!r} differs from ReportLab's"
+
+
+@check
+def zpl_printer():
+    """zpl.send streams every label to a raw-socket printer across batches, and ZPL QR
+    codes carry the same text as the PDF and image symbols"""
+    import socket
+    import threading
+    import qrcode
+    import utils
+    import zpl
+
+    df = _json_store_frame(11).rename(columns={"info1": "ID"})
+    received = []
+    with socket.create_server(("127.0.0.1", 0)) as listener:
+        def printer():
+            conn, _ = listener.accept()
+            with conn:
+                while True:
+                    data = conn.recv(65536)
+                    if not data:
+                        break
+                    received.append(data)
+
+        thread = threading.Thread(target=printer)
+        thread.start()
+        zpl.SEND_BATCH = 4
+        sent = zpl.send(df, "qr", "qr", printer=f"127.0.0.1:{listener.getsockname()[1]}", copies=2)
+        thread.join(timeout=10)
+    expected = "".join(zpl.iter_labels(df, "qr", "qr", copies=2)).encode("utf-8")
+    data = b"".join(received)
+    assert data == expected, f"printer received {len(data)} bytes, expected {len(expected)}"
+    assert sent == len(expected), f"send() reported {sent} bytes, {len(expected)} were sent"
+
+    utils.QR_ALPHANUMERIC = True
+    try:
+        payload = utils._qr_payload("p0001-site/a")
+        assert isinstance(payload, qrcode.util.QRData), "alphanumeric payload was not folded"
+        field = zpl._qr("p0001-site/a", 0.1, 0.1, 0.6)
+        assert field.endswith(f"A,{payload.data.decode('ascii')}^FS"), \
+            f"ZPL QR field {field!r} differs from the PDF payload"
+    finally:
+        utils.QR_ALPHANUMERIC = False
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run behaviour checks of the label pipeline")
+    parser.add_argument("checks", nargs="*", help="checks to run (default: all)")
+    parser.add_argument("--list", action="store_true", help="list the checks and exit")
+    args = parser.parse_args(argv)
+
+    if args.list:
+        for name, func in CHECKS.items():
+            print(f"{name:>24}  {func.__doc__}")
+        return 0
+    unknown = [name for name in args.checks if name not in CHECKS]
+    if unknown:
+        parser.error(f"unknown check(s): {', '.join(unknown)}; choose from {', '.join(CHECKS)}")
+
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    os.environ.pop("RENDER", None)
+    workdir = tempfile.TemporaryDirectory(prefix="labels_checks_")
+    os.environ.setdefault("LABELS_SHORT_ID_DB", os.path.join(workdir.name, "short_ids.db"))
+    os.chdir(workdir.name)
+    os.makedirs("labels_pdf", exist_ok=True)
+
+    failed = 0
+    for name in args.checks or CHECKS:
+        try:
+            CHECKS[name]()
+        except Exception:
+            failed += 1
+            print(f"FAIL  {name}")
+            traceback.print_exc()
+        else:
+            print(f"ok    {name}")
+    print(f"{len(args.checks or CHECKS) - failed} passed, {failed} failed")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
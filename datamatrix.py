@@ -0,0 +1,279 @@
+"""Pure-Python Data Matrix (ECC200) encoder.
+
+Square symbols from 10x10 to 96x96 modules, ASCII encodation (digit pairs
+packed into one codeword) and Reed-Solomon error correction over GF(256).
+The smallest symbol that holds the data is chosen, which is what makes Data
+Matrix compact on small tube and bag labels. ReportLab's ECC200DataMatrix
+only produces 44x44 symbols, hence this encoder.
+
+encode() returns rows of booleans like utils.qr_matrix, including a
+1-module quiet zone, so symbols go through the same vector drawing path.
+"""
+
+# (symbol size, data region size, data codewords, error codewords, interleaved blocks)
+SYMBOL_SIZES = [
+    (10, 8, 3, 5, 1),
+    (12, 10, 5, 7, 1),
+    (14, 12, 8, 10, 1),
+    (16, 14, 12, 12, 1),
+    (18, 16, 18, 14, 1),
+    (20, 18, 22, 18, 1),
+    (22, 20, 30, 20, 1),
+    (24, 22, 36, 24, 1),
+    (26, 24, 44, 28, 1),
+    (32, 14, 62, 36, 1),
+    (36, 16, 86, 42, 1),
+    (40, 18, 114, 48, 1),
+    (44, 20, 144, 56, 1),
+    (48, 22, 174, 68, 1),
+    (52, 24, 204, 84, 2),
+    (64, 14, 280, 112, 2),
+    (72, 16, 368, 144, 4),
+    (80, 18, 456, 192, 4),
+    (88, 20, 576, 224, 4),
+    (96, 22, 696, 272, 4),
+]
+MAX_DATA_CODEWORDS = SYMBOL_SIZES[-1][2]
+
+PAD = 129
+UPPER_SHIFT = 235
+
+# GF(256) arithmetic with the Data Matrix field polynomial x^8 + x^5 + x^3 + x^2 + 1
+_EXP = [0] * 512
+_LOG = [0] * 256
+_value = 1
+for _i in range(255):
+    _EXP[_i] = _value
+    _LOG[_value] = _i
+    _value <<= 1
+    if _value & 0x100:
+        _value ^= 0x12d
+for _i in range(255, 512):
+    _EXP[_i] = _EXP[_i - 255]
+
+_generators = {}
+
+
+class DataMatrixError(ValueError):
+    pass
+
+
+def _generator(degree):
+    """Coefficients of prod(x + a^i) for i = 1..degree, highest power first"""
+    poly = _generators.get(degree)
+    if poly is None:
+        poly = [1]
+        for i in range(1, degree + 1):
+            nxt = poly + [0]
+            for j, coefficient in enumerate(poly):
+                if coefficient:
+                    nxt[j + 1] ^= _EXP[_LOG[coefficient] + i]
+            poly = nxt
+        _generators[degree] = poly
+    return poly
+
+
+def _reed_solomon(data, degree):
+    """Error codewords of one block (polynomial division remainder)"""
+    generator = _generator(degree)
+    remainder = [0] * degree
+    for codeword in data:
+        factor = codeword ^ remainder[0]
+        remainder = remainder[1:] + [0]
+        if factor:
+            log_factor = _LOG[factor]
+            for j in range(degree):
+                coefficient = generator[j + 1]
+                if coefficient:
+                    remainder[j] ^= _EXP[_LOG[coefficient] + log_factor]
+    return remainder
+
+
+def encode_ascii(data):
+    """ASCII encodation of bytes into data codewords"""
+    codewords = []
+    i, n = 0, len(data)
+    while i < n:
+        byte = data[i]
+        if 48 <= byte <= 57 and i + 1 < n and 48 <= data[i + 1] <= 57:
+            codewords.append(130 + (byte - 48) * 10 + (data[i + 1] - 48))
+            i += 2
+            continue
+        if byte > 127:
+            codewords.append(UPPER_SHIFT)
+            byte -= 128
+        codewords.append(byte + 1)
+        i += 1
+    return codewords
+
+
+def _pad(codewords, capacity):
+    padded = list(codewords)
+    if len(padded) < capacity:
+        padded.append(PAD)
+    while len(padded) < capacity:
+        position = len(padded) + 1
+        value = PAD + ((149 * position) % 253) + 1
+        padded.append(value - 254 if value > 254 else value)
+    return padded
+
+
+def _with_error_correction(data, ecc, blocks):
+    """Data followed by error codewords, both interleaved across blocks"""
+    codewords = data + [0] * ecc
+    block_ecc = ecc // blocks
+    for block in range(blocks):
+        errors = _reed_solomon(data[block::blocks], block_ecc)
+        for j, codeword in enumerate(errors):
+            codewords[len(data) + block + j * blocks] = codeword
+    return codewords
+
+
+def _placement(nrow, ncol):
+    """ECC200 module placement: (codeword index, bit) per mapping-matrix module.
+
+    Bit 1 is the most significant bit. Returns True for the fixed dark
+    modules of the bottom-right corner and None for the light ones.
+    """
+    grid = [[None] * ncol for _ in range(nrow)]
+
+    def module(row, col, index, bit):
+        if row < 0:
+            row += nrow
+            col += 4 - ((nrow + 4) % 8)
+        if col < 0:
+            col += ncol
+            row += 4 - ((ncol + 4) % 8)
+        grid[row][col] = (index, bit)
+
+    def utah(row, col, index):
+        for bit, (r, c) in enumerate(((row - 2, col - 2), (row - 2, col - 1), (row - 1, col - 2),
+                                      (row - 1, col - 1), (row - 1, col), (row, col - 2),
+                                      (row, col - 1), (row, col)), start=1):
+            module(r, c, index, bit)
+
+    def corner(index, positions):
+        for bit, (r, c) in enumerate(positions, start=1):
+            module(r, c, index, bit)
+
+    index, row, col = 0, 4, 0
+    while True:
+        if row == nrow and col == 0:
+            corner(index, ((nrow - 1, 0), (nrow - 1, 1), (nrow - 1, 2), (0, ncol - 2),
+                           (0, ncol - 1), (1, ncol - 1), (2, ncol - 1), (3, ncol - 1)))
+            index += 1
+        if row == nrow - 2 and col == 0 and ncol % 4:
+            corner(index, ((nrow - 3, 0), (nrow - 2, 0), (nrow - 1, 0), (0, ncol - 4),
+                           (0, ncol - 3), (0, ncol - 2), (0, ncol - 1), (1, ncol - 1)))
+            index += 1
+        if row == nrow - 2 and col == 0 and ncol % 8 == 4:
+            corner(index, ((nrow - 3, 0), (nrow - 2, 0), (nrow - 1, 0), (0, ncol - 2),
+                           (0, ncol - 1), (1, ncol - 1), (2, ncol - 1), (3, ncol - 1)))
+            index += 1
+        if row == nrow + 4 and col == 2 and not ncol % 8:
+            corner(index, ((nrow - 1, 0), (nrow - 1, ncol - 1), (0, ncol - 3), (0, ncol - 2),
+                           (0, ncol - 1), (1, ncol - 3), (1, ncol - 2), (1, ncol - 1)))
+            index += 1
+        # Sweep up and to the right
+        while True:
+            if row < nrow and col >= 0 and grid[row][col] is None:
+                utah(row, col, index)
+                index += 1
+            row -= 2
+            col += 2
+            if row < 0 or col >= ncol:
+                break
+        row += 1
+        col += 3
+        # Sweep down and to the left
+        while True:
+            if row >= 0 and col < ncol and grid[row][col] is None:
+                utah(row, col, index)
+                index += 1
+            row += 2
+            col -= 2
+            if row >= nrow or col < 0:
+                break
+        row += 3
+        col += 1
+        if row >= nrow and col >= ncol:
+            break
+
+    if grid[nrow - 1][ncol - 1] is None:
+        grid[nrow - 1][ncol - 1] = grid[nrow - 2][ncol - 2] = True
+    return grid
+
+
+_placements = {}
+
+
+def _symbol_size(num_codewords):
+    for entry in SYMBOL_SIZES:
+        if entry[2] >= num_codewords:
+            return entry
+    raise DataMatrixError(f"Data too long for a Data Matrix symbol ({num_codewords} codewords, "
+                          f"max {MAX_DATA_CODEWORDS})")
+
+
+def to_bytes(text):
+    """Latin-1 when possible (what scanners assume), UTF-8 otherwise"""
+    try:
+        return text.encode('latin-1')
+    except UnicodeEncodeError:
+        return text.encode('utf-8')
+
+
+def codeword_count(text):
+    """Data codewords needed for `text` (before padding)"""
+    return len(encode_ascii(to_bytes(text)))
+
+
+def symbol_modules(text):
+    """Side of the smallest symbol holding `text`, in modules (quiet zone excluded)"""
+    return _symbol_size(codeword_count(text))[0]
+
+
+def encode(text, quiet_zone=1):
+    """Encode text into a module matrix (rows of booleans, quiet zone included)"""
+    data = encode_ascii(to_bytes(text))
+    size, region, capacity, ecc, blocks = _symbol_size(len(data))
+    codewords = _with_error_correction(_pad(data, capacity), ecc, blocks)
+    return _matrix(codewords, size, region, quiet_zone)
+
+
+def _matrix(codewords, size, region, quiet_zone):
+    """Lay out final codewords in a symbol of the given size"""
+    regions = size // (region + 2)
+    mapping_size = region * regions
+    placement = _placements.get(mapping_size)
+    if placement is None:
+        placement = _placements[mapping_size] = _placement(mapping_size, mapping_size)
+
+    total = size + 2 * quiet_zone
+    matrix = [[False] * total for _ in range(total)]
+    # Finder and timing patterns around each data region: solid left and
+    # bottom edges, alternating top and right edges
+    for region_row in range(regions):
+        for region_col in range(regions):
+            top = quiet_zone + region_row * (region + 2)
+            left = quiet_zone + region_col * (region + 2)
+            bottom, right = top + region + 1, left + region + 1
+            for k in range(region + 2):
+                matrix[bottom][left + k] = True
+                matrix[top + k][left] = True
+                matrix[top][left + k] = k % 2 == 0
+                matrix[top + k][right] = k % 2 == 1
+    # Data modules
+    for r, placed_row in enumerate(placement):
+        symbol_row = quiet_zone + 1 + r + 2 * (r // region)
+        for c, placed in enumerate(placed_row):
+            if placed is None:
+                continue
+            if placed is True:
+                dark = True
+            else:
+                index, bit = placed
+                dark = bool(codewords[index] & (1 << (8 - bit)))
+            if dark:
+                matrix[symbol_row][quiet_zone + 1 + c + 2 * (c // region)] = True
+    return matrix
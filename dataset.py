@@ -0,0 +1,56 @@
+import pandas as pd
+import pyarrow as pa
+
+
+# Label tables are very repetitive: Project, Site, Year, Sampling Stage/Depth
+# and Experiment Type hold one value per sheet, and uploads are read with
+# every column as text. Tables the server keeps in memory (the job registry,
+# parsed uploads) are stored compactly: text columns with few distinct values
+# as categoricals (one copy of each value plus small integer codes), other
+# text columns as Arrow-backed strings. They are expanded back to plain
+# object columns at the edges, before rendering or sending JSON to the browser.
+
+# Columns with at most this share of distinct values become categoricals
+CATEGORY_MAX_RATIO = 0.5
+ARROW_STRING = pd.ArrowDtype(pa.string())
+
+
+def _is_compact(dtype):
+    return isinstance(dtype, pd.CategoricalDtype) or dtype == ARROW_STRING
+
+
+def compact(df):
+    """Copy of `df` with text columns dictionary-encoded or Arrow-backed"""
+    columns = {}
+    for name, series in df.items():
+        dtype = series.dtype
+        if dtype == object or isinstance(dtype, pd.StringDtype) or dtype == ARROW_STRING:
+            text = dtype != object or pd.api.types.infer_dtype(series, skipna=True) in ("string", "empty")
+            if len(series) and series.nunique(dropna=True) <= CATEGORY_MAX_RATIO * len(series):
+                series = series.astype("category")
+            elif text:
+                series = series.astype(ARROW_STRING)
+        columns[name] = series
+    return pd.DataFrame(columns, index=df.index)
+
+
+def expand(df):
+    """Copy of `df` with compact columns as object columns again, missing values as None.
+
+    None is what a frame built from the Dash JSON stores holds, and what the
+    generators and render_cache.fragment_key see on a normal render; NaN
+    would be drawn and encoded as "nan".
+    """
+    if not any(_is_compact(dtype) for dtype in df.dtypes):
+        return df
+    columns = {}
+    for name, series in df.items():
+        if _is_compact(series.dtype):
+            series = series.astype(object).where(series.notna(), None)
+        columns[name] = series
+    return pd.DataFrame(columns, index=df.index)
+
+
+def memory_bytes(df):
+    """Bytes held by a DataFrame, including the Python string objects"""
+    return int(df.memory_usage(deep=True).sum())
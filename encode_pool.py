@@ -0,0 +1,100 @@
+import os
+import threading
+import itertools
+import multiprocessing
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+import metrics
+
+
+# QR codes and Data Matrix symbols are encoded in pure Python, and on 2D
+# label styles that is most of the render. With LABELS_ENCODE_WORKERS > 0 a
+# pool of processes encodes the symbols of upcoming rows while the generator
+# draws pages: rows go out in batches, at most AHEAD batches per worker are
+# in flight, and results are consumed in row order, so the generator still
+# writes one PDF in order. LABELS_ENCODE_WORKERS=0 (the default) encodes
+# inline while drawing, as before.
+WORKERS = int(os.environ.get('LABELS_ENCODE_WORKERS', '0'))
+# Rows per worker task, and batches in flight per worker
+BATCH_SIZE = 32
+AHEAD = 2
+
+_executor = None
+_lock = threading.Lock()
+
+
+def _get_executor():
+    global _executor
+    with _lock:
+        if _executor is None:
+            # Spawned, not forked, for the same reason as the render pool
+            _executor = ProcessPoolExecutor(max_workers=WORKERS,
+                                            mp_context=multiprocessing.get_context("spawn"))
+        return _executor
+
+
+def _encode_batch(symbology, size, texts):
+    # Imported here: utils imports this module
+    from utils import symbol_matrix
+    return [symbol_matrix(symbology, text, size) for text in texts]
+
+
+def warm_up():
+    """Start the workers and import the encoders in them, so the first job does not wait"""
+    if WORKERS <= 0:
+        return
+    executor = _get_executor()
+    for future in [executor.submit(_encode_batch, "qr", 72, ["warm-up"]) for _ in range(WORKERS)]:
+        future.result()
+
+
+def prefetch(items, text_of, symbology, size):
+    """Yield (item, matrix) in order, with symbols encoded ahead in the pool.
+
+    `text_of(item)` gives the text to encode, or None for items that need no
+    symbol (their matrix is None). `symbology` and `size` are passed to
+    utils.symbol_matrix. Without a pool every matrix is None and the caller
+    encodes while drawing.
+    """
+    if WORKERS <= 0:
+        for item in items:
+            yield item, None
+        return
+
+    executor = _get_executor()
+    items = iter(items)
+    pending = deque()
+
+    def submit():
+        batch = list(itertools.islice(items, BATCH_SIZE))
+        if not batch:
+            return False
+        texts = [text_of(item) for item in batch]
+        wanted = [text for text in texts if text is not None]
+        future = executor.submit(_encode_batch, symbology, size, wanted) if wanted else None
+        pending.append((batch, texts, future))
+        return True
+
+    while len(pending) < WORKERS * AHEAD and submit():
+        pass
+    while pending:
+        batch, texts, future = pending.popleft()
+        # Keep the pool busy while this batch's pages are drawn
+        submit()
+        matrices = iter(())
+        if future is not None:
+            # Time spent waiting here is encode latency the pipeline did not hide
+            with metrics.stage_timer("symbol_wait", symbology=symbology):
+                matrices = iter(future.result())
+        for item, text in zip(batch, texts):
+            yield item, (next(matrices) if text is not None else None)
+
+
+def shutdown():
+    """Stop the pool's worker processes (gunicorn calls this on worker exit)"""
+    global _executor
+    with _lock:
+        if _executor is not None:
+            _executor.shutdown(wait=False, cancel_futures=True)
+            _executor = None
@@ -0,0 +1,38 @@
+import os
+import multiprocessing
+
+
+# Gunicorn settings for deployments (gunicorn -c gunicorn.conf.py app:server).
+# Serving and rendering are split: threaded workers handle requests, so a slow
+# client downloading a large PDF holds one thread instead of a whole worker,
+# and CPU-bound rendering runs in render_pool's process pool. Every setting
+# can be overridden with the environment variables below.
+
+bind = f"0.0.0.0:{os.environ.get('PORT', '8080')}"
+
+# Jobs, uploads and in-memory PDFs (RENDER) live in the web process, so one
+# worker by default; raise it only with a shared store in front
+workers = int(os.environ.get('WEB_CONCURRENCY', '1'))
+worker_class = os.environ.get('GUNICORN_WORKER_CLASS', 'gthread')
+threads = int(os.environ.get('GUNICORN_THREADS', '16'))
+
+# Render processes per web worker (see render_pool.py); 0 renders in the request thread.
+# Each sheet's renders go back to one process, where its pages and symbols are cached
+os.environ.setdefault('LABELS_RENDER_WORKERS', str(max(multiprocessing.cpu_count() // workers, 1)))
+# Symbol encode processes per renderer (see encode_pool.py) stay off unless set:
+# with a render pool sized to the cores there are none spare to overlap with
+
+# Threaded workers keep answering the arbiter's heartbeat while requests run,
+# so this only bounds requests that are stuck, not long renders
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', '120'))
+graceful_timeout = 30
+keepalive = 5
+
+
+def worker_exit(server, worker):
+    import encode_pool
+    import raster
+    import render_pool
+    render_pool.shutdown()
+    encode_pool.shutdown()
+    raster.shutdown()
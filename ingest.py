@@ -0,0 +1,132 @@
+import io
+import os
+import csv
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+
+# Columns each label template can use. Columnar and Excel uploads only load
+# the union of these (when the file has any of them), so wide field exports
+# do not pull unrelated columns into memory.
+TEMPLATE_COLUMNS = {
+    "qr": ["Project", "Site", "Year", "Block", "Treatment", "Plot", "Sampling Stage/Depth",
+           "Sampling Fraction", "Experiment Type", "ID", "copies"],
+    "biomass": ["info1", "info2", "info3", "ucode", "copies"],
+    "line": ["info1", "info2", "info3", "ucode", "copies"],
+}
+KNOWN_COLUMNS = list(dict.fromkeys(c for columns in TEMPLATE_COLUMNS.values() for c in columns))
+
+CSV_EXTENSIONS = ('.csv',)
+PARQUET_EXTENSIONS = ('.parquet', '.pq')
+ARROW_EXTENSIONS = ('.arrow', '.feather', '.ipc')
+EXCEL_EXTENSIONS = ('.xlsx',)
+SUPPORTED_EXTENSIONS = CSV_EXTENSIONS + PARQUET_EXTENSIONS + ARROW_EXTENSIONS + EXCEL_EXTENSIONS
+SUPPORTED_DESCRIPTION = "CSV, Parquet, Arrow or Excel (.xlsx)"
+
+
+def is_supported(filename):
+    return bool(filename) and filename.lower().endswith(SUPPORTED_EXTENSIONS)
+
+
+def _projection(names, columns):
+    """Columns to load: the wanted ones present in the file, or all if none match"""
+    wanted = KNOWN_COLUMNS if columns is None else columns
+    selected = [name for name in names if name in wanted]
+    return selected or list(names)
+
+
+def _to_pandas(table):
+    # Arrow-backed columns keep their types and wrap the Arrow buffers without copying
+    return table.to_pandas(types_mapper=pd.ArrowDtype)
+
+
+def read_parquet(source, columns=None):
+    """Read only the needed columns of a Parquet file (memory-mapped when given a path)"""
+    parquet_file = pq.ParquetFile(source, memory_map=isinstance(source, str))
+    selected = _projection(parquet_file.schema_arrow.names, columns)
+    return _to_pandas(parquet_file.read(columns=selected))
+
+
+def read_arrow(source, columns=None):
+    """Read an Arrow IPC file or stream, selecting columns without copying"""
+    buffer = pa.memory_map(source) if isinstance(source, str) else pa.BufferReader(source)
+    try:
+        table = pa.ipc.open_file(buffer).read_all()
+    except pa.ArrowInvalid:
+        buffer.seek(0)
+        table = pa.ipc.open_stream(buffer).read_all()
+    return _to_pandas(table.select(_projection(table.column_names, columns)))
+
+
+def read_excel(source, columns=None):
+    """Stream the first worksheet of an .xlsx file row by row, keeping only needed columns"""
+    from openpyxl import load_workbook
+
+    workbook = load_workbook(source if isinstance(source, str) else io.BytesIO(source),
+                             read_only=True, data_only=True)
+    try:
+        rows = workbook.worksheets[0].iter_rows(values_only=True)
+        header = next(rows, None)
+        if header is None:
+            return pd.DataFrame()
+        names = [str(h) if h is not None else f"column_{i + 1}" for i, h in enumerate(header)]
+        selected = _projection(names, columns)
+        positions = [names.index(name) for name in selected]
+        data = {name: [] for name in selected}
+        for row in rows:
+            if row is None or all(value is None for value in row):
+                continue
+            for name, position in zip(selected, positions):
+                data[name].append(row[position] if position < len(row) else None)
+    finally:
+        workbook.close()
+    return pd.DataFrame(data).convert_dtypes()
+
+
+def read_csv(source):
+    """Read CSV with all columns as strings to preserve leading zeros"""
+    if isinstance(source, (bytes, bytearray)):
+        source = io.BytesIO(source)
+    return pd.read_csv(source, dtype=str, encoding='utf-8')
+
+
+def read_table(source, filename, columns=None):
+    """Read an uploaded table from a path or raw bytes, dispatching on the file extension.
+
+    `columns` restricts columnar/Excel reads to a template's columns; by default
+    the union of all template columns is used.
+    """
+    extension = os.path.splitext(filename.lower())[1]
+    if extension in CSV_EXTENSIONS:
+        return read_csv(source)
+    if extension in PARQUET_EXTENSIONS:
+        return read_parquet(source if isinstance(source, str) else pa.BufferReader(source), columns)
+    if extension in ARROW_EXTENSIONS:
+        return read_arrow(source, columns)
+    if extension in EXCEL_EXTENSIONS:
+        return read_excel(source, columns)
+    raise ValueError(f"Please upload a {SUPPORTED_DESCRIPTION} file")
+
+
+def parse_pasted_rows(text, columns=("info1", "info2", "info3", "ucode")):
+    """Rows pasted from a spreadsheet (tab-separated) or typed as CSV, as dicts.
+
+    Cells map to `columns` in order; a header row naming the first column is
+    skipped. Returns (rows, skipped) where skipped counts lines without a first cell.
+    """
+    lines = [line for line in (text or "").splitlines() if line.strip()]
+    if not lines:
+        return [], 0
+    delimiter = "\t" if "\t" in lines[0] else ","
+    rows, skipped = [], 0
+    for cells in csv.reader(lines, delimiter=delimiter):
+        cells = [cell.strip() for cell in cells[:len(columns)]]
+        if not cells or not cells[0]:
+            skipped += 1
+            continue
+        if not rows and not skipped and cells[0].lower() == columns[0].lower():
+            continue
+        cells += [""] * (len(columns) - len(cells))
+        rows.append(dict(zip(columns, cells)))
+    return rows, skipped
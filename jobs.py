@@ -0,0 +1,167 @@
+import os
+import re
+import uuid
+import threading
+from datetime import datetime
+from cachetools import LRUCache
+
+import admission
+import dataset
+import render_pool
+import short_ids
+from utils import label_symbology, output_extension, parse_copies, select_generator
+
+
+# Most recent render jobs kept for reprints (LRU, by count)
+MAX_JOBS = int(os.environ.get('LABELS_MAX_JOBS', '32'))
+
+# Column holding the label identifier for each style
+ID_COLUMNS = {"qr": ("ID", "short_code"), "biomass": ("info1", "ucode", "short_code"),
+              "line": ("info1", "ucode", "short_code")}
+
+_lock = threading.Lock()
+_jobs = LRUCache(maxsize=MAX_JOBS)
+
+
+class JobNotFound(KeyError):
+    pass
+
+
+def register_job(df, label_options, pdf_filename):
+    """Remember a rendered job so subsets can be reprinted; returns its handle"""
+    job_id = uuid.uuid4().hex[:12]
+    with _lock:
+        _jobs[job_id] = {
+            # Kept dictionary-encoded/Arrow-backed; expanded again when rendering
+            "df": dataset.compact(df.reset_index(drop=True)),
+            "label_options": dict(label_options),
+            "pdf_filename": pdf_filename,
+            "created": datetime.now().isoformat(timespec="seconds"),
+        }
+    return job_id
+
+
+def sheet_key(df, label_options):
+    """Render affinity of a sheet (render_pool): its style and first label ID, which edits
+    to other cells, the preview and reprints of the job all share"""
+    column = short_ids.encoded_column(df, label_options["style"])
+    first = ""
+    if column in df.columns and len(df):
+        first = short_ids.encoded_values(df.head(1), label_options["style"]).iloc[0]
+    return f"{label_options['style']}:{first}"
+
+
+def get_job(job_id):
+    with _lock:
+        job = _jobs.get(job_id)
+    if job is None:
+        raise JobNotFound(job_id)
+    return job
+
+
+def parse_row_spec(spec, num_rows):
+    """Parse 1-based label numbers and ranges ("1203-1260, 1300") into 0-based positions.
+
+    Also accepts a list of ints or strings. Order is preserved and duplicates
+    are kept, so a label listed twice is printed twice.
+    """
+    tokens = spec if isinstance(spec, (list, tuple)) else re.split(r"[,;\s]+", str(spec))
+    positions = []
+    for token in tokens:
+        token = str(token).strip()
+        if not token:
+            continue
+        match = re.fullmatch(r"(\d+)\s*[-–—:]\s*(\d+)", token)
+        if match:
+            start, end = int(match.group(1)), int(match.group(2))
+        elif token.isdigit():
+            start = end = int(token)
+        else:
+            raise ValueError(f"Invalid row selection '{token}'")
+        if start < 1 or end > num_rows or start > end:
+            raise ValueError(f"Rows {token} are outside 1-{num_rows}")
+        positions.extend(range(start - 1, end))
+    if not positions:
+        raise ValueError("No rows selected")
+    return positions
+
+
+def split_selection(text):
+    """Split free text from the UI into (label numbers/ranges, label IDs)"""
+    rows, ids = [], []
+    for token in re.split(r"[,;\s]+", str(text or "")):
+        if not token:
+            continue
+        if re.fullmatch(r"\d+(\s*[-–—:]\s*\d+)?", token):
+            rows.append(token)
+        else:
+            ids.append(token)
+    return rows, ids
+
+
+def _id_index(job):
+    """Identifier -> row position, built once per job so lookups are O(1)"""
+    with _lock:
+        index = job.get("id_index")
+    if index is None:
+        df = job["df"]
+        index = {}
+        columns = [c for c in ID_COLUMNS.get(job["label_options"]["style"], ("ID",)) if c in df.columns]
+        for column in columns:
+            for position, value in enumerate(df[column].astype(str)):
+                index.setdefault(value, position)
+        with _lock:
+            job["id_index"] = index
+    return index
+
+
+def select_rows(job, rows=None, ids=None):
+    """Subset of a job's rows by label numbers and/or identifiers, in request order"""
+    df = job["df"]
+    positions = parse_row_spec(rows, len(df)) if rows not in (None, "", []) else []
+    if ids:
+        wanted = ids if isinstance(ids, (list, tuple)) else re.split(r"[,;\s]+", str(ids))
+        wanted = [str(i).strip() for i in wanted if str(i).strip()]
+        index = _id_index(job)
+        missing = [i for i in wanted if i not in index]
+        if missing:
+            raise ValueError(f"Unknown label ID(s): {', '.join(missing[:10])}")
+        positions.extend(index[i] for i in wanted)
+    if not positions:
+        raise ValueError("No rows selected")
+    return df.iloc[positions]
+
+
+def render_reprint(job_id, rows=None, ids=None):
+    """Render a PDF of selected labels from an existing job.
+
+    Unchanged labels come straight from the page fragment cache, so the cost
+    is proportional to the subset size. Returns (pdf filename, generator result).
+    """
+    job = get_job(job_id)
+    subset = select_rows(job, rows=rows, ids=ids)
+    prefix, generator, generator_kwargs = select_generator(job["label_options"])
+    timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+    pdf_filename = (f"{prefix}_reprint_{job_id}_{timestamp}_{uuid.uuid4().hex[:6]}"
+                    f"{output_extension(job['label_options'])}")
+    subset = dataset.expand(subset)
+    # Estimated as a fresh render; cached pages make it cheaper than predicted
+    with admission.admit(admission.estimate(subset, job["label_options"])):
+        return pdf_filename, render_pool.run(generator, subset, pdf_filename,
+                                             affinity=sheet_key(job["df"], job["label_options"]),
+                                             **generator_kwargs)
+
+
+def send_to_printer(job_id, rows=None, ids=None, printer=None):
+    """Stream a job's labels (or a selection of them) as ZPL to a raw-socket printer.
+
+    Returns (labels sent, bytes sent).
+    """
+    import zpl
+
+    job = get_job(job_id)
+    subset = dataset.expand(select_rows(job, rows=rows, ids=ids) if rows or ids else job["df"])
+    label_options = job["label_options"]
+    sent = zpl.send(subset, label_options["style"], label_symbology(label_options), printer=printer,
+                    copies=parse_copies(label_options.get("copies")))
+    return len(subset), sent
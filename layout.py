@@ -1,8 +1,44 @@
 import dash
-from dash import dcc, html
+from dash import dcc, html, dash_table
 import dash_bootstrap_components as dbc
 
 
+# What the QR code/barcode encodes: the full ID, or a short code from the registry
+SYMBOL_CONTENT_OPTIONS = [
+    {"label": "Full ID", "value": "full"},
+    {"label": "Short code (sequential per project)", "value": "sequential"},
+    {"label": "Short code (base32)", "value": "base32"}
+]
+
+# Symbols each label style can print (Code128 only fits the wide biomass label)
+SYMBOL_TYPE_OPTIONS = {
+    "biomass": [
+        {"label": "QR Codes", "value": "qr"},
+        {"label": "Barcodes", "value": "barcode"},
+        {"label": "Data Matrix", "value": "datamatrix"}
+    ],
+    "qr": [
+        {"label": "QR Codes", "value": "qr"},
+        {"label": "Data Matrix", "value": "datamatrix"}
+    ]
+}
+
+OUTPUT_FORMAT_OPTIONS = [
+    {"label": "PDF", "value": "pdf"},
+    {"label": "ZPL (Zebra)", "value": "zpl"},
+    {"label": "TIFF", "value": "tiff"},
+    {"label": "PNG (ZIP)", "value": "png"}
+]
+
+# PDF output profiles (see utils.PDF_PROFILES)
+PDF_PROFILE_OPTIONS = [
+    {"label": "Standard", "value": "default"},
+    {"label": "Fast (uncompressed)", "value": "fast"},
+    {"label": "Small", "value": "small"},
+    {"label": "Web (linearized)", "value": "web"}
+]
+
+
 def create_layout():
     """Create and return the main application layout"""
     return dbc.Container([
@@ -97,7 +133,7 @@ def create_layout():
                     children=html.Div([
                         html.I(className="fas fa-cloud-upload-alt", style={"font-size": "2.5rem", "color": "#6c757d"}),
                         html.Br(),
-                        html.P("Drag and drop or click to select a CSV file", 
+                        html.P("Drag and drop or click to select a CSV, Parquet, Arrow or Excel file", 
                               style={"margin": "1rem 0 0 0", "color": "#6c757d", "font-size": "1rem", "text-align": "center", "width": "100%"})
                     ], style={
                         "display": "flex", 
@@ -119,6 +155,22 @@ def create_layout():
                     },
                     multiple=False
                 ),
+                
+                # Chunked upload for large files (see assets/chunked_upload.js)
+                html.Div([
+                    html.Small("Large file? ", className="text-muted"),
+                    html.Button([
+                        html.I(className="fas fa-layer-group me-1"),
+                        "Use chunked upload"
+                    ], id="chunked-upload-btn", className="btn btn-link btn-sm p-0 align-baseline",
+                       style={"font-size": "0.875rem"}),
+                    html.Small(" (resumable, recommended above ~50 MB)", className="text-muted"),
+                    dbc.Progress(id="chunked-upload-progress", value=0, className="mt-2",
+                                 style={"display": "none"}),
+                    dcc.Interval(id="chunked-upload-poll", interval=500),
+                    dcc.Store(id="chunked-upload-state")
+                ], className="mt-2"),
+                
                 html.Div(id="upload-feedback", className="mt-3"),
                 html.Div(id="upload-data-preview", className="mt-3"),
                 
@@ -143,19 +195,28 @@ def create_layout():
                         ], md=6),
                         dbc.Col([
                             html.Div([
-                                dbc.Label("Biomass Output Type", className="fw-bold mb-2"),
+                                dbc.Label("Symbol Type", className="fw-bold mb-2"),
                                 dbc.RadioItems(
                                     id="upload-biomass-output-type",
-                                    options=[
-                                        {"label": "QR Codes", "value": "qr"},
-                                        {"label": "Barcodes", "value": "barcode"}
-                                    ],
-                                    value="barcode",
+                                    options=SYMBOL_TYPE_OPTIONS["biomass"],
+                                    value="qr",
                                     inline=True
                                 )
-                            ], id="upload-biomass-options", style={"display": "none"})
+                            ], id="upload-biomass-options")
                         ], md=6)
-                    ])
+                    ]),
+                    dbc.Row([
+                        dbc.Col([
+                            dbc.Label("Symbol Content", className="fw-bold mb-2"),
+                            dcc.Dropdown(
+                                id="upload-symbol-content",
+                                options=SYMBOL_CONTENT_OPTIONS,
+                                value="full",
+                                clearable=False,
+                                style={"font-size": "14px"}
+                            )
+                        ], md=6)
+                    ], className="mt-3")
                 ], id="upload-options", style={"display": "none"})
             ]),
             dbc.ModalFooter([
@@ -183,7 +244,17 @@ def create_layout():
                             clearable=False,
                             style={"font-size": "14px"}
                         )
-                    ], md=12)
+                    ], md=8),
+                    dbc.Col([
+                        dbc.Label("Symbol Content", className="fw-bold mb-2"),
+                        dcc.Dropdown(
+                            id="symbol-content",
+                            options=SYMBOL_CONTENT_OPTIONS,
+                            value="full",
+                            clearable=False,
+                            style={"font-size": "14px"}
+                        )
+                    ], md=4)
                 ], className="mb-4"),
                 
                 # QR Code Entry Form (shown by default)
@@ -223,6 +294,18 @@ def create_layout():
                             dbc.Input(id="sampling-stage", placeholder="e.g., V4, R2, R6", value="V4",
                                     style={"border-radius": "6px"})
                         ], md=4)
+                    ], className="mb-3"),
+                    dbc.Row([
+                        dbc.Col([
+                            dbc.Label("Output Type", className="fw-bold"),
+                            dbc.RadioItems(
+                                id="modal-qr-output-type",
+                                options=SYMBOL_TYPE_OPTIONS["qr"],
+                                value="qr",
+                                inline=True,
+                                style={"margin-top": "0.5rem"}
+                            )
+                        ], md=12)
                     ], className="mb-4")
                 ], id="modal-qr-section"),
                 
@@ -234,10 +317,7 @@ def create_layout():
                             dbc.Label("Output Type", className="fw-bold"),
                             dbc.RadioItems(
                                 id="modal-biomass-output-type",
-                                options=[
-                                    {"label": "QR Codes", "value": "qr"},
-                                    {"label": "Barcodes", "value": "barcode"}
-                                ],
+                                options=SYMBOL_TYPE_OPTIONS["biomass"],
                                 value="barcode",
                                 inline=True,
                                 style={"margin-top": "0.5rem"}
@@ -273,8 +353,39 @@ def create_layout():
                                  className="me-3", style={"border-radius": "6px"}),
                     ], className="text-center mb-3"),
                     
+                    # Bulk entry: rows copied from a spreadsheet are added in one update
+                    dbc.Label("Paste Rows", className="fw-bold"),
+                    dbc.Textarea(id="modal-biomass-paste", rows=3,
+                                 placeholder="Info 1, Info 2, Info 3, Unique Code - one row per line, "
+                                             "tab-separated (from a spreadsheet) or comma-separated",
+                                 style={"border-radius": "6px", "font-size": "0.9rem"}),
+                    html.Div([
+                        html.Small(id="modal-paste-feedback", className="text-muted me-3"),
+                        dbc.Button("Add Pasted Rows", id="modal-paste-rows-btn", color="outline-primary",
+                                   size="sm", style={"border-radius": "6px"})
+                    ], className="text-end mt-2 mb-3"),
+                    
                     html.Hr(style={"border-top": "1px solid #dee2e6", "margin": "2rem 0"}),
-                    html.Div(id="modal-biomass-table-container")
+                    html.Div("No data added yet.", id="modal-biomass-empty"),
+                    # Rows are appended with partial (Patch) updates, so the table
+                    # is created once here and never rebuilt by a callback
+                    html.Div([
+                        dash_table.DataTable(
+                            id="modal-biomass-table",
+                            data=[],
+                            columns=[
+                                {"name": "Info 1", "id": "info1"},
+                                {"name": "Info 2", "id": "info2"},
+                                {"name": "Info 3", "id": "info3"},
+                                {"name": "Unique Code", "id": "ucode"}
+                            ],
+                            editable=True,
+                            row_deletable=True,
+                            page_size=50,
+                            style_cell={'textAlign': 'left'},
+                            style_header={'backgroundColor': 'rgb(230, 230, 230)', 'fontWeight': 'bold'}
+                        )
+                    ], id="modal-biomass-table-container", style={"display": "none"})
                 ], id="modal-biomass-section", style={"display": "none"})
             ]),
             dbc.ModalFooter([
@@ -292,13 +403,28 @@ def create_layout():
                         dbc.Row([
                             dbc.Col([
                                 html.H6("Data Viewer", className="mb-0", style={"color": "#2c3e50", "font-weight": "500"})
-                            ], md=8),
+                            ], md=6),
                             dbc.Col([
                                 html.Div([
+                                    # PDF, or ZPL commands for Zebra thermal printers
+                                    dbc.Select(id="output-format", options=OUTPUT_FORMAT_OPTIONS, value="pdf",
+                                               size="sm", className="me-2",
+                                               style={"width": "auto", "display": "inline-block"}),
+                                    # Compression/linearization tradeoff, only for PDF output
+                                    dbc.Select(id="pdf-profile", options=PDF_PROFILE_OPTIONS, value="default",
+                                               size="sm", className="me-2",
+                                               style={"width": "auto", "display": "inline-block"}),
+                                    # Copies of every label, up to utils.MAX_COPIES (a "copies" column overrides it per row)
+                                    dbc.Input(id="label-copies", type="number", min=1, max=100, step=1,
+                                              value=1, size="sm", className="me-2", placeholder="Copies",
+                                              style={"width": "4.5rem", "display": "inline-block"}),
                                     dbc.Button("Generate PDF", id="generate-pdf-btn", color="primary", size="sm", 
-                                             disabled=True, style={"border-radius": "6px", "font-weight": "500"})
+                                             disabled=True, style={"border-radius": "6px", "font-weight": "500"}),
+                                    # Predicted render time and size (admission cost model)
+                                    html.Small(id="job-estimate", className="d-block mt-1",
+                                               style={"color": "#6c757d", "font-size": "0.75rem"})
                                 ], className="text-end", id="pdf-btn-container")
-                            ], md=4)
+                            ], md=6)
                         ])
                     ]),
                     dbc.CardBody([
@@ -414,11 +540,17 @@ def create_layout():
             ], md=8, lg=6, className="mx-auto")
         ], className="mb-4"),
         
+        # Page URL (query options such as ?profile=1)
+        dcc.Location(id="url", refresh=False),
+        
         # Store components
         dcc.Store(id="stored-data"),
         dcc.Store(id="biomass-data-store", data=[]),
+        dcc.Store(id="biomass-row-count", data=0),
         dcc.Store(id="current-csv-data"),
         dcc.Store(id="current-label-options"),
+        dcc.Store(id="current-job-id"),
+        dcc.Store(id="job-summary"),
         
         # Download component for PDF downloads
         dcc.Download(id="download-pdf")
@@ -0,0 +1,320 @@
+"""Load test for the serving configuration: mixed render and download traffic.
+
+Starts gunicorn locally with gunicorn.conf.py, renders one large sheet to
+download, then for a fixed time runs slow download clients (throttled reads,
+like users on a poor connection fetching big PDFs) next to render clients
+that click "Generate PDF" back to back through the Dash callback endpoint,
+each with rows the server has not rendered before (--repeat-rows measures
+warm renders spliced from the page fragment cache instead).
+It reports render latency/throughput and download bandwidth per server
+configuration, so the threaded + render pool setup can be compared with the
+old single sync worker.
+
+    python loadtest.py                               # every configuration, 60 s each
+    python loadtest.py --configs threaded --duration 30 --downloaders 16
+    python loadtest.py --download-kbps 100 -o loadtest_results.json
+
+Each server runs in a temporary working directory, so labels_pdf/ output and
+the short code registry never touch the repository. Everything runs on
+localhost.
+"""
+import os
+import re
+import sys
+import json
+import time
+import socket
+import argparse
+import tempfile
+import itertools
+import threading
+import subprocess
+import http.client
+
+from benchmark import biomass_dataset
+
+
+REPO = os.path.dirname(os.path.abspath(__file__))
+
+# Server configurations to compare (environment for gunicorn.conf.py)
+CONFIGS = {
+    # The previous deployment: one sync worker rendering in the request
+    # (gunicorn turns a sync worker with threads > 1 into gthread)
+    "sync": {"GUNICORN_WORKER_CLASS": "sync", "GUNICORN_THREADS": "1", "WEB_CONCURRENCY": "1",
+             "LABELS_RENDER_WORKERS": "0"},
+    # Threaded worker, rendering in the request thread
+    "threaded_inline": {"LABELS_RENDER_WORKERS": "0"},
+    # gunicorn.conf.py defaults: threaded worker and a render process pool
+    "threaded": {},
+}
+
+LABEL_OPTIONS = {"style": "biomass", "output_type": "barcode"}
+
+# Receive buffer of the simulated download clients, in bytes
+RECEIVE_BUFFER = 64 * 1024
+
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def percentile(values, q):
+    """q-th percentile (0-100) by nearest rank; None for no values"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, max(int(round(q / 100 * len(ordered))) - 1, 0))]
+
+
+class Server:
+    """gunicorn serving app:server from a temporary working directory"""
+
+    def __init__(self, config_env, timeout=120):
+        self.port = _free_port()
+        self.workdir = tempfile.TemporaryDirectory(prefix="labels_load_")
+        env = dict(os.environ, **config_env)
+        env.update({"PORT": str(self.port), "GUNICORN_TIMEOUT": str(timeout),
+                    "LABELS_SHORT_ID_DB": os.path.join(self.workdir.name, "short_ids.db")})
+        # Every simulated user comes from 127.0.0.1, so no per-client job limit
+        env.setdefault("LABELS_MAX_JOBS_PER_CLIENT", "0")
+        env.pop("RENDER", None)
+        self.proc = subprocess.Popen(
+            [sys.executable, "-m", "gunicorn", "-c", os.path.join(REPO, "gunicorn.conf.py"),
+             "--pythonpath", REPO, "--bind", f"127.0.0.1:{self.port}", "app:server"],
+            cwd=self.workdir.name, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+
+    def wait_ready(self, timeout=60):
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            if self.proc.poll() is not None:
+                raise RuntimeError(self.proc.stderr.read().decode(errors="replace")[-2000:])
+            try:
+                conn = http.client.HTTPConnection("127.0.0.1", self.port, timeout=5)
+                conn.request("GET", "/_dash-layout")
+                if conn.getresponse().status == 200:
+                    return
+            except OSError:
+                time.sleep(0.25)
+        raise RuntimeError("server did not start")
+
+    def stop(self):
+        self.proc.terminate()
+        try:
+            self.proc.wait(timeout=30)
+        except subprocess.TimeoutExpired:
+            self.proc.kill()
+        self.workdir.cleanup()
+
+
+class DashClient:
+    """Calls Dash callbacks over HTTP the way the browser does"""
+
+    def __init__(self, port, timeout=300):
+        self.port = port
+        self.timeout = timeout
+        self.dependencies = self.get_json("/_dash-dependencies")
+
+    def _conn(self):
+        return http.client.HTTPConnection("127.0.0.1", self.port, timeout=self.timeout)
+
+    def get_json(self, path):
+        conn = self._conn()
+        conn.request("GET", path)
+        response = conn.getresponse()
+        if response.status != 200:
+            raise RuntimeError(f"GET {path}: HTTP {response.status}")
+        return json.loads(response.read())
+
+    def find(self, input_id, output_id):
+        """The callback triggered by `input_id` that updates `output_id`"""
+        for dependency in self.dependencies:
+            if (any(i["id"] == input_id for i in dependency["inputs"])
+                    and f"..{output_id}." in ".." + dependency["output"]):
+                return dependency
+        raise KeyError(f"no callback from {input_id} to {output_id}")
+
+    def find_render(self):
+        """(callback, button id) that renders a whole job: the preview's confirm button, else "Generate" """
+        for button in ("confirm-render-btn", "generate-pdf-btn"):
+            try:
+                return self.find(button, "current-job-id"), button
+            except KeyError:
+                continue
+        raise KeyError("no render callback")
+
+    def call(self, dependency, inputs, state=None):
+        """POST one callback; `inputs`/`state` map component id to value. Returns the response dict."""
+        outputs = []
+        for spec in dependency["output"].strip(".").split("..."):
+            component, prop = spec.rsplit(".", 1)
+            outputs.append({"id": component, "property": prop.split("@")[0]})
+        state = state or {}
+        payload = {
+            "output": dependency["output"],
+            "outputs": outputs if len(outputs) > 1 else outputs[0],
+            "inputs": [dict(i, value=inputs.get(i["id"])) for i in dependency["inputs"]],
+            "changedPropIds": [f"{i['id']}.{i['property']}" for i in dependency["inputs"] if i["id"] in inputs],
+            "state": [dict(s, value=state.get(s["id"])) for s in dependency.get("state", [])],
+        }
+        conn = self._conn()
+        conn.request("POST", "/_dash-update-component", body=json.dumps(payload),
+                     headers={"Content-Type": "application/json"})
+        response = conn.getresponse()
+        body = response.read()
+        if response.status != 200:
+            raise RuntimeError(f"callback {dependency['output']}: HTTP {response.status}")
+        return json.loads(body)["response"]
+
+
+def generate(client, rows):
+    """Click "Generate PDF" for `rows` labels; returns the download filename"""
+    dependency, button = client.find_render()
+    response = client.call(dependency, {button: 1}, {
+        "current-csv-data": rows, "current-label-options": LABEL_OPTIONS,
+        "url": "", "output-format": "pdf", "pdf-profile": "default"})
+    match = re.search(r"/download/([\w.\-]+)", json.dumps(response))
+    if match is None:
+        raise RuntimeError("no PDF in the callback response")
+    return match.group(1)
+
+
+def render_sheet(n, request):
+    """Rows of one render request. IDs are offset per request, so every render draws its
+    pages instead of splicing them from the previous request's page fragments"""
+    df = biomass_dataset(n)
+    for column in ("info1", "ucode"):
+        df[column] = f"R{request}-" + df[column]
+    return df.to_dict("records")
+
+
+def download(port, filename, kbps, stop, timeout):
+    """Fetch a file reading at most `kbps` KB/s; returns bytes read"""
+    # A small receive window, as over a real network path; on loopback the
+    # kernel would otherwise buffer megabytes and hide a blocked worker
+    sock = socket.socket()
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, RECEIVE_BUFFER)
+    sock.settimeout(timeout)
+    sock.connect(("127.0.0.1", port))
+    conn = http.client.HTTPConnection("127.0.0.1", port, timeout=timeout)
+    conn.sock = sock
+    conn.request("GET", f"/download/{filename}")
+    response = conn.getresponse()
+    if response.status != 200:
+        raise RuntimeError(f"download: HTTP {response.status}")
+    chunk = 16 * 1024
+    received = 0
+    while not stop.is_set():
+        data = response.read(chunk)
+        if not data:
+            break
+        received += len(data)
+        time.sleep(len(data) / (kbps * 1024))
+    conn.close()
+    return received
+
+
+def run_config(name, args):
+    """Run the mixed workload against one server configuration"""
+    server = Server(CONFIGS[name], timeout=args.timeout)
+    try:
+        server.wait_ready()
+        client = DashClient(server.port, timeout=args.timeout)
+        big_file = generate(client, biomass_dataset(args.download_rows).to_dict("records"))
+        repeated_rows = biomass_dataset(args.render_rows).to_dict("records")
+        requests = itertools.count()
+
+        stop = threading.Event()
+        lock = threading.Lock()
+        render_latencies, download_bytes, errors = [], [0], {"render": 0, "download": 0}
+
+        def render_client():
+            while not stop.is_set():
+                rows = repeated_rows if args.repeat_rows else render_sheet(args.render_rows, next(requests))
+                start = time.perf_counter()
+                try:
+                    generate(client, rows)
+                except (OSError, RuntimeError):
+                    with lock:
+                        errors["render"] += 1
+                    continue
+                with lock:
+                    render_latencies.append(time.perf_counter() - start)
+
+        def download_client():
+            while not stop.is_set():
+                try:
+                    received = download(server.port, big_file, args.download_kbps, stop, args.timeout)
+                except (OSError, RuntimeError, http.client.HTTPException):
+                    with lock:
+                        errors["download"] += 1
+                    continue
+                with lock:
+                    download_bytes[0] += received
+
+        threads = ([threading.Thread(target=download_client, daemon=True) for _ in range(args.downloaders)]
+                   + [threading.Thread(target=render_client, daemon=True) for _ in range(args.renderers)])
+        start = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        time.sleep(args.duration)
+        stop.set()
+        for thread in threads:
+            thread.join(args.timeout)
+        elapsed = time.perf_counter() - start
+    finally:
+        server.stop()
+
+    return {
+        "config": name,
+        "render_rows": "repeated" if args.repeat_rows else "distinct",
+        "seconds": round(elapsed, 2),
+        "renders": len(render_latencies),
+        "renders_per_second": round(len(render_latencies) / elapsed, 3),
+        "labels_per_second": round(len(render_latencies) * args.render_rows / elapsed, 1),
+        "render_p50": percentile(render_latencies, 50),
+        "render_p95": percentile(render_latencies, 95),
+        "download_mb_per_second": round(download_bytes[0] / elapsed / 1e6, 2),
+        "errors": errors,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Mixed render/download load test against gunicorn")
+    parser.add_argument("--configs", default=",".join(CONFIGS), help="comma-separated server configurations")
+    parser.add_argument("--duration", type=float, default=60, help="seconds of traffic per configuration")
+    parser.add_argument("--renderers", type=int, default=2, help="clients generating PDFs back to back")
+    parser.add_argument("--render-rows", type=int, default=200, help="labels per render request")
+    parser.add_argument("--repeat-rows", action="store_true",
+                        help="post the same rows every time (warm: pages come from the fragment cache)")
+    parser.add_argument("--downloaders", type=int, default=8, help="slow download clients")
+    parser.add_argument("--download-rows", type=int, default=20000, help="labels in the downloaded PDF")
+    parser.add_argument("--download-kbps", type=float, default=200, help="read rate of each download client")
+    parser.add_argument("--timeout", type=int, default=120, help="client and gunicorn timeout in seconds")
+    parser.add_argument("-o", "--output", default="loadtest_results.json")
+    args = parser.parse_args(argv)
+
+    configs = [c.strip() for c in args.configs.split(",") if c.strip()]
+    unknown = [c for c in configs if c not in CONFIGS]
+    if unknown:
+        parser.error(f"unknown config(s): {', '.join(unknown)}; choose from {', '.join(CONFIGS)}")
+
+    results = []
+    for name in configs:
+        result = run_config(name, args)
+        results.append(result)
+        p50 = f"{result['render_p50']:.2f}" if result["render_p50"] is not None else "-"
+        p95 = f"{result['render_p95']:.2f}" if result["render_p95"] is not None else "-"
+        print(f"{name:>15}  {result['renders']:>5} renders  {result['labels_per_second']:>8.1f} labels/s  "
+              f"p50 {p50:>6} s  p95 {p95:>6} s  {result['download_mb_per_second']:>6.2f} MB/s downloads  "
+              f"errors {result['errors']}")
+
+    with open(args.output, "w") as f:
+        json.dump({"args": vars(args), "results": results}, f, indent=2)
+    print(f"Results written to {args.output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
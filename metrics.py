@@ -0,0 +1,285 @@
+import os
+import time
+import threading
+import functools
+from bisect import bisect_left
+
+
+# Metrics are on by default; set LABELS_METRICS=0 to disable them entirely.
+# When disabled, the /metrics route is not registered, job decorators return
+# the original function and timers are a shared no-op object.
+ENABLED = os.environ.get('LABELS_METRICS', '1').lower() not in ('0', 'false', 'no', 'off')
+
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5,
+                   1, 2.5, 5, 10, 30, 60, 120, 300)
+THROUGHPUT_BUCKETS = (1, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+BYTES_BUCKETS = (1e3, 1e4, 1e5, 5e5, 1e6, 5e6, 1e7, 5e7, 1e8, 5e8)
+
+_registry = []
+
+
+def _label_key(labels):
+    return tuple(sorted(labels.items()))
+
+
+def _format_labels(key, extra=()):
+    pairs = list(key) + list(extra)
+    if not pairs:
+        return ""
+    body = ",".join('{}="{}"'.format(k, str(v).replace('\\', '\\\\').replace('"', '\\"'))
+                    for k, v in pairs)
+    return "{" + body + "}"
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    """Base class holding one metric family and its labelled samples"""
+    kind = "untyped"
+
+    def __init__(self, name, documentation):
+        self.name = name
+        self.documentation = documentation
+        self._lock = threading.Lock()
+        self._values = {}
+        _registry.append(self)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_format_labels(key)} {_format_value(value)}")
+        return lines
+
+
+class Counter(_Metric):
+    """Monotonically increasing counter"""
+    kind = "counter"
+
+    def inc(self, amount=1, **labels):
+        key = _label_key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(_Metric):
+    """Value that can go up and down (e.g. queue depth)"""
+    kind = "gauge"
+
+    def set(self, value, **labels):
+        with self._lock:
+            self._values[_label_key(labels)] = value
+
+    def inc(self, amount=1, **labels):
+        key = _label_key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+
+class Histogram(_Metric):
+    """Cumulative-bucket histogram in Prometheus exposition format"""
+    kind = "histogram"
+
+    def __init__(self, name, documentation, buckets=LATENCY_BUCKETS):
+        super().__init__(name, documentation)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, **labels):
+        key = _label_key(labels)
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            sample = self._values.get(key)
+            if sample is None:
+                sample = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            sample[0][index] += 1
+            sample[1] += value
+            sample[2] += 1
+
+    def total(self, **labels):
+        """(sum, count) over all samples whose labels include the given ones"""
+        wanted = set(labels.items())
+        total, count = 0.0, 0
+        with self._lock:
+            for key, sample in self._values.items():
+                if wanted <= set(key):
+                    total += sample[1]
+                    count += sample[2]
+        return total, count
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        with self._lock:
+            for key, (counts, total, count) in sorted(self._values.items()):
+                cumulative = 0
+                for bound, bucket_count in zip(self.buckets + (float('inf'),), counts):
+                    cumulative += bucket_count
+                    le = (("le", _format_value(float(bound))),)
+                    lines.append(f"{self.name}_bucket{_format_labels(key, le)} {cumulative}")
+                lines.append(f"{self.name}_sum{_format_labels(key)} {_format_value(total)}")
+                lines.append(f"{self.name}_count{_format_labels(key)} {count}")
+        return lines
+
+
+# Pipeline metrics
+STAGE_SECONDS = Histogram(
+    "labels_stage_seconds", "Time spent in each pipeline stage (upload decode/parse, CSV build, "
+    "per-label symbol encode and draw, PDF save)")
+JOB_SECONDS = Histogram("labels_job_seconds", "End-to-end PDF render latency per job")
+JOB_LABELS_PER_SECOND = Histogram(
+    "labels_job_labels_per_second", "Render throughput per job", buckets=THROUGHPUT_BUCKETS)
+JOB_LABELS = Counter("labels_rendered_total", "Number of labels rendered")
+PDF_BYTES = Histogram("labels_pdf_bytes", "Size of generated PDFs", buckets=BYTES_BUCKETS)
+DOWNLOAD_BYTES = Counter("labels_download_bytes_total", "Bytes served from /download")
+DOWNLOADS = Counter("labels_downloads_total", "Requests served from /download")
+CACHE_REQUESTS = Counter("labels_cache_requests_total", "Cache lookups by cache and result")
+QUEUE_DEPTH = Gauge("labels_render_queue_depth", "Render jobs currently queued or running")
+OUTPUT_FILES = Gauge("labels_output_files", "Files in the local labels_pdf/ directory")
+OUTPUT_BYTES = Gauge("labels_output_bytes", "Disk bytes used by labels_pdf/ (hardlinks counted once)")
+RETENTION_REMOVED = Counter("labels_retention_removed_total", "Output files deleted by retention, by reason")
+RETENTION_DEDUPLICATED = Counter(
+    "labels_retention_deduplicated_bytes_total", "Bytes freed by hardlinking identical outputs")
+ADMISSIONS = Counter("labels_admission_total", "Render jobs by admission outcome (and rejection reason)")
+ADMISSION_WAIT = Histogram("labels_admission_wait_seconds", "Time admitted jobs waited for a render slot")
+
+
+class _NullTimer:
+    """Shared no-op context manager used when metrics are disabled"""
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NULL_TIMER = _NullTimer()
+
+
+class _Timer:
+    def __init__(self, histogram, labels):
+        self.histogram = histogram
+        self.labels = labels
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.histogram.observe(time.perf_counter() - self.start, **self.labels)
+        return False
+
+
+def stage_timer(stage, **labels):
+    """Time a block of code as a pipeline stage"""
+    if not ENABLED:
+        return _NULL_TIMER
+    return _Timer(STAGE_SECONDS, dict(labels, stage=stage))
+
+
+def timed(stage):
+    """Decorator timing every call of a function as a pipeline stage"""
+    def decorator(func):
+        if not ENABLED:
+            return func
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with _Timer(STAGE_SECONDS, {"stage": stage}):
+                return func(*args, **kwargs)
+
+        return wrapper
+    return decorator
+
+
+def record_cache(cache, hit):
+    """Count a cache lookup; hit rate is hits / (hits + misses)"""
+    if ENABLED:
+        CACHE_REQUESTS.inc(cache=cache, result="hit" if hit else "miss")
+
+
+def record_download(num_bytes):
+    """Count bytes served by the download route"""
+    if ENABLED:
+        DOWNLOADS.inc()
+        DOWNLOAD_BYTES.inc(num_bytes)
+
+
+def record_retention(files, num_bytes, removed, deduplicated_bytes):
+    """Record the outcome of a labels_pdf/ retention sweep (`removed` maps reason to count)"""
+    if ENABLED:
+        OUTPUT_FILES.set(files)
+        OUTPUT_BYTES.set(num_bytes)
+        for reason, count in removed.items():
+            if count:
+                RETENTION_REMOVED.inc(count, reason=reason)
+        if deduplicated_bytes:
+            RETENTION_DEDUPLICATED.inc(deduplicated_bytes)
+
+
+def record_admission(outcome, reason=None, wait_seconds=None):
+    """Count an admission decision; queued jobs also record how long they waited"""
+    if ENABLED:
+        if reason:
+            ADMISSIONS.inc(outcome=outcome, reason=reason)
+        else:
+            ADMISSIONS.inc(outcome=outcome)
+        if wait_seconds is not None:
+            ADMISSION_WAIT.observe(wait_seconds)
+
+
+def output_size(result):
+    """Size in bytes of a generator result (file path, in-memory buffer or stored bytes)"""
+    if isinstance(result, (bytes, bytearray)):
+        return len(result)
+    if hasattr(result, 'getbuffer'):
+        return result.getbuffer().nbytes
+    if isinstance(result, (str, os.PathLike)) and os.path.exists(result):
+        return os.path.getsize(result)
+    return 0
+
+
+def instrument_job(style):
+    """Decorator recording latency, throughput, output size and queue depth of a PDF generator.
+
+    The generator must take the label DataFrame as its first argument.
+    """
+    def decorator(func):
+        # The style is kept on the generator so render_pool can record the
+        # job under the same label when it runs in a worker process
+        func.job_style = style
+        if not ENABLED:
+            return func
+
+        @functools.wraps(func)
+        def wrapper(df, *args, **kwargs):
+            QUEUE_DEPTH.inc()
+            start = time.perf_counter()
+            try:
+                result = func(df, *args, **kwargs)
+            finally:
+                QUEUE_DEPTH.dec()
+            elapsed = time.perf_counter() - start
+            JOB_SECONDS.observe(elapsed, style=style)
+            JOB_LABELS.inc(len(df), style=style)
+            if elapsed > 0:
+                JOB_LABELS_PER_SECOND.observe(len(df) / elapsed, style=style)
+            PDF_BYTES.observe(output_size(result), style=style)
+            return result
+
+        return wrapper
+    return decorator
+
+
+def render_prometheus():
+    """Render every registered metric in Prometheus text exposition format"""
+    lines = []
+    for metric in _registry:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
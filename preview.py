@@ -0,0 +1,41 @@
+import io
+import os
+import base64
+
+import metrics
+import raster
+import short_ids
+import utils
+
+
+# Preview before a full render: "Generate" first draws only the first
+# LABELS_PREVIEW_LABELS labels as small PNG thumbnails with the image
+# renderer (raster.py, the same layouts as the PDF generators) and shows them
+# in the viewer pane; the whole job renders once the user confirms. Symbols go
+# through utils.symbol_matrix, whose cache is per process: the preview runs
+# in the render process the full render will use (render_pool affinity), so
+# the full render reuses the preview's encodings unless that process was busy
+# and the job went to another one. LABELS_PREVIEW_LABELS=0 renders the full
+# job straight away.
+LABELS = int(os.environ.get('LABELS_PREVIEW_LABELS', '6'))
+DPI = int(os.environ.get('LABELS_PREVIEW_DPI', '150'))
+
+
+def render_preview(df, label_options, count=None):
+    """[(label number, copies, PNG data URI)] for the first `count` labels of a job"""
+    count = LABELS if count is None else count
+    style = label_options["style"]
+    symbology = utils.label_symbology(label_options)
+    head = df.head(count)
+    if label_options.get("short_ids"):
+        # Codes are stable per full ID, so these are the codes the full render prints
+        head = short_ids.assign_codes(head, style, label_options["short_ids"])
+
+    thumbnails = []
+    with metrics.stage_timer("preview", style=style):
+        for number, (row, copies) in enumerate(utils.label_rows(head, label_options.get("copies", 1)), start=1):
+            buffer = io.BytesIO()
+            raster.render_label(row, style, symbology, DPI).save(buffer, "PNG")
+            data = base64.b64encode(buffer.getvalue()).decode("ascii")
+            thumbnails.append((number, copies, f"data:image/png;base64,{data}"))
+    return thumbnails
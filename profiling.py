@@ -0,0 +1,46 @@
+import os
+import marshal
+import cProfile
+from urllib.parse import parse_qs
+
+
+# Profile every render job when LABELS_PROFILE=1; otherwise only jobs
+# requested with ?profile=1 on the page URL are profiled.
+PROFILE_ALL = os.environ.get('LABELS_PROFILE', '').lower() in ('1', 'true', 'yes', 'on')
+
+
+def profiling_requested(search=None):
+    """Check the env switch and the page query string (e.g. '?profile=1')"""
+    if PROFILE_ALL:
+        return True
+    if not search:
+        return False
+    values = parse_qs(search.lstrip('?')).get('profile', [])
+    return any(v.lower() in ('1', 'true', 'yes', 'on') for v in values)
+
+
+def profile_filename(pdf_filename):
+    """Name of the profile stored next to a PDF artifact"""
+    return os.path.splitext(pdf_filename)[0] + ".prof"
+
+
+def run_profiled(generator, df, pdf_filename, pdf_storage, **kwargs):
+    """Run a PDF generator under cProfile and store the stats next to the PDF.
+
+    The profile is written in pstats format (load with pstats, snakeviz or
+    flameprof to get a flamegraph). Returns (generator result, profile filename).
+    """
+    profiler = cProfile.Profile()
+    profiler.enable()
+    try:
+        result = generator(df, pdf_filename, **kwargs)
+    finally:
+        profiler.disable()
+
+    prof_filename = profile_filename(pdf_filename)
+    if os.environ.get('RENDER'):
+        profiler.create_stats()
+        pdf_storage[prof_filename] = marshal.dumps(profiler.stats)
+    else:
+        profiler.dump_stats(os.path.join("labels_pdf", prof_filename))
+    return result, prof_filename
@@ -0,0 +1,339 @@
+import os
+import io
+import struct
+import zipfile
+import threading
+import contextlib
+import functools
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+import reportlab
+from PIL import Image, ImageFont
+from reportlab.graphics.barcode import code128
+
+import metrics
+import render_pool
+import utils
+
+
+# Image output: every label is rendered as a 1-bit page image at DPI, as a
+# multi-page Group 4 TIFF or a ZIP of PNGs. Symbols and bars are written
+# straight into a NumPy page buffer (a module matrix is scaled with one index
+# lookup) and text is composed from cached glyph masks. Rows are rendered and encoded in
+# batches across a shared pool of worker processes (LABELS_RASTER_WORKERS,
+# default all cores; 0 renders inline). Inside a render_pool worker batches
+# are rendered inline, since that process already is one of a pool sized to
+# the cores. Layouts and coordinates (points, origin bottom-left) follow the
+# PDF generators in utils.py.
+DPI = int(os.environ.get('LABELS_RASTER_DPI', '300'))
+WORKERS = int(os.environ.get('LABELS_RASTER_WORKERS') or os.cpu_count() or 1)
+# Labels per worker task
+BATCH_SIZE = 256
+IMAGE_FORMATS = ("tiff", "png")
+
+_executor = None
+_lock = threading.Lock()
+
+# ReportLab ships Type 1 fonts with Helvetica's metrics
+FONT_DIR = os.path.join(os.path.dirname(reportlab.__file__), "fonts")
+FONT_FILES = {"Helvetica": "_a______.pfb", "Helvetica-Bold": "_ab_____.pfb"}
+
+# Page sizes in points (width, height), as in the PDF generators
+PAGE_SIZES = {"qr": (144, 216), "biomass": (216, 144), "line": (216, 144)}
+
+
+@functools.lru_cache(maxsize=None)
+def _font(name, pixels):
+    return ImageFont.truetype(os.path.join(FONT_DIR, FONT_FILES[name]), pixels)
+
+
+@functools.lru_cache(maxsize=4096)
+def _glyph(name, pixels, char):
+    """(ink mask, offset from the pen position on the baseline, advance) of one character"""
+    font = _font(name, pixels)
+    image, (left, top) = font.getmask2(char, mode="L", anchor="ls")
+    mask = np.asarray(image, dtype=np.uint8).reshape(image.size[1], image.size[0]) >= 128
+    return mask, left, top, font.getlength(char)
+
+
+@functools.lru_cache(maxsize=64)
+def _scale_index(modules, pixels):
+    """Module index of every pixel along a symbol `pixels` wide"""
+    return np.arange(pixels) * modules // pixels
+
+
+class Page:
+    """One label image; draws in points with the origin at the bottom left like a canvas"""
+
+    def __init__(self, size, dpi):
+        self.scale = dpi / 72
+        self.width, self.height = (int(round(v * self.scale)) for v in size)
+        # True where the printer puts ink
+        self.ink = np.zeros((self.height, self.width), dtype=bool)
+
+    def _x(self, x):
+        return int(round(x * self.scale))
+
+    def _y(self, y):
+        return self.height - int(round(y * self.scale))
+
+    def rect(self, x, y, width, height, line=1):
+        left, right = self._x(x), self._x(x + width)
+        top, bottom = self._y(y + height), self._y(y)
+        thickness = max(int(round(line * self.scale)), 1)
+        self.ink[top:top + thickness, left:right] = True
+        self.ink[bottom - thickness:bottom, left:right] = True
+        self.ink[top:bottom, left:left + thickness] = True
+        self.ink[top:bottom, right - thickness:right] = True
+
+    def matrix(self, matrix, x, y, size):
+        """Blit a module matrix (rows of booleans) `size` points wide"""
+        modules = np.asarray(matrix, dtype=bool)
+        pixels = self._x(x + size) - self._x(x)
+        index = _scale_index(len(modules), pixels)
+        top, left = self._y(y + size), self._x(x)
+        self.ink[top:top + pixels, left:left + pixels] |= modules[index][:, index]
+
+    def bars(self, widths, x, y, bar_width, height):
+        """Barcode from alternating bar/space widths in modules, starting with a bar"""
+        edges = np.round((x + np.concatenate(([0], np.cumsum(widths))) * bar_width) * self.scale).astype(int)
+        columns = np.zeros(self.width, dtype=bool)
+        for start, end in zip(edges[0::2], edges[1::2]):
+            columns[start:end] = True
+        self.ink[self._y(y + height):self._y(y), columns] = True
+
+    def text(self, x, y, text, font, size, centred=False, max_width=None):
+        """Text from cached glyph masks (the standard fonts have no kerning), fitted like the PDF"""
+        text = str(text)
+        if max_width is not None:
+            text, size = utils.fit_text(text, font, size, max_width)
+        pixels = int(round(size * self.scale))
+        glyphs = [_glyph(font, pixels, char) for char in text]
+        pen = x * self.scale
+        if centred:
+            pen -= sum(glyph[3] for glyph in glyphs) / 2
+        baseline = self._y(y)
+        for mask, left, top, advance in glyphs:
+            gx, gy = int(round(pen)) + left, baseline + top
+            pen += advance
+            # Clip glyphs running off the page
+            x0, y0 = max(gx, 0), max(gy, 0)
+            x1, y1 = min(gx + mask.shape[1], self.width), min(gy + mask.shape[0], self.height)
+            if x0 < x1 and y0 < y1:
+                self.ink[y0:y1, x0:x1] |= mask[y0 - gy:y1 - gy, x0 - gx:x1 - gx]
+
+    def image(self):
+        """Bilevel PIL image (1 bit per pixel, white background)"""
+        return Image.frombytes("1", (self.width, self.height), np.packbits(~self.ink, axis=1).tobytes())
+
+
+def _code128_widths(text):
+    barcode = code128.Code128(text, barWidth=0.7, lquiet=0, rquiet=0)
+    barcode.validate()
+    barcode.encode()
+    barcode.decompose()
+    # Upper case letters are bars, lower case spaces, 'a' being one module
+    return [ord(c.lower()) - 96 for c in barcode.decomposed]
+
+
+def _draw_qr_label(page, row, symbology):
+    height = PAGE_SIZES["qr"][1]
+    matrix = utils.symbol_matrix(symbology, str(row.get("short_code") or row.get("ID", "NO_ID")), 72)
+    page.matrix(matrix, 36, height - 90, 72)
+    for position, attr in enumerate(["Plot", "Site", "Year", "Sampling Stage/Depth", "Project", "Treatment"]):
+        font, size = ("Helvetica-Bold", 10) if attr == "Plot" else ("Helvetica", 8)
+        page.text(7.2, height - 111.6 - position * 15, f"{attr}: {row.get(attr, 'N/A')}", font, size,
+                  max_width=129.6)
+
+
+def _draw_biomass_label(page, row, symbology):
+    symbol_text = str(row.get('short_code') or row['info1'])
+    page.rect(3.6, 1.8, 208.8, 136.8)
+    page.text(108, 115.2, row['info1'], "Helvetica-Bold", 14, centred=True, max_width=201.6)
+    page.text(108, 86.4, row['info2'], "Helvetica-Bold", 12, centred=True, max_width=201.6)
+    page.text(108, 64.8, row['info3'], "Helvetica", 10, centred=True, max_width=201.6)
+    if symbology in utils.SYMBOLOGIES:
+        page.matrix(utils.symbol_matrix(symbology, symbol_text, 43.2), 86.4, 14.4, 43.2)
+    else:
+        widths = _code128_widths(symbol_text)
+        page.bars(widths, 108 - sum(widths) * 0.7 / 2, 21.6, 0.7, 28.8)
+    if pd.notna(row.get('ucode')):
+        page.text(108, 5.76, row['ucode'], "Helvetica-Bold", 8, centred=True, max_width=201.6)
+
+
+def _draw_line_label(page, row, symbology):
+    symbol_text = utils._line_symbol_text(row)
+    page.rect(3.6, 3.6, 208.8, 136.8)
+    page.matrix(utils.symbol_matrix(symbology, symbol_text, 50.4), 82.8, 46.8, 50.4)
+    page.text(10.8, 86.4, "Plot", "Helvetica", 10)
+    page.text(10.8, 61.2, row.get('info1', 'ID'), "Helvetica-Bold", 14, max_width=68.4)
+    info_parts = [str(row[key]) for key in ('info2', 'info3') if row.get(key) and str(row[key]).strip()]
+    if info_parts:
+        page.text(151.2, 86.4, " ".join(info_parts), "Helvetica-Bold", 12, max_width=61.2)
+    if row.get('ucode') and str(row['ucode']).strip():
+        page.text(151.2, 61.2, f"Code: {row['ucode']}", "Helvetica", 10, max_width=61.2)
+
+
+LABELS = {"qr": _draw_qr_label, "biomass": _draw_biomass_label, "line": _draw_line_label}
+
+
+def render_label(row, style="qr", symbology="qr", dpi=None):
+    """PIL image of one label"""
+    page = Page(PAGE_SIZES[style], dpi or DPI)
+    LABELS[style](page, row, symbology)
+    return page.image()
+
+
+def _tiff_page(image):
+    """Group 4 encode one page: (width, height, photometric, rows per strip, strips)"""
+    buffer = io.BytesIO()
+    image.save(buffer, "TIFF", compression="group4")
+    data = buffer.getvalue()
+    tags = Image.open(io.BytesIO(data)).tag_v2
+    strips = [data[offset:offset + count] for offset, count in zip(tags[273], tags[279])]
+    return image.width, image.height, tags[262], tags.get(278, image.height), strips
+
+
+class MultiPageTiff:
+    """Streaming multi-page TIFF writer for pages encoded by _tiff_page.
+
+    Each page costs its strips plus one IFD, linked from the previous one, so
+    writing is linear in the number of pages (PIL's AppendingTiffWriter
+    re-reads every earlier IFD for each new page).
+    """
+
+    def __init__(self, f, dpi):
+        self.f = f
+        self.dpi = dpi
+        f.write(b"II*\x00")
+        self.next_pointer = f.tell()
+        f.write(b"\x00\x00\x00\x00")
+
+    def add(self, page):
+        width, height, photometric, rows_per_strip, strips = page
+        f = self.f
+        offsets = []
+        for strip in strips:
+            offsets.append(f.tell())
+            f.write(strip)
+        if f.tell() % 2:
+            f.write(b"\x00")
+        ifd = f.tell()
+        f.seek(self.next_pointer)
+        f.write(struct.pack("<I", ifd))
+        f.seek(ifd)
+
+        # (tag, type, values); 3 = SHORT, 4 = LONG, 5 = RATIONAL
+        entries = [
+            (254, 4, [2]),  # page of a multi-page file
+            (256, 4, [width]),
+            (257, 4, [height]),
+            (258, 3, [1]),
+            (259, 3, [4]),  # CCITT Group 4
+            (262, 3, [photometric]),
+            (273, 4, offsets),
+            (277, 3, [1]),
+            (278, 4, [rows_per_strip]),
+            (279, 4, [len(strip) for strip in strips]),
+            (282, 5, [self.dpi, 1]),
+            (283, 5, [self.dpi, 1]),
+            (296, 3, [2]),  # inches
+        ]
+        extra_offset = ifd + 2 + 12 * len(entries) + 4
+        table, extra = [struct.pack("<H", len(entries))], b""
+        for tag, kind, values in entries:
+            data = struct.pack("<" + ("H" if kind == 3 else "I") * len(values), *values)
+            count = len(values) // 2 if kind == 5 else len(values)
+            if len(data) <= 4:
+                value = data.ljust(4, b"\x00")
+            else:
+                value = struct.pack("<I", extra_offset + len(extra))
+                extra += data
+            table.append(struct.pack("<HHI", tag, kind, count) + value)
+        f.write(b"".join(table))
+        self.next_pointer = f.tell()
+        f.write(b"\x00\x00\x00\x00")
+        f.write(extra)
+        f.seek(0, os.SEEK_END)
+
+
+def _render_batch(records, style, symbology, dpi, image_format):
+    """Encoded page images (PNG bytes, or Group 4 TIFF pages) for a batch of (row, copies)"""
+    pages = []
+    for row, copies in records:
+        image = render_label(row, style, symbology, dpi)
+        if image_format == "png":
+            buffer = io.BytesIO()
+            image.save(buffer, "PNG", dpi=(dpi, dpi))
+            page = buffer.getvalue()
+        else:
+            page = _tiff_page(image)
+        # Copies repeat the encoded page; each label is rendered once
+        pages.extend([page] * copies)
+    return pages
+
+
+def _get_executor():
+    global _executor
+    with _lock:
+        if _executor is None:
+            # Spawned, not forked, for the same reason as the render pool
+            _executor = ProcessPoolExecutor(max_workers=WORKERS, mp_context=multiprocessing.get_context("spawn"))
+        return _executor
+
+
+def iter_pages(df, style="qr", symbology="qr", image_format="tiff", dpi=None, copies=1):
+    """Yield encoded page images in row order, rendering batches in parallel"""
+    dpi = dpi or DPI
+    records = list(utils.label_rows(df, copies))
+    batches = [records[i:i + BATCH_SIZE] for i in range(0, len(records), BATCH_SIZE)]
+    if WORKERS <= 1 or len(batches) <= 1 or render_pool.IN_WORKER:
+        for batch in batches:
+            yield from _render_batch(batch, style, symbology, dpi, image_format)
+        return
+    render = functools.partial(_render_batch, style=style, symbology=symbology, dpi=dpi,
+                               image_format=image_format)
+    for pages in _get_executor().map(render, batches):
+        yield from pages
+
+
+def shutdown():
+    """Stop the pool's worker processes (gunicorn calls this on worker exit)"""
+    global _executor
+    with _lock:
+        if _executor is not None:
+            _executor.shutdown(wait=False, cancel_futures=True)
+            _executor = None
+
+
+@metrics.instrument_job('raster')
+def create_raster(df, file_name, style="qr", symbology="qr", image_format="tiff", dpi=None, copies=1):
+    """Create label images: a multi-page TIFF, or a ZIP with one PNG per label"""
+    if image_format not in IMAGE_FORMATS:
+        raise ValueError(f"Unknown image format '{image_format}'")
+
+    # Use in-memory buffer for deployment, file system for local dev
+    if os.environ.get('RENDER'):
+        target = io.BytesIO()
+    else:
+        target = os.path.join("labels_pdf", file_name)
+
+    with metrics.stage_timer("raster_render", style=style, format=image_format):
+        pages = iter_pages(df, style, symbology, image_format, dpi, copies=copies)
+        if image_format == "png":
+            with zipfile.ZipFile(target, "w", zipfile.ZIP_STORED) as archive:
+                width = len(str(sum(n for _, n in utils.label_rows(df, copies))))
+                for number, page in enumerate(pages, start=1):
+                    archive.writestr(f"label_{number:0{width}d}.png", page)
+        else:
+            with open(target, "wb") if isinstance(target, str) else contextlib.nullcontext(target) as f:
+                tiff = MultiPageTiff(f, dpi or DPI)
+                for page in pages:
+                    tiff.add(page)
+
+    if os.environ.get('RENDER'):
+        target.seek(0)
+    return target  # Buffer for in-memory serving, file path for local development
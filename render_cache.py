@@ -0,0 +1,98 @@
+import os
+import hashlib
+import threading
+from cachetools import LRUCache
+
+import metrics
+
+
+# Page fragments are the PDF content-stream operators of one label page,
+# keyed by style/options and the row's content. They are self-contained
+# (vector symbols, standard fonts registered up front), so a cached
+# fragment spliced into a new canvas yields the same page content as
+# drawing the row again. LABELS_FRAGMENT_CACHE_MB=0 disables the cache.
+CACHE_MB = float(os.environ.get('LABELS_FRAGMENT_CACHE_MB', '256'))
+
+# Fonts used by the generators, registered in this order on every canvas so
+# internal font names (/F1, /F2, ...) do not depend on which pages were drawn.
+LABEL_FONTS = ("Helvetica", "Helvetica-Bold")
+
+_lock = threading.Lock()
+_fragments = LRUCache(maxsize=max(int(CACHE_MB * 1024 * 1024), 1), getsizeof=len)
+
+
+def register_fonts(c):
+    """Register the label fonts on a new canvas in a fixed order"""
+    for font in LABEL_FONTS:
+        c._doc.getInternalFontName(font)
+
+
+def fragment_key(style, row):
+    """Hash of the label style/options and the row's content"""
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(repr(style).encode('utf-8'))
+    for column, value in sorted(row.items(), key=lambda item: str(item[0])):
+        digest.update(b'\x1f')
+        digest.update(repr((str(column), value)).encode('utf-8'))
+    return digest.hexdigest()
+
+
+def get_fragment(key):
+    """Cached page operators for a key, or None"""
+    if CACHE_MB <= 0:
+        return None
+    with _lock:
+        fragment = _fragments.get(key)
+    metrics.record_cache("page_fragment", fragment is not None)
+    return fragment
+
+
+def has_fragment(key):
+    """Whether a key is cached, without counting a lookup or refreshing it"""
+    if CACHE_MB <= 0:
+        return False
+    with _lock:
+        return key in _fragments
+
+
+def put_fragment(key, fragment):
+    if CACHE_MB <= 0:
+        return
+    with _lock:
+        try:
+            _fragments[key] = fragment
+        except ValueError:
+            # Larger than the whole cache; just don't keep it
+            pass
+
+
+def clear():
+    with _lock:
+        _fragments.clear()
+
+
+def render_page(c, style, row, draw_label, copies=1):
+    """Emit one label page (or `copies` identical pages), splicing it from the fragment cache when possible.
+
+    `draw_label(c, row)` draws the label onto the current (empty) page. Its
+    operators are captured from the canvas and cached before the page is
+    closed; a cache hit appends the stored operators instead of drawing.
+    Copies repeat the operators without drawing again, and utils.save_canvas
+    writes identical pages with one shared content stream. Returns True on a
+    cache hit.
+    """
+    key = fragment_key(style, row)
+    fragment = get_fragment(key)
+    if fragment is None:
+        draw_label(c, row)
+        # Joining with newlines matches how ReportLab serialises the page stream
+        operators = "\n".join(c._code)
+        put_fragment(key, operators)
+    else:
+        operators = fragment
+        c._code.append(fragment)
+    c.showPage()
+    for _ in range(copies - 1):
+        c._code.append(operators)
+        c.showPage()
+    return fragment is not None
@@ -0,0 +1,116 @@
+import os
+import zlib
+import threading
+import functools
+import importlib
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+import metrics
+
+
+# CPU-bound label rendering can run in a pool of processes, so the web
+# process only serves requests (and slow downloads) and never holds the GIL
+# for a whole render. LABELS_RENDER_WORKERS=0 (the default) renders in the
+# request thread as before; gunicorn.conf.py sizes the pool for deployments.
+#
+# The page fragment cache (render_cache.py) and the symbol cache
+# (utils.symbol_matrix) live in the process that renders, so each worker is
+# its own single-process pool and work for the same sheet carries an
+# affinity key (jobs.sheet_key) that sends it to the same worker: the
+# preview, re-renders after edits and reprints then find the pages and
+# symbols that worker already has. When that worker is busy and another
+# is idle, the idle one takes the job (a cache miss rather than a wait).
+WORKERS = int(os.environ.get('LABELS_RENDER_WORKERS', '0'))
+# True inside a render worker process, where other pools (raster.py) stay inline
+IN_WORKER = False
+
+_executors = []
+_pending = []  # jobs submitted to each worker and not finished
+_next = 0
+_lock = threading.Lock()
+
+
+def _pick(affinity):
+    """Worker index for a job: the affinity key's worker unless it is busy and another is idle"""
+    global _next
+    if not _executors:
+        # Workers are spawned rather than forked: the web process has
+        # server threads running, and forking those is not safe
+        context = multiprocessing.get_context("spawn")
+        _executors.extend(ProcessPoolExecutor(max_workers=1, mp_context=context, initializer=_mark_worker)
+                          for _ in range(WORKERS))
+        _pending.extend([0] * WORKERS)
+    if affinity is None:
+        index = _next % WORKERS
+        _next += 1
+    else:
+        index = zlib.crc32(str(affinity).encode("utf-8")) % WORKERS
+    if _pending[index]:
+        idle = [i for i in range(WORKERS) if not _pending[i]]
+        if idle:
+            index = idle[0]
+    return index
+
+
+def _mark_worker():
+    global IN_WORKER
+    IN_WORKER = True
+
+
+def _call(module, name, args, kwargs):
+    return getattr(importlib.import_module(module), name)(*args, **kwargs)
+
+
+def _submit(func, args, kwargs, affinity=None):
+    with _lock:
+        index = _pick(affinity)
+        _pending[index] += 1
+        executor = _executors[index]
+    try:
+        future = executor.submit(_call, func.__module__, func.__name__, args, kwargs)
+        return future.result()
+    finally:
+        with _lock:
+            _pending[index] -= 1
+
+
+@functools.lru_cache(maxsize=None)
+def _instrumented(style):
+    @metrics.instrument_job(style)
+    def submit(df, file_name, generator, kwargs, affinity):
+        return _submit(generator, (df, file_name), kwargs, affinity)
+    return submit
+
+
+def run(generator, df, file_name, affinity=None, **kwargs):
+    """Call a label generator, in the render pool when one is configured.
+
+    The generator is looked up by module and name in the worker, so it must be
+    a module-level function (all of the create_* generators are). Job metrics
+    are recorded here, since the worker's own metrics never reach /metrics.
+    Renders with the same `affinity` key go to the same worker when possible.
+    """
+    if WORKERS <= 0:
+        return generator(df, file_name, **kwargs)
+    style = getattr(generator, "job_style", None)
+    with metrics.stage_timer("render_pool"):
+        if style:
+            return _instrumented(style)(df, file_name, generator, kwargs, affinity)
+        return _submit(generator, (df, file_name), kwargs, affinity)
+
+
+def call(func, *args, affinity=None, **kwargs):
+    """Call a module-level function in the render pool (inline without one), e.g. a preview"""
+    if WORKERS <= 0:
+        return func(*args, **kwargs)
+    return _submit(func, args, kwargs, affinity)
+
+
+def shutdown():
+    """Stop the pool's worker processes (gunicorn calls this on worker exit)"""
+    with _lock:
+        for executor in _executors:
+            executor.shutdown(wait=False, cancel_futures=True)
+        _executors.clear()
+        _pending.clear()
@@ -0,0 +1,212 @@
+import os
+import re
+import time
+import hashlib
+import threading
+from collections import Counter, defaultdict
+
+import metrics
+
+
+# Retention for the local labels_pdf/ directory (with RENDER outputs live in
+# memory and nothing is written). A background thread sweeps the directory:
+# files with identical content are hardlinked to one copy, files older than
+# MAX_AGE_HOURS are deleted, then the oldest files until the directory is
+# under MAX_MB and MAX_FILES. Set a limit to 0 to disable it.
+MAX_AGE_HOURS = float(os.environ.get('LABELS_RETENTION_MAX_AGE_HOURS', '168'))
+MAX_BYTES = int(float(os.environ.get('LABELS_RETENTION_MAX_MB', '5120')) * 1024 * 1024)
+MAX_FILES = int(os.environ.get('LABELS_RETENTION_MAX_FILES', '2000'))
+DEDUPLICATE = os.environ.get('LABELS_RETENTION_DEDUPE', '1').lower() not in ('0', 'false', 'no', 'off')
+# Seconds between sweeps, and the shortest gap when sweeps are requested early
+INTERVAL = float(os.environ.get('LABELS_RETENTION_INTERVAL', '300'))
+MIN_INTERVAL = 10
+# Files younger than this are never touched (they may still be written or downloaded)
+GRACE_SECONDS = 60
+
+HASH_CHUNK = 1 << 20
+
+# ReportLab stamps every PDF with its creation time and a random document ID,
+# so these are left out of the hash; two renders of the same labels match
+_VOLATILE_PDF = re.compile(rb"/(?:CreationDate|ModDate) \(D:[^)]*\)|/ID\s*\[<[0-9a-fA-F]*>\s*<[0-9a-fA-F]*>\]")
+_VOLATILE_MAX = 128
+
+_hashes = {}  # path -> ((size, mtime_ns, inode), digest)
+_sweep_lock = threading.Lock()
+_start_lock = threading.Lock()
+_wake = threading.Event()
+_thread = None
+
+
+def content_hash(path):
+    """SHA-256 of a file's content, ignoring the volatile timestamps and ID of PDFs"""
+    digest = hashlib.sha256()
+    mask = path.lower().endswith(".pdf")
+    pending = b""
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK), b""):
+            if not mask:
+                digest.update(chunk)
+                continue
+            pending += chunk
+            # Each volatile field contains a single "/", at its start, so
+            # cutting at a "/" never splits one; the rest waits for the next chunk
+            limit = max(len(pending) - _VOLATILE_MAX, 0)
+            cut = pending.rfind(b"/", 0, limit)
+            if cut < 0:
+                cut = limit
+            digest.update(_VOLATILE_PDF.sub(b"", pending[:cut]))
+            pending = pending[cut:]
+    digest.update(_VOLATILE_PDF.sub(b"", pending))
+    return digest.hexdigest()
+
+
+def _cached_hash(path, st):
+    key = (st.st_size, st.st_mtime_ns, st.st_ino)
+    cached = _hashes.get(path)
+    if cached is None or cached[0] != key:
+        cached = _hashes[path] = (key, content_hash(path))
+    return cached[1]
+
+
+def _scan(directory):
+    entries = []
+    with os.scandir(directory) as it:
+        for entry in it:
+            # Dot files are our own temporary links
+            if entry.name.startswith(".") or not entry.is_file(follow_symlinks=False):
+                continue
+            try:
+                entries.append((entry.path, entry.stat(follow_symlinks=False)))
+            except FileNotFoundError:
+                continue
+    return entries
+
+
+def _disk_bytes(entries):
+    return sum({st.st_ino: st.st_size for _, st in entries}.values())
+
+
+def _link(source, target):
+    """Atomically replace `target` with a hardlink to `source`"""
+    temp = os.path.join(os.path.dirname(target), f".{os.path.basename(target)}.link")
+    try:
+        os.link(source, temp)
+        os.replace(temp, target)
+        return True
+    except OSError:
+        # e.g. a filesystem without hardlinks; leave both copies
+        try:
+            os.remove(temp)
+        except OSError:
+            pass
+        return False
+
+
+def _deduplicate(entries):
+    """Hardlink files with identical content to the newest copy; returns the number relinked"""
+    by_size = defaultdict(list)
+    for path, st in entries:
+        if st.st_size:
+            by_size[st.st_size].append((path, st))
+    linked = 0
+    for group in by_size.values():
+        # Only files sharing a size can match, so most files are never hashed
+        if len({st.st_ino for _, st in group}) < 2:
+            continue
+        by_hash = defaultdict(list)
+        for path, st in group:
+            by_hash[_cached_hash(path, st)].append((path, st))
+        for digest, copies in by_hash.items():
+            # Linked names take the newest copy's age, so none expires earlier than before
+            keep, keep_st = max(copies, key=lambda copy: copy[1].st_mtime)
+            for path, st in copies:
+                if st.st_ino != keep_st.st_ino and _link(keep, path):
+                    _hashes[path] = ((keep_st.st_size, keep_st.st_mtime_ns, keep_st.st_ino), digest)
+                    linked += 1
+    return linked
+
+
+def _evict(entries, now):
+    """Delete expired files, then the oldest over the size/count limits"""
+    removed = {"age": 0, "size": 0, "count": 0}
+    links = Counter(st.st_ino for _, st in entries)
+    total_bytes, count = _disk_bytes(entries), len(entries)
+    # Oldest first; hardlinked names share an mtime, so they go together and
+    # the space is freed when the last one is deleted
+    for path, st in sorted(entries, key=lambda entry: entry[1].st_mtime):
+        age = now - st.st_mtime
+        if age < GRACE_SECONDS:
+            break
+        if MAX_AGE_HOURS and age > MAX_AGE_HOURS * 3600:
+            reason = "age"
+        elif MAX_BYTES and total_bytes > MAX_BYTES:
+            reason = "size"
+        elif MAX_FILES and count > MAX_FILES:
+            reason = "count"
+        else:
+            break
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        except OSError:
+            continue
+        _hashes.pop(path, None)
+        count -= 1
+        links[st.st_ino] -= 1
+        if not links[st.st_ino]:
+            total_bytes -= st.st_size
+        removed[reason] += 1
+    return removed
+
+
+def sweep(directory="labels_pdf", now=None):
+    """Run one retention pass over `directory` and return a summary"""
+    now = time.time() if now is None else now
+    with _sweep_lock:
+        entries = _scan(directory)
+        before = _disk_bytes(entries)
+        linked = 0
+        if DEDUPLICATE:
+            linked = _deduplicate([(path, st) for path, st in entries if now - st.st_mtime >= GRACE_SECONDS])
+            if linked:
+                entries = _scan(directory)
+        deduplicated_bytes = before - _disk_bytes(entries)
+        removed = _evict(entries, now)
+
+        remaining = _scan(directory)
+        present = {path for path, _ in remaining}
+        for path in [path for path in _hashes if path not in present]:
+            del _hashes[path]
+
+    summary = {"files": len(remaining), "bytes": _disk_bytes(remaining), "linked": linked,
+               "deduplicated_bytes": deduplicated_bytes, "removed": removed}
+    metrics.record_retention(summary["files"], summary["bytes"], removed, deduplicated_bytes)
+    return summary
+
+
+def _run(directory):
+    while True:
+        try:
+            sweep(directory)
+        except OSError as e:
+            print(f"Retention sweep error: {str(e)}")
+        time.sleep(MIN_INTERVAL)
+        _wake.wait(max(INTERVAL - MIN_INTERVAL, 0))
+        _wake.clear()
+
+
+def start(directory="labels_pdf"):
+    """Start the background sweeper for `directory` (once per process)"""
+    global _thread
+    if not (DEDUPLICATE or MAX_AGE_HOURS or MAX_BYTES or MAX_FILES):
+        return
+    with _start_lock:
+        if _thread is None:
+            _thread = threading.Thread(target=_run, args=(directory,), name="labels-retention", daemon=True)
+            _thread.start()
+
+
+def notify():
+    """Ask for an early sweep after new output was written; returns immediately"""
+    _wake.set()
@@ -1,23 +1,160 @@
 import os
+import io
 import flask
 
+import admission
+import jobs
+import metrics
+import short_ids
+import uploads
+
+
+def _output_dir():
+    """labels_pdf/ where the generators write it: in the working directory, which
+    need not be the app's root path (Flask resolves relative paths against that)"""
+    return os.path.abspath('labels_pdf')
+
 
 def setup_download_route(app, pdf_storage):
     """Setup the download route for the Flask server"""
     
     @app.server.route('/download/<filename>')
     def download_file(filename):
+        # PDFs open inline; other artifacts (e.g. .prof profiles) download
+        is_pdf = filename.lower().endswith('.pdf')
         if os.environ.get('RENDER'):
             # Serve from memory on Render
             if filename in pdf_storage:
+                metrics.record_download(metrics.output_size(pdf_storage[filename]))
+                # Each response reads its own BytesIO over the stored bytes (which
+                # it shares, not copies), so concurrent downloads of one file
+                # neither copy it nor share a read position
                 return flask.send_file(
-                    pdf_storage[filename],
-                    mimetype='application/pdf',
-                    as_attachment=False,
+                    io.BytesIO(pdf_storage[filename]),
+                    mimetype='application/pdf' if is_pdf else 'application/octet-stream',
+                    as_attachment=not is_pdf,
                     download_name=filename
                 )
             else:
                 flask.abort(404)
         else:
             # Serve from file system locally
-            return flask.send_from_directory('labels_pdf', filename, as_attachment=False) 
\ No newline at end of file
+            response = flask.send_from_directory(_output_dir(), filename, as_attachment=not is_pdf)
+            metrics.record_download(response.content_length or 0)
+            return response
+
+
+def setup_jobs_routes(app, pdf_storage):
+    """Setup the job API routes (reprinting a subset of an existing job)"""
+
+    @app.server.route('/api/jobs/<job_id>')
+    def job_info(job_id):
+        try:
+            job = jobs.get_job(job_id)
+        except jobs.JobNotFound:
+            return flask.jsonify(error=f"Unknown job '{job_id}'"), 404
+        return flask.jsonify(job_id=job_id, rows=len(job["df"]), label_options=job["label_options"],
+                             pdf_filename=job["pdf_filename"], created=job["created"])
+
+    @app.server.route('/api/jobs/<job_id>/reprint', methods=['GET', 'POST'])
+    def reprint_job(job_id):
+        # Selection from a JSON body {"rows": "1203-1260", "ids": [...]} or the query string
+        params = flask.request.get_json(silent=True) or {}
+        rows = params.get('rows', flask.request.args.get('rows'))
+        ids = params.get('ids', flask.request.args.get('ids'))
+        try:
+            pdf_filename, pdf_result = jobs.render_reprint(job_id, rows=rows, ids=ids)
+        except jobs.JobNotFound:
+            return flask.jsonify(error=f"Unknown job '{job_id}'"), 404
+        except admission.Rejected as e:
+            return flask.jsonify(error=str(e)), 429
+        except ValueError as e:
+            return flask.jsonify(error=str(e)), 400
+
+        # PDFs open inline; ZPL reprints download
+        is_pdf = pdf_filename.lower().endswith('.pdf')
+        if os.environ.get('RENDER'):
+            pdf_storage[pdf_filename] = pdf_result.getvalue()
+            return flask.send_file(io.BytesIO(pdf_storage[pdf_filename]),
+                                   mimetype='application/pdf' if is_pdf else 'application/octet-stream',
+                                   as_attachment=not is_pdf, download_name=pdf_filename)
+        return flask.send_from_directory(_output_dir(), pdf_filename, as_attachment=not is_pdf)
+
+    @app.server.route('/api/jobs/<job_id>/print', methods=['POST'])
+    def print_job(job_id):
+        # Stream the job (or {"rows", "ids"} of it) as ZPL to LABELS_ZPL_PRINTER
+        params = flask.request.get_json(silent=True) or {}
+        try:
+            labels, sent = jobs.send_to_printer(job_id, rows=params.get('rows'), ids=params.get('ids'))
+        except jobs.JobNotFound:
+            return flask.jsonify(error=f"Unknown job '{job_id}'"), 404
+        except ValueError as e:
+            return flask.jsonify(error=str(e)), 400
+        except OSError as e:
+            return flask.jsonify(error=f"Printer unreachable: {e}"), 502
+        return flask.jsonify(job_id=job_id, labels=labels, bytes=sent)
+
+
+def setup_upload_routes(app):
+    """Setup the chunked, resumable CSV upload API"""
+
+    @app.server.route('/api/uploads', methods=['POST'])
+    def create_upload():
+        params = flask.request.get_json(silent=True) or {}
+        try:
+            upload_id = uploads.create_upload(params.get('filename'), params.get('size', 0))
+        except (uploads.UploadError, TypeError, ValueError) as e:
+            return flask.jsonify(error=str(e)), 400
+        return flask.jsonify(uploads.upload_status(upload_id)), 201
+
+    @app.server.route('/api/uploads/<upload_id>', methods=['GET'])
+    def upload_status(upload_id):
+        try:
+            return flask.jsonify(uploads.upload_status(upload_id))
+        except uploads.UploadNotFound:
+            return flask.jsonify(error="Unknown upload"), 404
+
+    @app.server.route('/api/uploads/<upload_id>', methods=['PUT'])
+    def upload_chunk(upload_id):
+        # Raw chunk bytes in the body, position in ?offset=
+        try:
+            offset = uploads.append_chunk(upload_id, flask.request.args.get('offset', type=int),
+                                          flask.request.stream)
+        except uploads.UploadNotFound:
+            return flask.jsonify(error="Unknown upload"), 404
+        except uploads.OffsetMismatch as e:
+            return flask.jsonify(error=str(e), offset=e.expected), 409
+        except uploads.UploadError as e:
+            return flask.jsonify(error=str(e)), 400
+        return flask.jsonify(offset=offset)
+
+    @app.server.route('/api/uploads/<upload_id>/complete', methods=['POST'])
+    def complete_upload(upload_id):
+        try:
+            return flask.jsonify(uploads.complete_upload(upload_id)), 202
+        except uploads.UploadNotFound:
+            return flask.jsonify(error="Unknown upload"), 404
+        except uploads.UploadError as e:
+            return flask.jsonify(error=str(e)), 400
+
+
+def setup_codes_route(app):
+    """Resolve scanned short codes to the full ID and row"""
+
+    @app.server.route('/api/codes/<code>')
+    def resolve_code(code):
+        entry = short_ids.resolve(code)
+        if entry is None:
+            return flask.jsonify(error=f"Unknown code '{code}'"), 404
+        return flask.jsonify(entry)
+
+
+def setup_metrics_route(app):
+    """Expose pipeline metrics in Prometheus text format (skipped when LABELS_METRICS=0)"""
+    if not metrics.ENABLED:
+        return
+
+    @app.server.route('/metrics')
+    def metrics_endpoint():
+        return flask.Response(metrics.render_prometheus(),
+                              mimetype='text/plain; version=0.0.4; charset=utf-8')
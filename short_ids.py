@@ -0,0 +1,233 @@
+import os
+import io
+import json
+import sqlite3
+import hashlib
+import threading
+from datetime import datetime
+
+import pandas as pd
+
+
+# Short-ID registry. Instead of the full ID, symbols can encode a compact
+# code that resolves to the full row through an indexed SQLite table:
+#   "sequential" - <project number>-<counter>, e.g. 3-1042
+#   "base32"     - 8 Crockford base32 characters derived from the project and ID
+# Both only use characters from the QR alphanumeric set. A full ID keeps its
+# code across jobs, so reprints and re-generated sheets encode the same code.
+DB_PATH = os.environ.get('LABELS_SHORT_ID_DB', "short_ids.sqlite3")
+SCHEMES = ("sequential", "base32")
+CODE_COLUMN = "short_code"
+BASE32_ALPHABET = "0123456789ABCDEFGHJKMNPQRSTVWXYZ"
+BASE32_LENGTH = 8
+
+# Column encoded in the symbol and column naming the project, per style
+ENCODED_COLUMNS = {"qr": "ID", "biomass": "info1"}
+PROJECT_COLUMNS = {"qr": "Project"}
+
+# Tries of a registration that conflicts with another process's codes
+ASSIGN_ATTEMPTS = 3
+
+_lock = threading.Lock()
+_connections = threading.local()
+
+
+def _connect():
+    """Per-thread connection to the registry, creating the schema on first use"""
+    conn = getattr(_connections, "conn", None)
+    if conn is None:
+        conn = sqlite3.connect(DB_PATH, timeout=30)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.executescript("""
+            CREATE TABLE IF NOT EXISTS short_codes (
+                code TEXT PRIMARY KEY,
+                scheme TEXT NOT NULL,
+                project TEXT NOT NULL,
+                full_id TEXT NOT NULL,
+                row_json TEXT NOT NULL,
+                created TEXT NOT NULL,
+                UNIQUE (scheme, project, full_id)
+            ) WITHOUT ROWID;
+            CREATE TABLE IF NOT EXISTS projects (
+                project TEXT PRIMARY KEY,
+                number INTEGER NOT NULL UNIQUE,
+                next_value INTEGER NOT NULL
+            );
+        """)
+        _connections.conn = conn
+    return conn
+
+
+def encoded_column(df, style):
+    """Column whose value goes into the symbol (line labels prefer ucode)"""
+    if style == "line":
+        return "ucode" if "ucode" in df.columns else "info1"
+    return ENCODED_COLUMNS.get(style, "ID")
+
+
+def encoded_values(df, style):
+    """Text each row encodes in its symbol; line rows with a blank ucode encode info1"""
+    column = encoded_column(df, style)
+    values = df[column].astype(str)
+    if column == "ucode" and "info1" in df.columns:
+        blank = df[column].isna() | (values.str.strip() == "")
+        values = values.where(~blank, df["info1"].astype(str))
+    return values
+
+
+def _base32(digest):
+    number = int.from_bytes(digest, "big")
+    chars = []
+    for _ in range(BASE32_LENGTH):
+        number, index = divmod(number, 32)
+        chars.append(BASE32_ALPHABET[index])
+    return "".join(reversed(chars))
+
+
+def _base32_code(project, full_id, attempt):
+    digest = hashlib.blake2b(f"{project}\x1f{full_id}\x1f{attempt}".encode("utf-8"), digest_size=8).digest()
+    return _base32(digest)
+
+
+def _existing_codes(conn, scheme, pairs):
+    """(project, full_id) -> code for pairs already in the registry"""
+    conn.execute("CREATE TEMP TABLE IF NOT EXISTS wanted (project TEXT, full_id TEXT)")
+    conn.execute("DELETE FROM wanted")
+    conn.executemany("INSERT INTO wanted VALUES (?, ?)", pairs)
+    rows = conn.execute("""
+        SELECT s.project, s.full_id, s.code FROM wanted w
+        JOIN short_codes s ON s.scheme = ? AND s.project = w.project AND s.full_id = w.full_id
+    """, (scheme,)).fetchall()
+    return {(project, full_id): code for project, full_id, code in rows}
+
+
+def _project_counter(conn, project):
+    row = conn.execute("SELECT number, next_value FROM projects WHERE project = ?", (project,)).fetchone()
+    if row is None:
+        number = conn.execute("SELECT COALESCE(MAX(number), 0) + 1 FROM projects").fetchone()[0]
+        conn.execute("INSERT INTO projects VALUES (?, ?, 1)", (project, number))
+        row = (number, 1)
+    return row
+
+
+def _register(conn, df, scheme, pairs, first_row):
+    """(project, full_id) -> code for `pairs`, inserting the ones not registered yet"""
+    codes = _existing_codes(conn, scheme, pairs)
+    taken = set(codes.values())
+    counters = {}
+    new_pairs = [pair for pair in pairs if pair not in codes]
+    # Row metadata of new codes, serialised in one vectorised call
+    positions = [first_row[pair] for pair in new_pairs]
+    row_json = df.iloc[positions].to_json(orient="records", lines=True).split("\n") if positions else []
+    new_rows = []
+    created = datetime.now().isoformat(timespec="seconds")
+    for (project, full_id), row in zip(new_pairs, row_json):
+        if scheme == "sequential":
+            if project not in counters:
+                counters[project] = list(_project_counter(conn, project))
+            number, value = counters[project]
+            code = f"{number}-{value}"
+            counters[project][1] += 1
+        else:
+            attempt = 0
+            code = _base32_code(project, full_id, attempt)
+            while code in taken or conn.execute(
+                    "SELECT 1 FROM short_codes WHERE code = ?", (code,)).fetchone():
+                attempt += 1
+                code = _base32_code(project, full_id, attempt)
+        codes[(project, full_id)] = code
+        taken.add(code)
+        new_rows.append((code, scheme, project, full_id, row, created))
+    for project, (number, value) in counters.items():
+        conn.execute("UPDATE projects SET next_value = ? WHERE project = ?", (value, project))
+    conn.executemany("INSERT INTO short_codes VALUES (?, ?, ?, ?, ?, ?)", new_rows)
+    return codes
+
+
+def assign_codes(df, style, scheme="sequential"):
+    """Return a copy of `df` with a short_code column, registering new codes.
+
+    Rows whose full ID was registered before get their existing code. New
+    codes are inserted in one transaction that holds the registry's write lock
+    from the first read; base32 codes that collide with a different ID are
+    re-derived with the next attempt number.
+    """
+    if scheme not in SCHEMES:
+        raise ValueError(f"Unknown short code scheme '{scheme}'")
+    column = encoded_column(df, style)
+    if column not in df.columns:
+        raise ValueError(f"Missing column: {column}")
+
+    df = df.reset_index(drop=True)
+    full_ids = encoded_values(df, style).tolist()
+    project_column = PROJECT_COLUMNS.get(style)
+    projects = (df[project_column].astype(str).tolist() if project_column in df.columns
+                else [""] * len(df))
+    pairs = list(dict.fromkeys(zip(projects, full_ids)))
+
+    first_row = {}
+    for position, pair in enumerate(zip(projects, full_ids)):
+        first_row.setdefault(pair, position)
+
+    # BEGIN IMMEDIATE takes the database's write lock before the registry is
+    # read, so processes assigning codes at the same time (the web process
+    # and render workers) queue instead of reading the same counter; a
+    # conflict with a writer that did not is retried
+    conn = _connect()
+    for attempt in range(ASSIGN_ATTEMPTS):
+        try:
+            with _lock, conn:
+                conn.execute("BEGIN IMMEDIATE")
+                codes = _register(conn, df, scheme, pairs, first_row)
+            break
+        except sqlite3.IntegrityError:
+            if attempt == ASSIGN_ATTEMPTS - 1:
+                raise
+
+    df[CODE_COLUMN] = [codes[pair] for pair in zip(projects, full_ids)]
+    return df
+
+
+def resolve(code):
+    """Full ID and row for a scanned short code, or None (one primary-key lookup)"""
+    conn = _connect()
+    row = conn.execute("SELECT scheme, project, full_id, row_json, created FROM short_codes WHERE code = ?",
+                       (str(code).strip().upper(),)).fetchone()
+    if row is None:
+        return None
+    scheme, project, full_id, row_json, created = row
+    return {"code": str(code).strip().upper(), "scheme": scheme, "project": project,
+            "full_id": full_id, "row": json.loads(row_json), "created": created}
+
+
+def lookup_filename(pdf_filename):
+    return f"{os.path.splitext(pdf_filename)[0]}_codes.csv"
+
+
+def write_lookup(df, pdf_filename):
+    """Write the job's short code -> row table as CSV next to the PDF.
+
+    Returns (filename, BytesIO) for in-memory deployments, else (filename, path).
+    """
+    filename = lookup_filename(pdf_filename)
+    columns = [CODE_COLUMN] + [c for c in df.columns if c != CODE_COLUMN]
+    table = df[columns].drop_duplicates(CODE_COLUMN)
+    if os.environ.get('RENDER'):
+        buffer = io.BytesIO()
+        table.to_csv(buffer, index=False)
+        buffer.seek(0)
+        return filename, buffer
+    path = os.path.join("labels_pdf", filename)
+    table.to_csv(path, index=False)
+    return filename, path
+
+
+def export_registry(path):
+    """Dump the whole registry to CSV or Parquet (by extension) for offline scanners"""
+    conn = _connect()
+    table = pd.read_sql_query("SELECT code, scheme, project, full_id, row_json, created FROM short_codes", conn)
+    if path.lower().endswith((".parquet", ".pq")):
+        table.to_parquet(path, index=False)
+    else:
+        table.to_csv(path, index=False)
+    return len(table)
@@ -0,0 +1,263 @@
+import os
+import re
+import json
+import time
+import uuid
+import tempfile
+import threading
+import pandas as pd
+
+import dataset
+import ingest
+import metrics
+
+
+# Chunked uploads are appended to a spool file on disk and parsed from it in
+# a streaming fashion (CSV in row chunks, other formats through ingest), so large CSVs never exist as one base64 string in a
+# callback request. The received size on disk is the resume offset.
+SPOOL_DIR = os.environ.get('LABELS_UPLOAD_DIR', os.path.join(tempfile.gettempdir(), "labels_uploads"))
+MAX_UPLOAD_BYTES = int(float(os.environ.get('LABELS_MAX_UPLOAD_MB', '1024')) * 1024 * 1024)
+PARSE_CHUNK_ROWS = 50000
+STALE_SECONDS = 24 * 3600
+# Parsed tables stay in memory on the server: the browser only gets a page of
+# rows and the upload id, which the render callbacks resolve (table()). Cell
+# edits made in the viewer are kept next to the table. A table is dropped
+# PARSED_TTL minutes after it was last used, and beyond MAX_PARSED finished
+# tables the least recently used go first.
+PARSED_TTL_SECONDS = float(os.environ.get('LABELS_PARSED_UPLOAD_TTL_MINUTES', '60')) * 60
+MAX_PARSED = int(os.environ.get('LABELS_MAX_PARSED_UPLOADS', '16'))
+
+_lock = threading.Lock()
+# upload_id -> {"status", "filename", "size", "progress", "rows", "df", "edits", "loaded", "error", "finished"}
+_parsed = {}
+_chunk_locks = {}
+
+
+class UploadError(ValueError):
+    pass
+
+
+class OffsetMismatch(UploadError):
+    def __init__(self, expected, got):
+        super().__init__(f"Expected offset {expected}, got {got}")
+        self.expected = expected
+
+
+class UploadNotFound(KeyError):
+    pass
+
+
+def _check_id(upload_id):
+    if not re.fullmatch(r"[0-9a-f]{32}", upload_id or ""):
+        raise UploadNotFound(upload_id)
+
+
+def _spool_path(upload_id):
+    return os.path.join(SPOOL_DIR, f"{upload_id}.part")
+
+
+def _meta_path(upload_id):
+    return os.path.join(SPOOL_DIR, f"{upload_id}.json")
+
+
+def _read_meta(upload_id):
+    _check_id(upload_id)
+    try:
+        with open(_meta_path(upload_id)) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        raise UploadNotFound(upload_id)
+
+
+def _cleanup_stale():
+    """Drop spool files of uploads abandoned for more than a day, and what memory holds for
+    abandoned uploads: chunk locks of spools that are gone, parsed tables no longer used"""
+    cutoff = time.time() - STALE_SECONDS
+    for name in os.listdir(SPOOL_DIR):
+        path = os.path.join(SPOOL_DIR, name)
+        try:
+            if os.path.getmtime(path) < cutoff:
+                os.remove(path)
+        except OSError:
+            pass
+
+    now = time.monotonic()
+    with _lock:
+        for upload_id in [u for u in _chunk_locks if not os.path.exists(_spool_path(u))]:
+            del _chunk_locks[upload_id]
+        # Tables still parsing are left alone; their thread writes to the entry
+        finished = sorted((parsed["finished"], upload_id) for upload_id, parsed in _parsed.items()
+                          if "finished" in parsed)
+        for position, (when, upload_id) in enumerate(finished):
+            if now - when > PARSED_TTL_SECONDS or position < len(finished) - MAX_PARSED:
+                del _parsed[upload_id]
+
+
+def create_upload(filename, size):
+    """Start a new chunked upload and return its id"""
+    if not ingest.is_supported(filename):
+        raise UploadError(f"Please upload a {ingest.SUPPORTED_DESCRIPTION} file")
+    size = int(size)
+    if size <= 0 or size > MAX_UPLOAD_BYTES:
+        raise UploadError(f"File size must be between 1 byte and {MAX_UPLOAD_BYTES // (1024 * 1024)} MB")
+    os.makedirs(SPOOL_DIR, exist_ok=True)
+    _cleanup_stale()
+    upload_id = uuid.uuid4().hex
+    with open(_meta_path(upload_id), "w") as f:
+        json.dump({"filename": os.path.basename(filename), "size": size}, f)
+    open(_spool_path(upload_id), "wb").close()
+    return upload_id
+
+
+def upload_status(upload_id):
+    """Received offset and parse progress of an upload"""
+    _check_id(upload_id)
+    with _lock:
+        parsed = dict(_parsed.get(upload_id, {}))
+    if parsed:
+        for internal in ("df", "edits", "loaded", "finished"):
+            parsed.pop(internal, None)
+        return dict(upload_id=upload_id, offset=parsed["size"], **parsed)
+    meta = _read_meta(upload_id)
+    offset = os.path.getsize(_spool_path(upload_id))
+    return dict(upload_id=upload_id, filename=meta["filename"], size=meta["size"], offset=offset,
+                status="uploaded" if offset >= meta["size"] else "uploading")
+
+
+def append_chunk(upload_id, offset, stream):
+    """Append a chunk at `offset`; returns the new offset.
+
+    The offset must equal the bytes already received, which is what makes a
+    retried or resumed chunk safe: a mismatch raises OffsetMismatch carrying
+    the current offset so the client can continue from there.
+    """
+    meta = _read_meta(upload_id)
+    path = _spool_path(upload_id)
+    with _lock:
+        chunk_lock = _chunk_locks.setdefault(upload_id, threading.Lock())
+    with chunk_lock:
+        received = os.path.getsize(path)
+        if offset != received:
+            raise OffsetMismatch(received, offset)
+        with open(path, "ab") as f:
+            written = 0
+            while True:
+                block = stream.read(1024 * 1024)
+                if not block:
+                    break
+                written += len(block)
+                if received + written > meta["size"]:
+                    f.truncate(received)
+                    raise UploadError("Chunk goes past the declared file size")
+                f.write(block)
+    return received + written
+
+
+def _parse(upload_id, path, size, filename):
+    try:
+        with metrics.stage_timer("upload_parse"):
+            if not filename.lower().endswith(ingest.CSV_EXTENSIONS):
+                # Columnar/Excel files are memory-mapped or streamed by ingest
+                df = dataset.compact(ingest.read_table(path, filename))
+                with _lock:
+                    _parsed[upload_id].update(status="done", progress=1.0, rows=len(df), df=df,
+                                              finished=time.monotonic())
+                return
+            chunks, rows = [], 0
+            with open(path, "rb") as f:
+                # Read with all columns as strings to preserve leading zeros
+                for chunk in pd.read_csv(f, dtype=str, chunksize=PARSE_CHUNK_ROWS, encoding='utf-8'):
+                    # Arrow-backed while parsing; repetitive columns become categoricals below
+                    chunks.append(chunk.astype(dataset.ARROW_STRING))
+                    rows += len(chunk)
+                    with _lock:
+                        _parsed[upload_id].update(progress=min(f.tell() / size, 1.0), rows=rows)
+            df = dataset.compact(pd.concat(chunks, ignore_index=True)) if chunks else pd.DataFrame()
+        with _lock:
+            _parsed[upload_id].update(status="done", progress=1.0, rows=len(df), df=df,
+                                      finished=time.monotonic())
+    except Exception as e:
+        with _lock:
+            _parsed[upload_id].update(status="error", error=str(e), finished=time.monotonic())
+    finally:
+        for leftover in (path, _meta_path(upload_id)):
+            try:
+                os.remove(leftover)
+            except OSError:
+                pass
+
+
+def complete_upload(upload_id):
+    """Start parsing a fully received upload in the background"""
+    status = upload_status(upload_id)
+    if status["status"] in ("parsing", "done"):
+        return status
+    if status["offset"] != status["size"]:
+        raise UploadError(f"Upload incomplete: {status['offset']} of {status['size']} bytes received")
+    _cleanup_stale()
+    with _lock:
+        _parsed[upload_id] = {"status": "parsing", "filename": status["filename"], "size": status["size"],
+                              "progress": 0.0, "rows": 0}
+        _chunk_locks.pop(upload_id, None)
+    threading.Thread(target=_parse, args=(upload_id, _spool_path(upload_id), status["size"], status["filename"]),
+                     daemon=True).start()
+    return upload_status(upload_id)
+
+
+def _done(upload_id):
+    """Registry entry of a parsed table, marked as just used; call with _lock held"""
+    parsed = _parsed.get(upload_id)
+    if not parsed or parsed.get("status") != "done":
+        raise UploadNotFound(upload_id)
+    parsed["finished"] = time.monotonic()
+    return parsed
+
+
+def _apply_edits(df, edits, start=0):
+    for position, record in edits.items():
+        if start <= position < start + len(df):
+            for column, value in record.items():
+                if column in df.columns:
+                    df.at[df.index[position - start], column] = value
+    return df
+
+
+def load_parsed(upload_id):
+    """Parsed DataFrame and filename of an upload, the first time it is asked for"""
+    with _lock:
+        parsed = _done(upload_id)
+        if parsed.get("loaded"):
+            # Already loaded (e.g. the browser re-sent the upload state)
+            raise UploadNotFound(upload_id)
+        parsed["loaded"] = True
+    return dataset.expand(parsed["df"]), parsed.get("filename")
+
+
+def table(upload_id):
+    """Whole table of a loaded upload, with the viewer's edits applied"""
+    with _lock:
+        parsed = _done(upload_id)
+        df, edits = parsed["df"], dict(parsed.get("edits", {}))
+    df = dataset.expand(df)
+    return _apply_edits(df.copy(), edits) if edits else df
+
+
+def table_rows(upload_id, start, stop):
+    """Rows start:stop of a loaded upload as records, with edits applied (one viewer page)"""
+    with _lock:
+        parsed = _done(upload_id)
+        df, edits = parsed["df"], dict(parsed.get("edits", {}))
+    page = dataset.expand(df.iloc[start:stop])
+    if edits:
+        page = _apply_edits(page.copy(), edits, start)
+    return page.to_dict('records')
+
+
+def edit_rows(upload_id, start, records):
+    """Record the viewer's page of rows starting at `start`; returns the number of rows that changed"""
+    current = table_rows(upload_id, start, start + len(records))
+    changed = {start + i: record for i, (record, before) in enumerate(zip(records, current)) if record != before}
+    if changed:
+        with _lock:
+            _done(upload_id).setdefault("edits", {}).update(changed)
+    return len(changed)
@@ -1,62 +1,343 @@
 import os
+import math
+import zlib
+import shutil
+import tempfile
+import subprocess
+import functools
 import pandas as pd
 import qrcode
+from reportlab import rl_config
 from reportlab.lib.pagesizes import letter
-from reportlab.lib.units import inch
+from reportlab.lib.units import inch, mm
 from reportlab.pdfgen import canvas
+from reportlab.pdfbase import pdfdoc
+from reportlab.pdfbase.pdfmetrics import stringWidth
 from reportlab.graphics.barcode import code128
 from datetime import datetime
 
+import datamatrix
+import encode_pool
+import metrics
+import render_cache
 
-def make_qr(text, box_size=10, error_correction=qrcode.constants.ERROR_CORRECT_H):
-    """Generate QR code image"""
-    qr = qrcode.QRCode(
-        version=1, error_correction=error_correction, box_size=box_size, border=1
-    )
-    qr.add_data(text)
+
+# QR encoding policy. "fixed" always uses error correction H at the smallest
+# version that fits. "adaptive" picks, for the printed size of the symbol, the
+# highest error correction level whose smallest version still gives modules of
+# at least LABELS_QR_MODULE_MM; when none does, the smallest symbol (level L).
+# LABELS_QR_ALPHANUMERIC=1 upper-cases payloads so they can be encoded in the
+# denser alphanumeric mode (scanners then read the ID in upper case).
+QR_POLICY = os.environ.get('LABELS_QR_POLICY', 'adaptive').lower()
+QR_MODULE_MM = float(os.environ.get('LABELS_QR_MODULE_MM', '0.4'))
+QR_ALPHANUMERIC = os.environ.get('LABELS_QR_ALPHANUMERIC', '0').lower() in ('1', 'true', 'yes', 'on')
+QR_EC_LEVELS = (qrcode.constants.ERROR_CORRECT_H, qrcode.constants.ERROR_CORRECT_Q,
+                qrcode.constants.ERROR_CORRECT_M, qrcode.constants.ERROR_CORRECT_L)
+QR_ALPHANUMERIC_CHARS = frozenset("0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZ $%*+-./:")
+
+
+def qr_settings():
+    """Encoding settings that change QR output; part of page fragment keys"""
+    return (QR_POLICY, QR_MODULE_MM, QR_ALPHANUMERIC)
+
+
+def _qr_payload(text):
+    if QR_ALPHANUMERIC:
+        folded = text.upper()
+        if folded and set(folded) <= QR_ALPHANUMERIC_CHARS:
+            return qrcode.util.QRData(folded, mode=qrcode.util.MODE_ALPHA_NUM)
+    return text
+
+
+def choose_qr_encoding(text, size):
+    """(version, error correction) for `text` printed `size` points wide under the adaptive policy"""
+    payload = _qr_payload(text)
+    # Modules that fit at the target module size, minus the 1-module border
+    max_modules = int(size / (QR_MODULE_MM * mm)) - 2
+    for error_correction in QR_EC_LEVELS:
+        qr = qrcode.QRCode(error_correction=error_correction, border=1)
+        qr.add_data(payload)
+        try:
+            version = qr.best_fit()
+        except (qrcode.exceptions.DataOverflowError, ValueError):
+            continue
+        if version * 4 + 17 <= max_modules or error_correction == QR_EC_LEVELS[-1]:
+            return version, error_correction
+    raise qrcode.exceptions.DataOverflowError()
+
+
+def qr_matrix(text, error_correction=qrcode.constants.ERROR_CORRECT_H, size=None):
+    """Generate the QR module matrix (rows of booleans, 1-module border included).
+
+    With the adaptive policy and the printed `size` in points, version and
+    error correction come from choose_qr_encoding instead.
+    """
+    if QR_POLICY == 'adaptive' and size:
+        version, error_correction = choose_qr_encoding(text, size)
+    else:
+        version = 1
+    qr = qrcode.QRCode(version=version, error_correction=error_correction, border=1)
+    qr.add_data(_qr_payload(text))
     qr.make(fit=True)
-    return qr.make_image(fill_color="black", back_color="white")
+    return qr.get_matrix()
+
+
+# PDF output profiles, chosen per job (LABELS_PDF_PROFILE sets the default):
+#   default - ReportLab defaults: Flate-compressed page streams wrapped in ASCII85
+#   fast    - uncompressed page streams (skips zlib; about 4x larger files)
+#   small   - binary Flate at level 9, without the 25% ASCII85 overhead
+#   web     - binary Flate, then linearized by qpdf (when installed) so viewers
+#             can show the first page before the whole file has downloaded
+PDF_PROFILES = ("default", "fast", "small", "web")
+PDF_PROFILE = os.environ.get('LABELS_PDF_PROFILE', 'default').lower()
+PDF_FLATE_LEVELS = {"small": 9, "web": 6}
+
+
+class _FlateFilter:
+    """Binary Flate stream filter with an explicit compression level"""
+    pdfname = "FlateDecode"
+
+    def __init__(self, level):
+        self.level = level
+
+    def encode(self, text):
+        if isinstance(text, str):
+            text = text.encode('latin-1')
+        return zlib.compress(text, self.level)
+
+
+def new_canvas(target, profile=None, **kwargs):
+    """Canvas for a generator, with page compression set by the PDF profile"""
+    profile = profile or PDF_PROFILE
+    if profile not in PDF_PROFILES:
+        raise ValueError(f"Unknown PDF profile '{profile}'")
+    return canvas.Canvas(target, pageCompression=0 if profile == "fast" else 1, **kwargs)
 
 
-def create_qr_pdf(df, pdf_file_name):
-    """Create QR code PDF labels (Luiz Felipe Almeida Style)"""
+def save_canvas(c, target, profile=None):
+    """Write the PDF with the profile's stream filters (and linearization for "web")"""
+    profile = profile or PDF_PROFILE
+    level = PDF_FLATE_LEVELS.get(profile)
+    if level is not None:
+        filters = [_FlateFilter(level)]
+    elif c._pageCompression:
+        filters = [pdfdoc.PDFBase85Encode, pdfdoc.PDFZCompress] if rl_config.useA85 else [pdfdoc.PDFZCompress]
+    else:
+        filters = None
+    # Pages with identical content (label copies, repeated rows) share one
+    # content stream object; ReportLab leaves pages with Contents set alone
+    streams = {}
+    for page in c._doc.Pages.pages:
+        if page.Contents is None and page.stream:
+            stream = streams.get(page.stream)
+            if stream is None:
+                stream = streams[page.stream] = pdfdoc.PDFStream(content=page.stream, filters=filters)
+            page.Contents = stream
+    c.save()
+    if profile == "web":
+        _linearize(target)
+
+
+def _linearize(target):
+    qpdf = shutil.which("qpdf")
+    if qpdf is None:
+        return
+    with tempfile.TemporaryDirectory(prefix="labels_web_") as workdir:
+        source, output = os.path.join(workdir, "in.pdf"), os.path.join(workdir, "out.pdf")
+        if isinstance(target, str):
+            shutil.copyfile(target, source)
+        else:
+            with open(source, "wb") as f:
+                f.write(target.getvalue())
+        subprocess.run([qpdf, "--linearize", "--object-streams=generate", source, output], check=True)
+        if isinstance(target, str):
+            shutil.copyfile(output, target)
+        else:
+            with open(output, "rb") as f:
+                target.seek(0)
+                target.truncate()
+                target.write(f.read())
+
+
+# Auto-fit text: a line wider than its space on the label is shrunk (in half
+# points, down to TEXT_MIN_SIZE) and, if still too wide, cut with an ellipsis.
+# LABELS_TEXT_AUTOFIT=0 draws text at its nominal size as before.
+TEXT_AUTOFIT = os.environ.get('LABELS_TEXT_AUTOFIT', '1').lower() not in ('0', 'false', 'no', 'off')
+TEXT_MIN_SIZE = 6
+ELLIPSIS = "\u2026"
+
+
+@functools.lru_cache(maxsize=65536)
+def _text_width_1000(text, font):
+    return stringWidth(text, font, 1000)
+
+
+def text_width(text, font, size):
+    """Memoised stringWidth; widths scale linearly, so one entry per (font, text) serves every size"""
+    return _text_width_1000(text, font) * size / 1000
+
+
+def fit_text(text, font, size, max_width, min_size=TEXT_MIN_SIZE):
+    """(text, size) to draw so the text fits within `max_width` points"""
+    text = str(text)
+    if not TEXT_AUTOFIT:
+        return text, size
+    width = text_width(text, font, size)
+    if width <= max_width:
+        return text, size
+    fitted = max(math.floor(size * max_width / width * 2) / 2, min_size)
+    if text_width(text, font, fitted) <= max_width:
+        return text, fitted
+    # Longest prefix that fits with an ellipsis
+    low, high = 0, len(text)
+    while low < high:
+        middle = (low + high + 1) // 2
+        if text_width(text[:middle].rstrip() + ELLIPSIS, font, fitted) <= max_width:
+            low = middle
+        else:
+            high = middle - 1
+    return text[:low].rstrip() + ELLIPSIS, fitted
+
+
+def draw_fitted_string(c, x, y, text, font, size, max_width, centred=False):
+    """drawString/drawCentredString with the text fitted to `max_width` points"""
+    text, size = fit_text(text, font, size, max_width)
+    c.setFont(font, size)
+    if centred:
+        c.drawCentredString(x, y, text)
+    else:
+        c.drawString(x, y, text)
+
+
+# 2D symbologies drawn through symbol_matrix/draw_matrix; biomass labels also offer Code128
+SYMBOLOGIES = ("qr", "datamatrix")
+
+
+# Recently encoded symbols, so a full render reuses what the preview (or the
+# previous render of an edited sheet) already encoded. Matrices are shared
+# between callers and must not be modified. LABELS_SYMBOL_CACHE=0 disables it.
+SYMBOL_CACHE_SIZE = int(os.environ.get('LABELS_SYMBOL_CACHE', '1024'))
+
+
+@functools.lru_cache(maxsize=SYMBOL_CACHE_SIZE)
+def _cached_symbol_matrix(symbology, text, size, settings):
+    if symbology == "datamatrix":
+        return datamatrix.encode(text)
+    return qr_matrix(text, size=size)
+
+
+def symbol_matrix(symbology, text, size):
+    """Module matrix of a 2D symbol printed `size` points wide"""
+    # Rounded so 0.6*inch (PDF) and 43.2 (raster) are one cache entry
+    return _cached_symbol_matrix(symbology, text, round(size, 3), qr_settings())
+
+
+def draw_matrix(c, matrix, x, y, size):
+    """Draw a module matrix as one vector path of horizontal runs, (x, y) is the bottom-left corner"""
+    module = size / len(matrix)
+    path = c.beginPath()
+    for r, modules in enumerate(matrix):
+        row_y = y + size - (r + 1) * module
+        col, n = 0, len(modules)
+        while col < n:
+            if modules[col]:
+                start = col
+                while col < n and modules[col]:
+                    col += 1
+                path.rect(x + start * module, row_y, (col - start) * module, module)
+            else:
+                col += 1
+    c.drawPath(path, stroke=0, fill=1)
+
+
+# Copies: every label is printed `copies` times (the "Copies" option), or as
+# many times as its row's "copies" column says when the sheet has one. Each
+# label is drawn once however many copies it has (render_cache.render_page).
+COPIES_COLUMN = "copies"
+MAX_COPIES = 100
+
+
+def parse_copies(value, default=1):
+    """Copies for a row's "copies" value; blank or invalid values fall back to `default`"""
+    try:
+        copies = int(float(value))
+    except (TypeError, ValueError, OverflowError):
+        return default
+    return min(max(copies, 1), MAX_COPIES)
+
+
+def label_rows(df, copies=1):
+    """Yield (row, copies) per label, without the copies column in the row"""
+    copies = parse_copies(copies)
+    for row in df.to_dict('records'):
+        if COPIES_COLUMN in row:
+            yield row, parse_copies(row.pop(COPIES_COLUMN), copies)
+        else:
+            yield row, copies
+
+
+def prefetch_symbols(rows, style, symbology, size, symbol_text):
+    """Pair each (row, copies) with its 2D symbol matrix encoded ahead by encode_pool.
+
+    The matrix is None (encoded while drawing) for barcodes, without an
+    encode pool, and for rows whose page is already in the fragment cache.
+    """
+    if symbology not in SYMBOLOGIES:
+        return ((item, None) for item in rows)
+
+    def text_of(item):
+        row = item[0]
+        if render_cache.has_fragment(render_cache.fragment_key(style, row)):
+            return None
+        return symbol_text(row)
+    return encode_pool.prefetch(rows, text_of, symbology, size)
+
+
+def _qr_symbol_text(row):
+    return str(row.get("short_code") or row.get("ID", "NO_ID"))
+
+
+def _draw_qr_label(c, row, height, info_list, symbology, matrix=None):
+    if matrix is None:
+        with metrics.stage_timer("symbol_encode", style="qr", symbology=symbology):
+            matrix = symbol_matrix(symbology, _qr_symbol_text(row), 1 * inch)
+
+    with metrics.stage_timer("label_draw", style="qr"):
+        draw_matrix(c, matrix, inch / 2, height - 1.25 * inch, 1 * inch)
+        for iter, attr in enumerate(info_list):
+            font, size = ("Helvetica-Bold", 10) if attr == "Plot" else ("Helvetica", 8)
+            text_y_position = height - 1.55 * inch - iter * 15
+            value = row.get(attr, "N/A")
+            draw_fitted_string(c, inch * 0.1, text_y_position, f"{attr}: {value}", font, size, 1.8 * inch)
+
+
+@metrics.instrument_job('qr')
+def create_qr_pdf(df, pdf_file_name, symbology="qr", profile=None, copies=1):
+    """Create QR (or Data Matrix) code PDF labels (Luiz Felipe Almeida Style)"""
     custom_page_size = (2 * inch, 3 * inch)
     
     # Use in-memory buffer for deployment, file system for local dev
     if os.environ.get('RENDER'):
         from io import BytesIO
         buffer = BytesIO()
-        c = canvas.Canvas(buffer, pagesize=custom_page_size)
+        c = new_canvas(buffer, profile, pagesize=custom_page_size)
     else:
         pdf_path = os.path.join("labels_pdf", pdf_file_name)
-        c = canvas.Canvas(pdf_path, pagesize=custom_page_size)
+        c = new_canvas(pdf_path, profile, pagesize=custom_page_size)
+    render_cache.register_fonts(c)
     width, height = custom_page_size
 
     info_list = ["Plot", "Site", "Year", "Sampling Stage/Depth", "Project", "Treatment"]
 
-    for _, row in df.iterrows():
-        qr_code = make_qr(str(row.get("ID", "NO_ID")))
-        qr_image = f"temp_{row.get('ID', 'temp')}.png"
-        qr_code.save(qr_image)
-
-        c.drawImage(
-            qr_image, inch / 2, height - 1.25 * inch, width=1 * inch, height=1 * inch
-        )
-        for iter, attr in enumerate(info_list):
-            if attr == "Plot":
-                c.setFont("Helvetica-Bold", 10)
-            else:
-                c.setFont("Helvetica", 8)
-            text_y_position = height - 1.55 * inch - iter * 15
-            value = row.get(attr, "N/A")
-            c.drawString(inch * 0.1, text_y_position, f"{attr}: {value}")
-
-        c.showPage()
-        # Clean up temp QR image
-        if os.path.exists(qr_image):
-            os.remove(qr_image)
+    # Unchanged rows are spliced from the page fragment cache; copies are drawn once
+    style = ("qr", custom_page_size, symbology, qr_settings())
+    labels = prefetch_symbols(label_rows(df, copies), style, symbology, 1 * inch, _qr_symbol_text)
+    for (row, n), matrix in labels:
+        render_cache.render_page(c, style, row,
+                                 lambda c, row: _draw_qr_label(c, row, height, info_list, symbology, matrix), n)
     
-    c.save()
+    with metrics.stage_timer("pdf_save", style="qr"):
+        save_canvas(c, buffer if os.environ.get('RENDER') else pdf_path, profile)
     
     if os.environ.get('RENDER'):
         buffer.seek(0)
@@ -65,80 +346,55 @@ def create_qr_pdf(df, pdf_file_name):
         return pdf_path  # Return file path for local development
 
 
-def create_biomass_pdf(df, pdf_file_name, use_qr=False):
-    """Create biomass PDF labels (Luiz Rosso Style) with barcode or QR code"""
-    page_width = 3
-    page_height = 2
-    
-    # Use in-memory buffer for deployment, file system for local dev
-    if os.environ.get('RENDER'):
-        from io import BytesIO
-        buffer = BytesIO()
-        page = canvas.Canvas(buffer)
-    else:
-        pdf_path = os.path.join("labels_pdf", pdf_file_name)
-        page = canvas.Canvas(pdf_path)
-    
-    page.setPageSize(size=(page_width*inch, page_height*inch))
-    
-    for i in range(len(df)):
+def _biomass_symbol_text(row):
+    # A registered short code replaces the full ID inside the symbol
+    return str(row.get('short_code') or row['info1'])
+
+
+def _draw_biomass_label(page, row, page_width, symbology, qr_modules=None):
+    with metrics.stage_timer("symbol_encode", style="biomass", symbology=symbology):
+        symbol_text = _biomass_symbol_text(row)
+        if symbology in SYMBOLOGIES:
+            # Encode a 2D symbol (QR code or Data Matrix) instead of barcode,
+            # unless the encode pool already did
+            if qr_modules is None:
+                qr_modules = symbol_matrix(symbology, symbol_text, 0.6*inch)
+        else:
+            # Encode barcode (original style)
+            b_code128 = code128.Code128(symbol_text,
+                                       barHeight=0.4*inch, barWidth=0.7)
+            b_code128.lquiet = 0
+            b_code128.rquiet = 0
+
+    with metrics.stage_timer("label_draw", style="biomass"):
         # Draw border
         page.rect(0.05*inch, (0.05-0.025)*inch, 2.9*inch, 1.9*inch, stroke=1, fill=0)
         
-        # Draw text
-        page.setFont('Helvetica-Bold', 14)
-        page.drawCentredString(1.5*inch, 1.6*inch, str(df.iloc[i]['info1']))
-        
-        page.setFont('Helvetica-Bold', 12)
-        page.drawCentredString(1.5*inch, 1.2*inch, str(df.iloc[i]['info2']))
+        # Draw text, fitted inside the border
+        draw_fitted_string(page, 1.5*inch, 1.6*inch, row['info1'], 'Helvetica-Bold', 14, 2.8*inch, centred=True)
+        draw_fitted_string(page, 1.5*inch, 1.2*inch, row['info2'], 'Helvetica-Bold', 12, 2.8*inch, centred=True)
+        draw_fitted_string(page, 1.5*inch, 0.9*inch, row['info3'], 'Helvetica', 10, 2.8*inch, centred=True)
         
-        page.setFont('Helvetica', 10)
-        page.drawCentredString(1.5*inch, 0.9*inch, str(df.iloc[i]['info3']))
-        
-        if use_qr:
-            # Draw QR code instead of barcode
-            qr_id = str(df.iloc[i]['info1'])
-            qr_code = make_qr(qr_id)
-            safe_qr_id = qr_id.replace('/', '_').replace('\\', '_').replace(' ', '_')
-            qr_image = f"temp_{safe_qr_id}_{i}.png"
-            qr_code.save(qr_image)
-            
+        if symbology in SYMBOLOGIES:
             # Position QR code in the same area as barcode
             qr_size = 0.6*inch
             qr_x = (page_width*inch - qr_size) / 2
             qr_y = 0.2*inch
-            page.drawImage(qr_image, qr_x, qr_y, width=qr_size, height=qr_size)
-            
-            # Clean up temp QR image
-            if os.path.exists(qr_image):
-                os.remove(qr_image)
+            draw_matrix(page, qr_modules, qr_x, qr_y, qr_size)
         else:
-            # Draw barcode (original style)
-            b_code128 = code128.Code128(str(df.iloc[i]['info1']),
-                                       barHeight=0.4*inch, barWidth=0.7)
-            b_code128.lquiet = 0
-            b_code128.rquiet = 0
             b_code_start = (page_width/2) - (b_code128.width/inch)/2
             b_code128.drawOn(page, b_code_start*inch, 0.3*inch)
         
         # Draw unique code if available
-        if pd.notna(df.iloc[i].get('ucode', '')):
-            page.setFont('Helvetica-Bold', 8)
-            page.drawCentredString(1.5*inch, 0.08*inch, str(df.iloc[i]['ucode']))
-        
-        page.showPage()
-    
-    page.save()
-    
-    if os.environ.get('RENDER'):
-        buffer.seek(0)
-        return buffer  # Return buffer for in-memory serving
-    else:
-        return pdf_path  # Return file path for local development
+        if pd.notna(row.get('ucode')):
+            draw_fitted_string(page, 1.5*inch, 0.08*inch, row['ucode'], 'Helvetica-Bold', 8, 2.8*inch,
+                               centred=True)
 
 
-def create_line_pdf(df, pdf_file_name):
-    """Create line-style PDF labels for narrow plastic pieces - column layout with QR in center"""
+@metrics.instrument_job('biomass')
+def create_biomass_pdf(df, pdf_file_name, use_qr=False, symbology=None, profile=None, copies=1):
+    """Create biomass PDF labels (Luiz Rosso Style) with barcode, QR code or Data Matrix"""
+    symbology = symbology or ("qr" if use_qr else "code128")
     page_width = 3
     page_height = 2
     
@@ -146,14 +402,47 @@ def create_line_pdf(df, pdf_file_name):
     if os.environ.get('RENDER'):
         from io import BytesIO
         buffer = BytesIO()
-        page = canvas.Canvas(buffer)
+        page = new_canvas(buffer, profile)
     else:
         pdf_path = os.path.join("labels_pdf", pdf_file_name)
-        page = canvas.Canvas(pdf_path)
+        page = new_canvas(pdf_path, profile)
+    render_cache.register_fonts(page)
     
     page.setPageSize(size=(page_width*inch, page_height*inch))
     
-    for i in range(len(df)):
+    # Unchanged rows are spliced from the page fragment cache; copies are drawn once
+    style = ("biomass", symbology, qr_settings())
+    labels = prefetch_symbols(label_rows(df, copies), style, symbology, 0.6*inch, _biomass_symbol_text)
+    for (row, n), matrix in labels:
+        render_cache.render_page(page, style, row,
+                                 lambda page, row: _draw_biomass_label(page, row, page_width, symbology, matrix), n)
+    
+    with metrics.stage_timer("pdf_save", style="biomass"):
+        save_canvas(page, buffer if os.environ.get('RENDER') else pdf_path, profile)
+    
+    if os.environ.get('RENDER'):
+        buffer.seek(0)
+        return buffer  # Return buffer for in-memory serving
+    else:
+        return pdf_path  # Return file path for local development
+
+
+def _line_symbol_text(row):
+    # QR code settings - use ucode if available, fallback to info1 (also for rows with a blank ucode)
+    if row.get('short_code'):
+        return str(row['short_code'])
+    ucode = row.get('ucode')
+    if ucode is not None and not pd.isna(ucode) and str(ucode).strip():
+        return str(ucode)
+    return str(row.get('info1', 'ID'))
+
+
+def _draw_line_label(page, row, symbology, qr_modules=None):
+    if qr_modules is None:
+        with metrics.stage_timer("symbol_encode", style="line", symbology=symbology):
+            qr_modules = symbol_matrix(symbology, _line_symbol_text(row), 0.7*inch)
+
+    with metrics.stage_timer("label_draw", style="line"):
         # Draw a thin border for reference (optional)
         page.rect(0.05*inch, 0.05*inch, 2.9*inch, 1.9*inch, stroke=1, fill=0)
         
@@ -161,18 +450,11 @@ def create_line_pdf(df, pdf_file_name):
         center_x = 1.5*inch  # Center of the 3-inch width
         center_y = 1.0*inch  # Center of the 2-inch height
         
-        # QR code settings - use ucode if available, fallback to info1
-        qr_data = str(df.iloc[i].get('ucode', df.iloc[i].get('info1', 'ID')))
-        qr_code = make_qr(qr_data)
-        safe_qr_id = qr_data.replace('/', '_').replace('\\', '_').replace(' ', '_')
-        qr_image = f"temp_line_{safe_qr_id}_{i}.png"
-        qr_code.save(qr_image)
-        
         # QR code in the center of the label
         qr_size = 0.7*inch  # Keep QR code size
         qr_x = center_x - qr_size/2  # Center the QR code horizontally
         qr_y = center_y - qr_size/2  # Center the QR code vertically
-        page.drawImage(qr_image, qr_x, qr_y, width=qr_size, height=qr_size)
+        draw_matrix(page, qr_modules, qr_x, qr_y, qr_size)
         
         # Left column - Plot title and ID text (better margins and bigger fonts)
         left_x = 0.15*inch  # Increased margin from border
@@ -181,39 +463,58 @@ def create_line_pdf(df, pdf_file_name):
         page.setFont('Helvetica', 10)
         page.drawString(left_x, center_y + 0.2*inch, "Plot")
         
-        # Main ID text
-        page.setFont('Helvetica-Bold', 14)  # Increased from 12
-        id_text = str(df.iloc[i].get('info1', 'ID'))
-        page.drawString(left_x, center_y - 0.15*inch, id_text)
+        # Main ID text, fitted to the space left of the QR code
+        id_text = str(row.get('info1', 'ID'))
+        draw_fitted_string(page, left_x, center_y - 0.15*inch, id_text, 'Helvetica-Bold', 14, 0.95*inch)
         
         # Right column - Concatenated info2 and info3 on same line
         right_x = 2.1*inch  # Moved away from right border (was 2.4*inch)
         
         # Concatenate info2 and info3 on the same line
         info_parts = []
-        if df.iloc[i].get('info2') and str(df.iloc[i]['info2']).strip():
-            info_parts.append(str(df.iloc[i]['info2']))
-        if df.iloc[i].get('info3') and str(df.iloc[i]['info3']).strip():
-            info_parts.append(str(df.iloc[i]['info3']))
+        if row.get('info2') and str(row['info2']).strip():
+            info_parts.append(str(row['info2']))
+        if row.get('info3') and str(row['info3']).strip():
+            info_parts.append(str(row['info3']))
         
+        # Right column text is fitted between right_x and the border
         if info_parts:
-            page.setFont('Helvetica-Bold', 12)  # Bold font for concatenated info
             combined_info = " ".join(info_parts)  # Separate with pipe symbol
-            page.drawString(right_x, center_y + 0.2*inch, combined_info)
+            draw_fitted_string(page, right_x, center_y + 0.2*inch, combined_info, 'Helvetica-Bold', 12, 0.85*inch)
         
         # Ucode display
-        if df.iloc[i].get('ucode') and str(df.iloc[i]['ucode']).strip():
-            page.setFont('Helvetica', 10)  # Increased from 8
-            ucode_text = f"Code: {str(df.iloc[i]['ucode'])}"
-            page.drawString(right_x, center_y - 0.15*inch, ucode_text)
-        
-        # Clean up temp QR image
-        if os.path.exists(qr_image):
-            os.remove(qr_image)
-        
-        page.showPage()
+        if row.get('ucode') and str(row['ucode']).strip():
+            ucode_text = f"Code: {str(row['ucode'])}"
+            draw_fitted_string(page, right_x, center_y - 0.15*inch, ucode_text, 'Helvetica', 10, 0.85*inch)
+
+
+@metrics.instrument_job('line')
+def create_line_pdf(df, pdf_file_name, symbology="qr", profile=None, copies=1):
+    """Create line-style PDF labels for narrow plastic pieces - column layout with QR (or Data Matrix) in center"""
+    page_width = 3
+    page_height = 2
     
-    page.save()
+    # Use in-memory buffer for deployment, file system for local dev
+    if os.environ.get('RENDER'):
+        from io import BytesIO
+        buffer = BytesIO()
+        page = new_canvas(buffer, profile)
+    else:
+        pdf_path = os.path.join("labels_pdf", pdf_file_name)
+        page = new_canvas(pdf_path, profile)
+    render_cache.register_fonts(page)
+    
+    page.setPageSize(size=(page_width*inch, page_height*inch))
+    
+    # Unchanged rows are spliced from the page fragment cache; copies are drawn once
+    style = ("line", symbology, qr_settings())
+    labels = prefetch_symbols(label_rows(df, copies), style, symbology, 0.7*inch, _line_symbol_text)
+    for (row, n), matrix in labels:
+        render_cache.render_page(page, style, row,
+                                 lambda page, row: _draw_line_label(page, row, symbology, matrix), n)
+    
+    with metrics.stage_timer("pdf_save", style="line"):
+        save_canvas(page, buffer if os.environ.get('RENDER') else pdf_path, profile)
     
     if os.environ.get('RENDER'):
         buffer.seek(0)
@@ -222,6 +523,62 @@ def create_line_pdf(df, pdf_file_name):
         return pdf_path  # Return file path for local development
 
 
+def label_symbology(label_options):
+    """Symbol printed for the given label options: "qr", "datamatrix" or "code128" (biomass only)"""
+    output_type = label_options.get("output_type")
+    if output_type in SYMBOLOGIES:
+        return output_type
+    return "code128" if label_options["style"] == "biomass" else "qr"
+
+
+# Output format -> file extension; "tiff" is a multi-page TIFF, "png" a ZIP of PNGs
+OUTPUT_EXTENSIONS = {"pdf": ".pdf", "zpl": ".zpl", "tiff": ".tiff", "png": ".zip"}
+
+
+def output_extension(label_options):
+    """File extension of the generated labels for the chosen output format"""
+    return OUTPUT_EXTENSIONS.get(label_options.get("output_format"), ".pdf")
+
+
+def select_generator(label_options):
+    """Map label options to (output filename prefix, generator, generator kwargs)"""
+    prefix, generator, generator_kwargs = _select_pdf_generator(label_options)
+    output_format = label_options.get("output_format")
+    kwargs = {"style": label_options["style"], "symbology": label_symbology(label_options)}
+    copies = parse_copies(label_options.get("copies"))
+    if copies > 1:
+        kwargs["copies"] = copies
+        generator_kwargs = dict(generator_kwargs, copies=copies)
+    if output_format == "zpl":
+        # Native printer commands instead of a PDF, same layout
+        import zpl
+        return prefix, zpl.create_zpl, kwargs
+    if output_format in ("tiff", "png"):
+        # Page images of the same layout
+        import raster
+        return prefix, raster.create_raster, dict(kwargs, image_format=output_format)
+    if label_options.get("pdf_profile"):
+        generator_kwargs = dict(generator_kwargs, profile=label_options["pdf_profile"])
+    return prefix, generator, generator_kwargs
+
+
+def _select_pdf_generator(label_options):
+    datamatrix_requested = label_options.get("output_type") == "datamatrix"
+    if label_options["style"] == "biomass":
+        if label_options["output_type"] == "qr":
+            return "biomass_qr_labels", create_biomass_pdf, {"use_qr": True}
+        if datamatrix_requested:
+            return "biomass_datamatrix_labels", create_biomass_pdf, {"symbology": "datamatrix"}
+        return "biomass_barcode_labels", create_biomass_pdf, {"use_qr": False}
+    elif label_options["style"] == "line":
+        if datamatrix_requested:
+            return "line_datamatrix_labels", create_line_pdf, {"symbology": "datamatrix"}
+        return "line_labels", create_line_pdf, {}
+    if datamatrix_requested:
+        return "datamatrix_labels", create_qr_pdf, {"symbology": "datamatrix"}
+    return "qr_labels", create_qr_pdf, {}
+
+
 def create_qr_dataframe(project_name, site_name, study_year, num_blocks, treatments, sampling_stage):
     """Create DataFrame for QR code labels"""
     data = {
@@ -0,0 +1,295 @@
+import qrcode
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+from qrcode.constants import ERROR_CORRECT_H, ERROR_CORRECT_L
+from qrcode.util import BIT_LIMIT_TABLE, MODE_8BIT_BYTE, length_in_bits
+from reportlab.lib.units import inch
+from reportlab.pdfbase.pdfmetrics import getFont, stringWidth
+from reportlab.graphics.barcode import code128
+
+import datamatrix
+import metrics
+import utils
+
+
+# Pre-flight checks run on the whole dataset before any label is drawn. They
+# are column-wise Arrow compute kernels; the few per-value calls (exact text
+# widths, exact QR fit) only run on values a cheap bound could not clear.
+
+# Row numbers listed per issue (1-based)
+MAX_LISTED_ROWS = 10
+
+# Byte-mode payload of the largest QR code (version 40) per error correction level
+QR_MAX_BYTES = {level: (BIT_LIMIT_TABLE[level][40] - 4 - length_in_bits(MODE_8BIT_BYTE, 40)) // 8
+                for level in (ERROR_CORRECT_H, ERROR_CORRECT_L)}
+QR_LEVEL_NAMES = {ERROR_CORRECT_H: "H", ERROR_CORRECT_L: "L"}
+
+# Characters Code128 can encode: ASCII only. ReportLab reads \xf1-\xf4
+# (ñ, ò, ó, ô) as the FNC1-4 function codes, so IDs with them would print a
+# different barcode.
+CODE128_INVALID = r'[^\x00-\x7f]'
+
+# Per style: required columns (missing ones make the generator fail), columns
+# that only print "N/A" when missing, the encoded column, and the text lines
+# as (columns, font, size, width available in points, prefix)
+TEMPLATES = {
+    "qr": {
+        "required": ["ID"],
+        "optional": ["Plot", "Site", "Year", "Sampling Stage/Depth", "Project", "Treatment"],
+        "encoded": "ID",
+        "text": [
+            (["Plot"], "Helvetica-Bold", 10, 1.8 * inch, "Plot: "),
+            (["Site"], "Helvetica", 8, 1.8 * inch, "Site: "),
+            (["Year"], "Helvetica", 8, 1.8 * inch, "Year: "),
+            (["Sampling Stage/Depth"], "Helvetica", 8, 1.8 * inch, "Sampling Stage/Depth: "),
+            (["Project"], "Helvetica", 8, 1.8 * inch, "Project: "),
+            (["Treatment"], "Helvetica", 8, 1.8 * inch, "Treatment: "),
+        ],
+    },
+    "biomass": {
+        "required": ["info1", "info2", "info3"],
+        "optional": [],
+        "encoded": "info1",
+        "text": [
+            (["info1"], "Helvetica-Bold", 14, 2.8 * inch, ""),
+            (["info2"], "Helvetica-Bold", 12, 2.8 * inch, ""),
+            (["info3"], "Helvetica", 10, 2.8 * inch, ""),
+            (["ucode"], "Helvetica-Bold", 8, 2.8 * inch, ""),
+        ],
+    },
+    "line": {
+        "required": [],
+        "optional": ["info1", "info2", "info3"],
+        "encoded": "ucode",
+        "text": [
+            (["info1"], "Helvetica-Bold", 14, 0.95 * inch, ""),
+            (["info2", "info3"], "Helvetica-Bold", 12, 0.85 * inch, ""),
+            (["ucode"], "Helvetica", 10, 0.85 * inch, "Code: "),
+        ],
+    },
+}
+
+# Room for the Code128 barcode inside the biomass label border
+BARCODE_WIDTH = 2.9 * inch
+
+
+def _issue(level, check, message, mask=None):
+    issue = {"level": level, "check": check, "message": message, "count": 0, "rows": []}
+    if mask is not None:
+        positions = mask.nonzero()[0]
+        issue["count"] = len(positions)
+        issue["rows"] = [int(p) + 1 for p in positions[:MAX_LISTED_ROWS]]
+    return issue
+
+
+def _as_text(series):
+    """Column as an Arrow string array, with missing values as empty strings"""
+    try:
+        array = pa.array(series, from_pandas=True)
+    except (pa.ArrowInvalid, pa.ArrowTypeError):
+        # Mixed types (e.g. numbers and text from JSON records)
+        array = pa.array(series.map(str, na_action='ignore'), from_pandas=True)
+    if isinstance(array, pa.ChunkedArray):
+        array = array.combine_chunks()
+    if not pa.types.is_string(array.type):
+        array = pc.cast(array, pa.string())
+    return pc.fill_null(array, "")
+
+
+def _mask(array):
+    return array.to_numpy(zero_copy_only=False)
+
+
+def _measure(values, candidates, measure):
+    """Exact measurements of the candidate values only (each distinct value once)"""
+    positions = candidates.nonzero()[0]
+    widths = np.zeros(len(values))
+    if len(positions):
+        subset = values.take(pa.array(positions)).to_pylist()
+        cache = {value: measure(value) for value in set(subset)}
+        widths[positions] = [cache[value] for value in subset]
+    return widths
+
+
+def _overflow(values, font, size, available):
+    """Mask of values wider than `available` points in the given font"""
+    # Standard fonts have no kerning, so the width of ASCII text is the sum of
+    # its glyph widths: look every byte up at once and sum per value between
+    # the Arrow offsets. Non-ASCII values are measured one by one.
+    glyphs = np.array(getFont(font).widths, dtype=np.int64)
+    glyphs[128:] = 0
+    buffers = values.buffers()
+    offsets = np.frombuffer(buffers[1], dtype=np.int32)[values.offset:values.offset + len(values) + 1]
+    data = np.frombuffer(buffers[2], dtype=np.uint8) if buffers[2] is not None else np.zeros(0, np.uint8)
+    totals = np.concatenate(([0], np.cumsum(glyphs[data])))
+    widths = (totals[offsets[1:]] - totals[offsets[:-1]]) * size / 1000
+    non_ascii = _mask(pc.binary_length(values)) != _mask(pc.utf8_length(values))
+    if non_ascii.any():
+        widths[non_ascii] = _measure(values, non_ascii, lambda value: stringWidth(value, font, size))[non_ascii]
+    return widths > available
+
+
+def _qr_error_correction():
+    """Lowest error correction the encoding policy may fall back to"""
+    return ERROR_CORRECT_L if utils.QR_POLICY == 'adaptive' else ERROR_CORRECT_H
+
+
+def _qr_fits(value):
+    qr = qrcode.QRCode(error_correction=_qr_error_correction())
+    qr.add_data(value)
+    try:
+        qr.make(fit=True)
+    except (qrcode.exceptions.DataOverflowError, ValueError):
+        return 0
+    return 1
+
+
+def _qr_overflow(values):
+    """Mask of values too long for any QR version at the policy's lowest error correction"""
+    # Byte mode is the least compact mode, so anything within its capacity fits;
+    # longer values may still fit in numeric/alphanumeric mode and are checked exactly
+    candidates = _mask(pc.binary_length(values)) > QR_MAX_BYTES[_qr_error_correction()]
+    return candidates & (_measure(values, candidates, _qr_fits) == 0)
+
+
+def _datamatrix_overflow(values):
+    """Mask of values too long for the largest Data Matrix symbol"""
+    # ASCII needs at most one codeword per byte; other bytes take an upper
+    # shift each, so only values a bound cannot clear are encoded exactly
+    lengths = _mask(pc.binary_length(values))
+    ascii_only = lengths == _mask(pc.utf8_length(values))
+    candidates = np.where(ascii_only, lengths, 2 * lengths) > datamatrix.MAX_DATA_CODEWORDS
+    return _measure(values, candidates, datamatrix.codeword_count) > datamatrix.MAX_DATA_CODEWORDS
+
+
+def _barcode_overflow(values):
+    """Mask of values whose Code128 barcode is wider than the label"""
+    # 11 modules per character plus start, check and stop symbols and quiet zones
+    bound = (_mask(pc.utf8_length(values)) * 11 + 66) * 0.7
+    candidates = bound > BARCODE_WIDTH
+    return _measure(values, candidates,
+                    lambda value: code128.Code128(value, barHeight=0.4 * inch, barWidth=0.7).width) > BARCODE_WIDTH
+
+
+def _duplicated(values):
+    """Mask of values that occur more than once"""
+    indices = _mask(values.dictionary_encode().indices)
+    return np.bincount(indices)[indices] > 1
+
+
+def preflight(df, label_options):
+    """Check a dataset against its label template before rendering.
+
+    Returns a list of issues, each a dict with `level` ("error" blocks
+    rendering, "warning" does not), `check`, `message`, `count` and the first
+    few 1-based `rows` affected.
+    """
+    with metrics.stage_timer("preflight", style=label_options["style"]):
+        return _preflight(df.reset_index(drop=True), label_options)
+
+
+def _preflight(df, label_options):
+    style = label_options["style"]
+    template = TEMPLATES.get(style, TEMPLATES["qr"])
+    issues = []
+
+    if df.empty:
+        return [_issue("error", "empty", "The dataset has no rows")]
+
+    missing = [c for c in template["required"] if c not in df.columns]
+    if missing:
+        issues.append(_issue("error", "required_columns",
+                             f"Missing required column(s): {', '.join(missing)}"))
+    optional = [c for c in template["optional"] if c not in df.columns]
+    if optional:
+        issues.append(_issue("warning", "optional_columns",
+                             f"Missing column(s) {', '.join(optional)}; labels will show a placeholder"))
+
+    if utils.COPIES_COLUMN in df.columns:
+        # Blank copies use the Copies option; other values must be whole numbers in range
+        text_copies = df[utils.COPIES_COLUMN].astype(str).str.strip()
+        copies = pd.to_numeric(text_copies, errors="coerce")
+        blank = df[utils.COPIES_COLUMN].isna().to_numpy() | (text_copies == "").to_numpy()
+        invalid = ~blank & ~(copies.between(1, utils.MAX_COPIES) & (copies % 1 == 0)).to_numpy()
+        if invalid.any():
+            issues.append(_issue("warning", "copies",
+                                 f"{utils.COPIES_COLUMN} values that are not whole numbers from 1 to "
+                                 f"{utils.MAX_COPIES}; they will be clamped or use the Copies option", invalid))
+
+    # Line labels encode ucode when the column exists, info1 otherwise
+    encoded = template["encoded"]
+    if encoded not in df.columns and style == "line":
+        encoded = "info1"
+    if encoded not in df.columns:
+        if style == "line":
+            issues.append(_issue("error", "required_columns", "Missing column: ucode or info1"))
+        return issues
+
+    converted = {}
+
+    def text(column):
+        if column not in converted:
+            converted[column] = _as_text(df[column])
+        return converted[column]
+
+    codes = text(encoded)
+    blank = pc.equal(pc.utf8_trim_whitespace(codes), "")
+    if encoded == "ucode" and "info1" in df.columns:
+        # Rows with a blank ucode encode info1 (short_ids.encoded_values)
+        codes = pc.if_else(blank, text("info1"), codes)
+        encoded = "ucode (or info1)"
+        blank = pc.equal(pc.utf8_trim_whitespace(codes), "")
+    empty = _mask(blank)
+    if empty.any():
+        issues.append(_issue("error", "empty_ids", f"Empty {encoded} values", empty))
+    duplicated = _duplicated(codes) & ~empty
+    if duplicated.any():
+        issues.append(_issue("warning", "duplicate_ids",
+                             f"Duplicate {encoded} values; these labels scan the same", duplicated))
+
+    if label_options.get("short_ids"):
+        # Symbols carry registry short codes, which always fit
+        pass
+    elif label_options.get("output_type") == "datamatrix":
+        too_long = _datamatrix_overflow(codes)
+        if too_long.any():
+            issues.append(_issue("error", "datamatrix_capacity",
+                                 f"{encoded} values too long for a Data Matrix symbol "
+                                 f"(max {datamatrix.MAX_DATA_CODEWORDS} codewords)", too_long))
+    elif style == "biomass" and label_options.get("output_type") != "qr":
+        invalid = _mask(pc.match_substring_regex(codes, CODE128_INVALID))
+        if invalid.any():
+            issues.append(_issue("error", "code128_charset",
+                                 f"{encoded} values with characters Code128 cannot encode", invalid))
+        too_wide = _barcode_overflow(codes) & ~invalid
+        if too_wide.any():
+            issues.append(_issue("warning", "barcode_width",
+                                 f"{encoded} values whose barcode is wider than the label", too_wide))
+    else:
+        too_long = _qr_overflow(codes)
+        if too_long.any():
+            level = _qr_error_correction()
+            issues.append(_issue("error", "qr_capacity",
+                                 f"{encoded} values too long for a QR code at error correction "
+                                 f"{QR_LEVEL_NAMES[level]} (max {QR_MAX_BYTES[level]} bytes)", too_long))
+
+    for columns, font, size, available, prefix in template["text"]:
+        present = [c for c in columns if c in df.columns]
+        if not present:
+            continue
+        values = text(present[0])
+        for column in present[1:]:
+            values = pc.utf8_trim_whitespace(pc.binary_join_element_wise(values, text(column), " "))
+        available -= stringWidth(prefix, font, size)
+        too_wide = _overflow(values, font, size, available)
+        if too_wide.any():
+            issues.append(_issue("warning", "text_overflow",
+                                 f"{' + '.join(present)} text wider than the label"
+                                 + ("; it will be shrunk to fit" if utils.TEXT_AUTOFIT else ""), too_wide))
+    return issues
+
+
+def has_errors(issues):
+    return any(issue["level"] == "error" for issue in issues)
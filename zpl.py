@@ -0,0 +1,226 @@
+import os
+import io
+import socket
+
+import pandas as pd
+import qrcode
+from reportlab.graphics.barcode import code128
+
+import datamatrix
+import metrics
+import utils
+
+
+# ZPL output for Zebra thermal printers. The label layouts mirror the PDF
+# generators in utils.py, but symbols are sent as native ^BQ (QR), ^BX
+# (Data Matrix) and ^BC (Code128) commands, so the printer encodes them and
+# no PDF is produced or rasterised. Coordinates are in printer dots.
+DPI = int(os.environ.get('LABELS_ZPL_DPI', '203'))
+# Raw printer for "Send to printer", as host or host:port (port 9100 by default)
+PRINTER = os.environ.get('LABELS_ZPL_PRINTER', '')
+PRINTER_PORT = 9100
+# Labels per socket write when streaming to a printer
+SEND_BATCH = 500
+
+EC_LETTERS = {qrcode.constants.ERROR_CORRECT_H: "H", qrcode.constants.ERROR_CORRECT_Q: "Q",
+              qrcode.constants.ERROR_CORRECT_M: "M", qrcode.constants.ERROR_CORRECT_L: "L"}
+
+# Page sizes in inches (width, height), as in the PDF generators
+PAGE_SIZES = {"qr": (2, 3), "biomass": (3, 2), "line": (3, 2)}
+
+
+def _dots(inches):
+    return int(round(inches * DPI))
+
+
+def _font_dots(points):
+    return max(int(round(points * DPI / 72)), 10)
+
+
+def _field(text):
+    """Field data, hex-escaping the characters ZPL treats as commands"""
+    text = str(text)
+    if "^" in text or "~" in text or "_" in text:
+        escaped = text.replace("_", "_5F").replace("^", "_5E").replace("~", "_7E")
+        return f"^FH^FD{escaped}^FS"
+    return f"^FD{text}^FS"
+
+
+def _text(x, baseline, page_height, size, text, bold=False, centred_width=None, max_width=None):
+    """Text with its baseline at `baseline` inches from the bottom, like canvas.drawString"""
+    if max_width is not None:
+        # Fitted with the PDF's Helvetica metrics, which font 0 roughly follows
+        text, size = utils.fit_text(text, "Helvetica-Bold" if bold else "Helvetica", size, max_width * 72)
+    height = _font_dots(size)
+    # ^FO places the top of the text; Helvetica caps reach about 0.72 of the size
+    top = _dots(page_height) - _dots(baseline) - int(round(height * 0.72))
+    # Scalable font 0 has no regular weight; bold text is slightly wider
+    width = height if bold else int(round(height * 0.9))
+    if centred_width is not None:
+        return f"^FO{_dots(x)},{top}^A0N,{height},{width}^FB{_dots(centred_width)},1,0,C,0{_field(text)}"
+    return f"^FO{_dots(x)},{top}^A0N,{height},{width}{_field(text)}"
+
+
+def _box(x, y, width, height, page_height):
+    """Outline rectangle from its bottom-left corner, like canvas.rect"""
+    return f"^FO{_dots(x)},{_dots(page_height) - _dots(y + height)}^GB{_dots(width)},{_dots(height)},2^FS"
+
+
+def _qr(text, x, top, size):
+    # Same payload as the PDF and image symbols (upper-cased in alphanumeric mode)
+    payload = utils._qr_payload(text)
+    if isinstance(payload, qrcode.util.QRData):
+        text = payload.data.decode("ascii")
+    if utils.QR_POLICY == 'adaptive':
+        version, error_correction = utils.choose_qr_encoding(text, size * 72)
+    else:
+        error_correction = qrcode.constants.ERROR_CORRECT_H
+        qr = qrcode.QRCode(error_correction=error_correction)
+        qr.add_data(payload)
+        version = qr.best_fit()
+    modules = version * 4 + 17
+    magnification = min(max(_dots(size) // (modules + 2), 1), 10)
+    offset = (_dots(size) - magnification * modules) // 2
+    # ^FD<error correction><input mode>, with automatic mode selection
+    return (f"^FO{_dots(x) + offset},{_dots(top) + offset}^BQN,2,{magnification}"
+            + _field(f"{EC_LETTERS[error_correction]}A,{text}"))
+
+
+def _datamatrix(text, x, top, size):
+    modules = datamatrix.symbol_modules(text)
+    height = max(_dots(size) // (modules + 2), 1)
+    offset = (_dots(size) - height * modules) // 2
+    return f"^FO{_dots(x) + offset},{_dots(top) + offset}^BXN,{height},200" + _field(text)
+
+
+def _symbol(symbology, text, x, top, size):
+    if symbology == "datamatrix":
+        return _datamatrix(text, x, top, size)
+    return _qr(text, x, top, size)
+
+
+def _code128(text, centre_x, top, height):
+    # Same module width as the PDF barcode (0.7 pt); mode A lets the printer
+    # pick code subsets like ReportLab does, so the width matches
+    module = max(int(round(0.7 * DPI / 72)), 1)
+    width = code128.Code128(text, barWidth=0.7, lquiet=0, rquiet=0).width / 0.7 * module
+    x = _dots(centre_x) - int(width) // 2
+    return f"^BY{module}^FO{x},{_dots(top)}^BCN,{_dots(height)},N,N,N,A" + _field(text)
+
+
+def qr_label(row, symbology="qr"):
+    """One QR-style label (Luiz Felipe Almeida Style)"""
+    page_height = PAGE_SIZES["qr"][1]
+    commands = [_symbol(symbology, str(row.get("short_code") or row.get("ID", "NO_ID")), 0.5, 0.25, 1)]
+    for position, attr in enumerate(["Plot", "Site", "Year", "Sampling Stage/Depth", "Project", "Treatment"]):
+        size = 10 if attr == "Plot" else 8
+        baseline = page_height - 1.55 - position * 15 / 72
+        commands.append(_text(0.1, baseline, page_height, size, f"{attr}: {row.get(attr, 'N/A')}",
+                              bold=attr == "Plot", max_width=1.8))
+    return commands
+
+
+def biomass_label(row, symbology="code128"):
+    """One biomass label (Luiz Rosso Style)"""
+    page_width, page_height = PAGE_SIZES["biomass"]
+    symbol_text = str(row.get('short_code') or row['info1'])
+    commands = [
+        _box(0.05, 0.025, 2.9, 1.9, page_height),
+        _text(0, 1.6, page_height, 14, row['info1'], bold=True, centred_width=page_width, max_width=2.8),
+        _text(0, 1.2, page_height, 12, row['info2'], bold=True, centred_width=page_width, max_width=2.8),
+        _text(0, 0.9, page_height, 10, row['info3'], centred_width=page_width, max_width=2.8),
+    ]
+    if symbology in utils.SYMBOLOGIES:
+        commands.append(_symbol(symbology, symbol_text, (page_width - 0.6) / 2, page_height - 0.8, 0.6))
+    else:
+        commands.append(_code128(symbol_text, page_width / 2, page_height - 0.7, 0.4))
+    if pd.notna(row.get('ucode')):
+        commands.append(_text(0, 0.08, page_height, 8, row['ucode'], bold=True, centred_width=page_width,
+                              max_width=2.8))
+    return commands
+
+
+def line_label(row, symbology="qr"):
+    """One line-style label for narrow plastic pieces"""
+    page_height = PAGE_SIZES["line"][1]
+    symbol_text = utils._line_symbol_text(row)
+    commands = [
+        _box(0.05, 0.05, 2.9, 1.9, page_height),
+        _symbol(symbology, symbol_text, 1.15, page_height - 1.35, 0.7),
+        _text(0.15, 1.2, page_height, 10, "Plot"),
+        _text(0.15, 0.85, page_height, 14, row.get('info1', 'ID'), bold=True, max_width=0.95),
+    ]
+    info_parts = [str(row[key]) for key in ('info2', 'info3') if row.get(key) and str(row[key]).strip()]
+    if info_parts:
+        commands.append(_text(2.1, 1.2, page_height, 12, " ".join(info_parts), bold=True, max_width=0.85))
+    if row.get('ucode') and str(row['ucode']).strip():
+        commands.append(_text(2.1, 0.85, page_height, 10, f"Code: {row['ucode']}", max_width=0.85))
+    return commands
+
+
+LABELS = {"qr": qr_label, "biomass": biomass_label, "line": line_label}
+
+
+def iter_labels(df, style="qr", symbology="qr", copies=1):
+    """Yield one ZPL label format (^XA ... ^XZ) per row"""
+    width, height = PAGE_SIZES[style]
+    # UTF-8 field data, label size and origin are set on every label so any
+    # subset of the stream prints the same
+    header = f"^XA^CI28^PW{_dots(width)}^LL{_dots(height)}^LH0,0"
+    build = LABELS[style]
+    for row, n in utils.label_rows(df, copies):
+        # Copies are printed by the printer (^PQ), so each label is sent once
+        quantity = f"^PQ{n}" if n > 1 else ""
+        yield header + "".join(build(row, symbology)) + quantity + "^XZ\n"
+
+
+@metrics.instrument_job('zpl')
+def create_zpl(df, zpl_file_name, style="qr", symbology="qr", copies=1):
+    """Create a ZPL file for Zebra printers with the same layouts as the PDF labels"""
+    # Use in-memory buffer for deployment, file system for local dev
+    if os.environ.get('RENDER'):
+        buffer = io.BytesIO()
+        with metrics.stage_timer("zpl_write", style=style, symbology=symbology):
+            for label in iter_labels(df, style, symbology, copies):
+                buffer.write(label.encode('utf-8'))
+        buffer.seek(0)
+        return buffer  # Return buffer for in-memory serving
+
+    zpl_path = os.path.join("labels_pdf", zpl_file_name)
+    with metrics.stage_timer("zpl_write", style=style, symbology=symbology):
+        with open(zpl_path, "w", encoding="utf-8", newline="\n") as f:
+            f.writelines(iter_labels(df, style, symbology, copies))
+    return zpl_path  # Return file path for local development
+
+
+def _address(printer):
+    printer = printer or PRINTER
+    if not printer:
+        raise ValueError("No ZPL printer configured (set LABELS_ZPL_PRINTER)")
+    host, _, port = printer.partition(":")
+    return host, int(port) if port else PRINTER_PORT
+
+
+def send(df, style="qr", symbology="qr", printer=None, timeout=30, copies=1):
+    """Stream labels to a raw-socket printer (host:port, default LABELS_ZPL_PRINTER).
+
+    Labels are written in batches as they are formatted, so memory stays flat
+    for large jobs. Returns the number of bytes sent.
+    """
+    address = _address(printer)
+    sent = 0
+    batch = []
+    with socket.create_connection(address, timeout=timeout) as conn:
+        with metrics.stage_timer("zpl_send", style=style, symbology=symbology):
+            for label in iter_labels(df, style, symbology, copies):
+                batch.append(label)
+                if len(batch) >= SEND_BATCH:
+                    data = "".join(batch).encode('utf-8')
+                    conn.sendall(data)
+                    sent += len(data)
+                    batch = []
+            if batch:
+                data = "".join(batch).encode('utf-8')
+                conn.sendall(data)
+                sent += len(data)
+    return sent